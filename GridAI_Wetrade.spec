@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=['numpy', 'numpy._core.multiarray'],
+    hiddenimports=['numpy', 'numpy._core.multiarray', 'MetaTrader5'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['MetaTrader5'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,17 +1,154 @@
 # atr_calculator.py
 # คำนวณ ATR (Average True Range) สำหรับ XAUUSD
 
-import MetaTrader5 as mt5
-from typing import Optional, Dict
+from broker_backend import broker as mt5
+from typing import Optional, Dict, Tuple
+from collections import deque
 import logging
-from datetime import datetime, timedelta
+import threading
 from config import config
+from clock import clock
+from rate_cache import rate_cache
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)  # ATR Calculator ใช้ WARNING เพื่อลด log
 
 
+ATR_METHODS = ('sma', 'wilder', 'ema')
+
+
+class ATRState:
+    """
+    สถานะ ATR ของหนึ่ง (symbol, timeframe, period, method) อัพเดท O(1) ต่อแท่งที่ปิด
+    - sma: ค่าเฉลี่ย True Range ล่าสุด period แท่ง (running sum)
+    - wilder: ATR = (ATR เดิม × (period - 1) + TR) / period
+    - ema: ATR += 2 / (period + 1) × (TR - ATR)
+    wilder/ema เริ่มต้น (seed) ด้วย SMA ของ period แท่งแรก
+    """
+    
+    def __init__(self, period: int, method: str):
+        if method not in ATR_METHODS:
+            raise ValueError(f"Unknown ATR method: {method}")
+        self.period = period
+        self.method = method
+        self.last_time = None
+        self.prev_close = None
+        self.value = None  # ATR (หน่วยราคา) ของแท่งที่ปิดแล้ว
+        self.count = 0  # จำนวน TR ที่ใช้ไปแล้ว
+        self.window = deque(maxlen=period)
+        self.window_sum = 0.0
+    
+    def _true_range(self, high: float, low: float) -> float:
+        return max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+    
+    def _next_value(self, tr: float) -> Optional[float]:
+        """ค่า ATR ถ้าเพิ่ม TR นี้เข้าไป (ไม่เปลี่ยน state)"""
+        count = self.count + 1
+        if count < self.period:
+            return None
+        if self.method == 'sma' or count == self.period:
+            dropped = self.window[0] if len(self.window) == self.period else 0.0
+            return (self.window_sum - dropped + tr) / self.period
+        if self.method == 'wilder':
+            return (self.value * (self.period - 1) + tr) / self.period
+        return self.value + 2.0 / (self.period + 1) * (tr - self.value)
+    
+    def update(self, time: int, high: float, low: float, close: float):
+        """เพิ่มแท่งที่ปิดแล้ว 1 แท่ง"""
+        if self.prev_close is not None:
+            tr = self._true_range(high, low)
+            self.value = self._next_value(tr)
+            if len(self.window) == self.period:
+                self.window_sum -= self.window[0]
+            self.window.append(tr)
+            self.window_sum += tr
+            self.count += 1
+        self.prev_close = close
+        self.last_time = time
+    
+    def peek(self, high: float, low: float) -> Optional[float]:
+        """ค่า ATR ถ้ารวมแท่งที่กำลังวิ่ง (ไม่เปลี่ยน state)"""
+        if self.prev_close is None:
+            return None
+        return self._next_value(self._true_range(high, low))
+
+
+class ATREngine:
+    """
+    ATR แบบ incremental ใช้ร่วมกันทุก module: อ่านแท่งเทียนจาก rate_cache
+    แล้วอัพเดทเฉพาะแท่งที่ปิดใหม่ตั้งแต่ครั้งก่อน (ไม่คำนวณย้อนหลังทั้งชุดทุกครั้ง)
+    รองรับทุก (timeframe, period, method)
+    """
+    
+    def __init__(self, warmup_factor: int = 10):
+        self.warmup_factor = warmup_factor  # wilder/ema ใช้ period × warmup_factor แท่งในการ seed
+        self.states: Dict[Tuple[str, int, int, str], ATRState] = {}
+        # Engine worker (analytics) กับ trading thread (Grid / HG zones) เรียกพร้อมกันได้
+        # → lock กันไม่ให้แท่งเดียวกันถูกรวมเข้า state ซ้ำ
+        self._lock = threading.RLock()
+    
+    def _warmup_bars(self, period: int, method: str) -> int:
+        if method == 'sma':
+            return period + 1
+        return period * self.warmup_factor + 1
+    
+    def get_atr(self, timeframe: int = mt5.TIMEFRAME_M15, period: int = 14, method: str = 'sma',
+                include_forming: bool = True, symbol: Optional[str] = None) -> Optional[float]:
+        """
+        ดึงค่า ATR
+        
+        Args:
+            timeframe: timeframe ของแท่งเทียน
+            period: ATR period
+            method: 'sma', 'wilder' หรือ 'ema'
+            include_forming: True = รวม True Range ของแท่งที่กำลังวิ่ง (แบบเดิมของ ATRCalculator)
+            symbol: symbol (None = config.mt5.symbol)
+        
+        Returns:
+            ATR ในหน่วย pips หรือ None ถ้าข้อมูลไม่พอ
+        """
+        with self._lock:
+            return self._get_atr(timeframe, period, method, include_forming, symbol or config.mt5.symbol)
+    
+    def _get_atr(self, timeframe: int, period: int, method: str, include_forming: bool,
+                 symbol: str) -> Optional[float]:
+        key = (symbol, timeframe, period, method)
+        state = self.states.get(key)
+        if state is None:
+            state = ATRState(period, method)
+            self.states[key] = state
+        
+        # แท่งที่ปิดแล้ว (view จาก rate_cache ไม่ copy)
+        closed = rate_cache.get_rates(symbol, timeframe, self._warmup_bars(period, method), start_pos=1)
+        if closed is None:
+            return None
+        times = closed['time']
+        if state.last_time is None or state.last_time < times[0] or state.last_time > times[-1]:
+            # เริ่มใหม่ หรือขาดช่วงนานเกิน warm-up → seed ใหม่จากข้อมูลที่มี
+            state = ATRState(period, method)
+            self.states[key] = state
+            start = 0
+        else:
+            start = int(times.searchsorted(state.last_time, side='right'))
+        for bar in closed[start:]:
+            state.update(int(bar['time']), float(bar['high']), float(bar['low']), float(bar['close']))
+        
+        atr_price = state.value
+        if include_forming:
+            forming = rate_cache.get_rates(symbol, timeframe, 1)
+            if forming is not None and forming[0]['time'] > state.last_time:
+                atr_price = state.peek(float(forming[0]['high']), float(forming[0]['low']))
+        if atr_price is None:
+            return None
+        return config.price_to_pips(atr_price)
+    
+    def reset(self):
+        """ล้างสถานะทั้งหมด"""
+        with self._lock:
+            self.states.clear()
+
+
 class ATRCalculator:
     """คลาสสำหรับคำนวณ ATR (Average True Range)"""
     
@@ -21,15 +158,21 @@ class ATRCalculator:
         self.cache_duration = 60  # วินาที
         self.atr_period = 14
         self.timeframe = mt5.TIMEFRAME_M15
+        self.method = 'sma'  # sma (ค่าเดิม), wilder, ema
+        self._lock = threading.RLock()  # cache ถูกอ่าน/เขียนจากทั้ง trading thread และ Engine worker
     
     def calculate_atr(self) -> Optional[float]:
         """
         คำนวณ ATR (Average True Range) period 14, Timeframe M15
-        มี cache 60 วินาที
+        มี cache 60 วินาที (ค่าคำนวณจาก atr_engine)
         
         Returns:
             ATR ในหน่วย pips หรือ None ถ้าเกิดข้อผิดพลาด
         """
+        with self._lock:
+            return self._calculate_atr()
+    
+    def _calculate_atr(self) -> Optional[float]:
         try:
             # เช็ค cache
             if self._is_cache_valid():
@@ -42,47 +185,17 @@ class ATRCalculator:
                 logger.error("MT5 not connected")
                 return None
             
-            # ดึงข้อมูลแท่งเทียน (ต้องการข้อมูลอย่างน้อย atr_period + 1 แท่ง)
-            symbol = config.mt5.symbol
-            bars_needed = self.atr_period + 1
-            
-            rates = mt5.copy_rates_from_pos(symbol, self.timeframe, 0, bars_needed)
-            
-            if rates is None or len(rates) < bars_needed:
-                logger.error(f"Cannot get rates data for {symbol}")
-                return None
-            
-            # คำนวณ True Range สำหรับแต่ละแท่ง
-            true_ranges = []
-            
-            for i in range(1, len(rates)):
-                high = rates[i]['high']
-                low = rates[i]['low']
-                prev_close = rates[i-1]['close']
-                
-                # True Range = max(high-low, |high-prev_close|, |low-prev_close|)
-                tr = max(
-                    high - low,
-                    abs(high - prev_close),
-                    abs(low - prev_close)
-                )
-                true_ranges.append(tr)
-            
-            # คำนวณ ATR (Average ของ True Range ล่าสุด atr_period แท่ง)
-            if len(true_ranges) < self.atr_period:
-                logger.error(f"Not enough data to calculate ATR (need {self.atr_period}, got {len(true_ranges)})")
+            # ATR จาก engine กลาง (อัพเดทเฉพาะแท่งใหม่, ไม่เรียก MT5 ซ้ำ)
+            atr_pips = atr_engine.get_atr(self.timeframe, self.atr_period, self.method)
+            if atr_pips is None:
+                logger.error(f"Not enough data to calculate ATR (period {self.atr_period})")
                 return None
             
-            atr_price = sum(true_ranges[-self.atr_period:]) / self.atr_period
-            
-            # แปลงเป็น pips (XAUUSD: 0.1 = 1 pip)
-            atr_pips = config.price_to_pips(atr_price)
-            
             # บันทึกลง cache
             self.cached_atr = atr_pips
-            self.cache_timestamp = datetime.now()
+            self.cache_timestamp = clock.now()
             
-            logger.info(f"ATR calculated: {atr_pips:.1f} pips (period {self.atr_period}, TF M15)")
+            logger.info(f"ATR calculated: {atr_pips:.1f} pips (period {self.atr_period}, TF M15, {self.method})")
             
             return atr_pips
             
@@ -125,9 +238,10 @@ class ATRCalculator:
         return {
             'atr': atr if atr is not None else 0.0,
             'volatility_level': volatility,
-            'timestamp': datetime.now(),
+            'timestamp': clock.now(),
             'period': self.atr_period,
             'timeframe': 'M15',
+            'method': self.method,
             'cache_valid': self._is_cache_valid()
         }
     
@@ -141,16 +255,18 @@ class ATRCalculator:
         if self.cached_atr is None or self.cache_timestamp is None:
             return False
         
-        time_elapsed = (datetime.now() - self.cache_timestamp).total_seconds()
+        time_elapsed = (clock.now() - self.cache_timestamp).total_seconds()
         return time_elapsed < self.cache_duration
     
     def clear_cache(self):
         """ล้าง cache เพื่อบังคับให้คำนวณใหม่"""
-        self.cached_atr = None
-        self.cache_timestamp = None
+        with self._lock:
+            self.cached_atr = None
+            self.cache_timestamp = None
         logger.info("ATR cache cleared")
 
 
 # สร้าง instance หลักสำหรับใช้งาน
+atr_engine = ATREngine()
 atr_calculator = ATRCalculator()
 
@@ -3,9 +3,9 @@
 
 from typing import Dict
 import logging
-from datetime import datetime
 from math import floor
 from config import config
+from clock import clock
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -154,7 +154,7 @@ class AutoConfigManager:
                 # ข้อมูลเพิ่มเติม
                 "atr": atr,
                 "risk_profile": risk_profile,
-                "timestamp": datetime.now()
+                "timestamp": clock.now()
             }
             
             logger.info(f"Auto settings calculated:")
@@ -181,19 +181,21 @@ class AutoConfigManager:
                 "sell_hg_sl_trigger": 100,
                 "atr": 0.0,
                 "risk_profile": risk_profile,
-                "timestamp": datetime.now()
+                "timestamp": clock.now()
             }
 
     def _calculate_resilience_settings(self) -> Dict:
         """
         คำนวณ Auto Settings ตามแนวคิด Resilience (ตั้งจาก balance + ระยะที่ทนได้)
         """
-        from mt5_connection import mt5_connection
+        from cycle_snapshot import snapshot_provider
         from candle_volume_detector import candle_volume_detector
         from atr_calculator import atr_calculator  # ใช้เพื่อเก็บ reference ATR
         
-        account_info = mt5_connection.get_account_info()
-        price_info = mt5_connection.get_current_price()
+        # ใช้ account/ราคา จาก snapshot ของรอบนี้ (ไม่ดึงจาก MT5 ซ้ำทุกรอบ)
+        snapshot = snapshot_provider.get()
+        account_info = snapshot.account if snapshot else None
+        price_info = snapshot.price_info if snapshot else None
         
         if not account_info or not price_info:
             raise ValueError("Account or price data unavailable (MT5 not connected?)")
@@ -282,7 +284,7 @@ class AutoConfigManager:
             "sell_hg_sl_trigger": int(hg_sl_trigger),
             "atr": atr_value,
             "risk_profile": config.grid.risk_profile,
-            "timestamp": datetime.now(),
+            "timestamp": clock.now(),
             "plan": {
                 "requested_distance": int(distance_pips),
                 "actual_distance": int(actual_distance),
@@ -351,17 +353,17 @@ class AutoConfigManager:
             max_margin_percent = 0.8  # ใช้ Margin สูงสุด 80%
             safe_margin_level = 1.5  # Margin Level ขั้นต่ำ 150%
             
-            # Variables for simulation
+            # Worst case: ทุกไม้ Grid ใช้ lot เท่ากัน และคิดขาดทุน/กำไรทุกไม้ที่ระยะ current_distance
+            # → drawdown = current_distance × pip value × (grid lots − HG lots)
+            # เก็บเฉพาะผลรวมสะสม (ไม่ต้องวนรวม positions ทุกรอบ) ทำให้แต่ละ level เป็น O(1)
             total_margin = 0.0
             total_drawdown = 0.0
-            grid_positions = []
-            hg_positions = []
+            grid_count = 0
+            hg_lots = 0.0
             current_distance = 0
             hg_count = 0
-            
-            # Grid distance ใน price
-            grid_distance_price = config.pips_to_price(grid_distance)
-            hg_distance_price = config.pips_to_price(hg_distance)
+            equity = balance
+            margin_level = 999
             
             # Simulation Loop (Worst Case: ราคาลงเรื่อยๆ)
             max_iterations = 10000  # ป้องกัน infinite loop
@@ -372,41 +374,20 @@ class AutoConfigManager:
                 current_distance += grid_distance
                 
                 # เพิ่ม Grid Position
-                grid_positions.append({
-                    "distance_pips": current_distance,
-                    "lot": grid_lot,
-                    "type": "buy"
-                })
+                grid_count += 1
                 total_margin += margin_per_grid_lot
                 
                 # เช็คว่าต้องออก HG หรือไม่
                 if current_distance % hg_distance == 0 and hg_count < config.hg.buy_max_hg_levels:
                     # คำนวณ HG Lot (ใช้ total grid exposure * multiplier)
-                    grid_exposure = sum(p["lot"] for p in grid_positions)
+                    grid_exposure = grid_count * grid_lot
                     hg_lot = max(grid_exposure * hg_multiplier, hg_initial_lot)
-                    
-                    hg_positions.append({
-                        "distance_pips": current_distance,
-                        "lot": hg_lot,
-                        "type": "sell"  # HG ตรงข้ามกับ Grid
-                    })
+                    hg_lots += hg_lot  # HG ตรงข้ามกับ Grid
                     total_margin += margin_per_lot * hg_lot
                     hg_count += 1
                 
-                # คำนวณ Drawdown (Worst Case: ราคาลงเรื่อยๆ)
-                total_drawdown = 0.0
-                
-                # Drawdown จาก Grid positions (Buy positions ขาดทุนเมื่อราคาลง)
-                for pos in grid_positions:
-                    pips_loss = current_distance  # ราคาลงจากจุดเปิด
-                    drawdown = pips_loss * (pos["lot"] * pip_value_per_lot)
-                    total_drawdown += drawdown
-                
-                # Drawdown จาก HG positions (Sell positions กำไรเมื่อราคาลง - ลด drawdown)
-                for pos in hg_positions:
-                    pips_gain = current_distance  # Sell กำไรเมื่อราคาลง
-                    profit = pips_gain * (pos["lot"] * pip_value_per_lot)
-                    total_drawdown -= profit  # ลด drawdown
+                # Drawdown: Grid (Buy) ขาดทุนเมื่อราคาลง, HG (Sell) กำไรเมื่อราคาลง
+                total_drawdown = current_distance * pip_value_per_lot * (grid_count * grid_lot - hg_lots)
                 
                 # คำนวณ Equity และ Margin Level
                 equity = balance - total_drawdown
@@ -433,8 +414,8 @@ class AutoConfigManager:
             # ผลลัพธ์
             result = {
                 "max_distance_pips": current_distance - grid_distance,  # ลบ grid_distance สุดท้าย
-                "max_grid_levels": len(grid_positions) - 1,
-                "max_hg_levels": len(hg_positions),
+                "max_grid_levels": grid_count - 1,
+                "max_hg_levels": hg_count,
                 "max_margin": total_margin,
                 "max_drawdown": total_drawdown,
                 "final_margin_level": margin_level,
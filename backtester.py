@@ -0,0 +1,395 @@
+# backtester.py
+# Backtest แบบ replay tick ผ่าน GridManager / HGManager ตัวจริง บน SimulatedBroker + นาฬิกาจำลอง
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+import argparse
+import copy
+import csv
+import logging
+import time
+import numpy as np
+from broker_backend import broker
+from simulated_broker import SimulatedBroker, RATES_DTYPE
+from clock import clock
+from config import config
+from mt5_connection import mt5_connection
+from position_monitor import position_monitor
+from cycle_snapshot import snapshot_provider
+from order_queue import order_queue
+from grid_manager import grid_manager
+from hg_manager import HGManager
+from atr_calculator import atr_calculator, atr_engine
+from candle_volume_detector import candle_volume_detector
+from rate_cache import rate_cache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# dtype ของ equity curve
+EQUITY_DTYPE = np.dtype([
+    ('time', '<i8'), ('balance', '<f8'), ('equity', '<f8'), ('margin', '<f8'), ('margin_level', '<f8')
+])
+
+# โมดูลที่ log ถี่ระหว่าง backtest (ปิดเป็น WARNING ตอน quiet=True)
+NOISY_LOGGERS = [
+    'grid_manager', 'hg_manager', 'mt5_connection', 'position_monitor', 'cycle_snapshot',
+    'atr_calculator', 'candle_volume_detector', 'auto_config_manager', 'simulated_broker', 'broker_backend',
+    'order_queue'
+]
+
+
+@dataclass
+class BacktestResult:
+    """ผลลัพธ์ของการ backtest หนึ่งรอบ"""
+    equity_curve: np.ndarray
+    trades: List[Dict]
+    initial_balance: float
+    final_balance: float
+    final_equity: float
+    max_drawdown: float
+    max_drawdown_pct: float
+    min_margin_level: float
+    ticks_processed: int
+    cycles: int
+    elapsed_secs: float
+    statistics: Dict = field(default_factory=dict)
+
+    @property
+    def net_profit(self) -> float:
+        return self.final_equity - self.initial_balance
+
+    def summary(self) -> str:
+        """สรุปผลเป็นข้อความ"""
+        min_ml = f"{self.min_margin_level:.1f}%" if self.min_margin_level != float('inf') else "n/a"
+        lines = [
+            "=" * 60,
+            "Backtest Result",
+            "=" * 60,
+            f"Initial Balance : ${self.initial_balance:,.2f}",
+            f"Final Balance   : ${self.final_balance:,.2f}",
+            f"Final Equity    : ${self.final_equity:,.2f}",
+            f"Net Profit      : ${self.net_profit:,.2f}",
+            f"Max Drawdown    : ${self.max_drawdown:,.2f} ({self.max_drawdown_pct:.1f}%)",
+            f"Min Margin Level: {min_ml}",
+            f"Deals           : {len(self.trades)} (TP {self.statistics.get('tp_fills', 0)}, "
+            f"SL {self.statistics.get('sl_fills', 0)}, Stop out {self.statistics.get('stop_outs', 0)})",
+            f"Ticks / Cycles  : {self.ticks_processed:,} / {self.cycles:,}",
+            f"Elapsed         : {self.elapsed_secs:.1f}s",
+            "=" * 60,
+        ]
+        return "\n".join(lines)
+
+    def save_equity_csv(self, path: str):
+        """บันทึก equity curve เป็น CSV"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(EQUITY_DTYPE.names)
+            for row in self.equity_curve:
+                writer.writerow([row[name] for name in EQUITY_DTYPE.names])
+
+    def save_trades_csv(self, path: str):
+        """บันทึก trade log (deals) เป็น CSV"""
+        if not self.trades:
+            return
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.trades[0].keys()))
+            writer.writeheader()
+            writer.writerows(self.trades)
+
+
+def bars_to_ticks(rates: np.ndarray, spread: float = 0.2, point: float = 0.01):
+    """
+    แปลงแท่งเทียน (เช่น M1) เป็น 4 ticks ต่อแท่ง: Open → Low/High → High/Low → Close
+    (แท่งขึ้นวิ่งไป Low ก่อน, แท่งลงวิ่งไป High ก่อน)
+
+    Args:
+        rates: structured array ที่มี time/open/high/low/close
+        spread: spread คงที่ (หน่วยราคา) ใช้เมื่อไม่มีคอลัมน์ spread
+        point: ขนาด point ของ symbol (คอลัมน์ spread ของ MT5 เป็นหน่วย point)
+
+    Returns:
+        (times, bids, asks) เป็น numpy arrays
+    """
+    rates = np.asarray(rates)
+    n = len(rates)
+    bullish = rates['close'] >= rates['open']
+    first = np.where(bullish, rates['low'], rates['high'])
+    second = np.where(bullish, rates['high'], rates['low'])
+
+    bids = np.empty(n * 4, dtype=np.float64)
+    bids[0::4] = rates['open']
+    bids[1::4] = first
+    bids[2::4] = second
+    bids[3::4] = rates['close']
+
+    base = rates['time'].astype(np.int64)
+    times = np.empty(n * 4, dtype=np.int64)
+    times[0::4] = base
+    times[1::4] = base + 15
+    times[2::4] = base + 30
+    times[3::4] = base + 59
+
+    if 'spread' in rates.dtype.names and np.any(rates['spread'] > 0):
+        spreads = np.repeat(rates['spread'].astype(np.float64) * point, 4)
+    else:
+        spreads = np.full(n * 4, spread)
+    return times, bids, bids + spreads
+
+
+def load_bars_csv(path: str) -> np.ndarray:
+    """
+    โหลดแท่งเทียนจาก CSV (คอลัมน์: time, open, high, low, close[, tick_volume, spread, real_volume])
+    time เป็น unix seconds
+
+    Args:
+        path: path ของไฟล์ CSV
+
+    Returns:
+        structured array แบบ RATES_DTYPE
+    """
+    raw = np.genfromtxt(path, delimiter=',', names=True, dtype=None, encoding='utf-8')
+    rates = np.zeros(len(raw), dtype=RATES_DTYPE)
+    for name in RATES_DTYPE.names:
+        if name in raw.dtype.names:
+            rates[name] = raw[name]
+    return rates
+
+
+class Backtester:
+    """
+    รัน GridManager.update_grid_status และ HGManager.manage_multiple_hg ตัวจริงบน tick ย้อนหลัง
+    - broker ถูกสลับเป็น SimulatedBroker ระหว่างรัน แล้วสลับกลับเมื่อจบ
+    - นาฬิกากลาง (clock) ใช้เวลาของ tick ทำให้ threshold ต่างๆ (3s/5s, zone_refresh_secs,
+      auto settings 15 นาที) เดินตามเวลาจำลองโดยไม่ต้อง sleep
+    """
+
+    def __init__(self, balance: float = 10000.0, leverage: int = 100,
+                 cycle_secs: float = 1.0, sample_secs: float = 60.0,
+                 stop_out_level: float = 50.0, warmup_bars: int = 0,
+                 stop_on_stop_out: bool = False, quiet: bool = True, digits: int = 2):
+        """
+        Args:
+            balance: เงินทุนเริ่มต้น
+            leverage: leverage ของบัญชีจำลอง
+            cycle_secs: ระยะห่างขั้นต่ำ (เวลาจำลอง) ระหว่างรอบ monitoring (GUI ใช้ 0.5-1 วินาที)
+            sample_secs: ระยะห่างการเก็บจุด equity curve
+            stop_out_level: margin level (%) ที่ broker จำลองเริ่ม stop out
+            warmup_bars: จำนวนแท่งแรกที่ใช้สร้างข้อมูลย้อนหลัง (ATR/zones) โดยยังไม่เทรด
+            stop_on_stop_out: True = หยุด backtest เมื่อโดน stop out
+            quiet: True = ลด log ของ module ต่างๆ เป็น WARNING
+            digits: จำนวนทศนิยมของราคา symbol (point = 10^-digits ใช้ทั้ง broker จำลองและแปลง spread)
+        """
+        self.balance = balance
+        self.leverage = leverage
+        self.cycle_secs = cycle_secs
+        self.sample_secs = sample_secs
+        self.stop_out_level = stop_out_level
+        self.warmup_bars = warmup_bars
+        self.stop_on_stop_out = stop_on_stop_out
+        self.quiet = quiet
+        self.digits = digits
+        self.times = np.empty(0, dtype=np.int64)
+        self.bids = np.empty(0, dtype=np.float64)
+        self.asks = np.empty(0, dtype=np.float64)
+        self.warmup_ticks = 0
+
+    def load_bars(self, rates: np.ndarray, spread: float = 0.2) -> 'Backtester':
+        """
+        โหลดแท่งเทียน (เช่น M1) แล้วแปลงเป็น ticks
+
+        Args:
+            rates: structured array แบบ RATES_DTYPE
+            spread: spread คงที่ (หน่วยราคา) ถ้าข้อมูลไม่มี spread
+        """
+        self.times, self.bids, self.asks = bars_to_ticks(rates, spread, point=10 ** -self.digits)
+        self.warmup_ticks = min(len(self.times), self.warmup_bars * 4)
+        return self
+
+    def load_ticks(self, times, bids, asks, warmup_ticks: int = 0) -> 'Backtester':
+        """
+        โหลด tick จริง (ถ้าเป็น float64/int64 อยู่แล้วจะใช้เป็น view ไม่ copy)
+
+        Args:
+            times: เวลา (unix seconds)
+            bids: ราคา bid
+            asks: ราคา ask
+            warmup_ticks: จำนวน tick แรกที่ใช้สร้างข้อมูลย้อนหลังโดยยังไม่เทรด
+        """
+        self.times = np.asarray(times, dtype=np.int64)
+        self.bids = np.asarray(bids, dtype=np.float64)
+        self.asks = np.asarray(asks, dtype=np.float64)
+        self.warmup_ticks = min(len(self.times), max(0, int(warmup_ticks)))
+        return self
+
+    def _reset_engine_state(self):
+        """ล้าง state ของ singletons ให้เริ่มจากศูนย์ทุกครั้งที่รัน"""
+        position_monitor.reset()
+        snapshot_provider.reset()
+        order_queue.reset()
+        grid_manager.__init__()
+        atr_calculator.cached_atr = None
+        atr_calculator.cache_timestamp = None
+        atr_engine.reset()
+        candle_volume_detector.cached_result = None
+        candle_volume_detector.cached_time = None
+        rate_cache.clear()
+        mt5_connection.symbol = config.mt5.symbol
+        mt5_connection.cached_filling_mode = None
+        mt5_connection.symbol_spec = None
+        mt5_connection.trade_revision = 0
+        config.grid.last_auto_update = None
+
+    def run(self) -> BacktestResult:
+        """
+        รัน backtest
+
+        Returns:
+            BacktestResult
+        """
+        if len(self.times) == 0:
+            raise ValueError("No ticks loaded - call load_bars() or load_ticks() first")
+
+        started = time.perf_counter()
+        saved_grid = copy.deepcopy(config.grid)
+        saved_hg = copy.deepcopy(config.hg)
+        saved_persist = config.persist
+        saved_synchronous = order_queue.synchronous
+        saved_levels = {name: logging.getLogger(name).level for name in NOISY_LOGGERS}
+
+        sim = SimulatedBroker(symbol=config.mt5.symbol, balance=self.balance, leverage=self.leverage,
+                              stop_out_level=self.stop_out_level, digits=self.digits)
+        sim.load_ticks(self.times, self.bids, self.asks)
+        previous_backend = broker.use_backend(sim)
+        config.persist = False
+        order_queue.synchronous = True  # ส่ง order ทันทีใน thread เดียว → ผลลัพธ์ deterministic
+        if self.quiet:
+            for name in NOISY_LOGGERS:
+                logging.getLogger(name).setLevel(logging.WARNING)
+
+        hg_manager = HGManager()
+        try:
+            # Warm-up: สร้างแท่งเทียนย้อนหลังโดยยังไม่เทรด
+            for _ in range(max(1, self.warmup_ticks)):
+                sim.step()
+            clock.set_virtual(sim.current_tick.time)
+
+            self._reset_engine_state()
+            if not mt5_connection.connect_to_mt5():
+                raise RuntimeError("Cannot connect to simulated broker")
+
+            grid_manager.start_grid_trading()
+            if config.hg.enabled:
+                hg_manager.start_hg_system(sim.current_tick.bid)
+
+            return self._replay(sim, hg_manager, started)
+        finally:
+            position_monitor.unsubscribe(hg_manager.on_position_events)
+            grid_manager.active = False
+            mt5_connection.connected = False
+            broker.use_backend(previous_backend)
+            clock.use_real_time()
+            config.grid = saved_grid
+            config.hg = saved_hg
+            config.persist = saved_persist
+            order_queue.synchronous = saved_synchronous
+            for name, level in saved_levels.items():
+                logging.getLogger(name).setLevel(level)
+
+    def _replay(self, sim: SimulatedBroker, hg_manager: HGManager, started: float) -> BacktestResult:
+        samples = []
+        peak_equity = self.balance
+        max_dd = 0.0
+        max_dd_pct = 0.0
+        min_margin_level = float('inf')
+        last_cycle = -float('inf')
+        last_sample = -float('inf')
+        cycles = 0
+        ticks = 0
+
+        while True:
+            tick = sim.current_tick
+            now = tick.time
+            clock.set_virtual(now)
+
+            if now - last_cycle >= self.cycle_secs:
+                last_cycle = now
+                cycles += 1
+                # รอบเดียวกับ tick task ของ Engine (engine.py)
+                snapshot = snapshot_provider.capture()
+                if snapshot is not None:
+                    try:
+                        grid_manager.update_grid_status()
+                    except Exception as e:
+                        logger.error(f"Error in grid manager: {e}", exc_info=True)
+                    if config.hg.enabled:
+                        try:
+                            hg_manager.manage_multiple_hg(snapshot.bid)
+                        except Exception as e:
+                            logger.error(f"Error in HG manager: {e}", exc_info=True)
+
+            account = sim.account_info()
+            if account.equity > peak_equity:
+                peak_equity = account.equity
+            drawdown = peak_equity - account.equity
+            if drawdown > max_dd:
+                max_dd = drawdown
+                max_dd_pct = drawdown / peak_equity * 100 if peak_equity > 0 else 0.0
+            if account.margin > 0 and account.margin_level < min_margin_level:
+                min_margin_level = account.margin_level
+
+            if now - last_sample >= self.sample_secs:
+                last_sample = now
+                samples.append((now, account.balance, account.equity, account.margin, account.margin_level))
+
+            if self.stop_on_stop_out and sim.stopped_out:
+                logger.warning(f"Backtest stopped: stop out at {clock.now()}")
+                break
+            ticks += 1
+            if not sim.step():
+                break
+
+        account = sim.account_info()
+        samples.append((sim.current_tick.time, account.balance, account.equity, account.margin, account.margin_level))
+        return BacktestResult(
+            equity_curve=np.array(samples, dtype=EQUITY_DTYPE),
+            trades=list(sim.deals),
+            initial_balance=self.balance,
+            final_balance=account.balance,
+            final_equity=account.equity,
+            max_drawdown=max_dd,
+            max_drawdown_pct=max_dd_pct,
+            min_margin_level=min_margin_level,
+            ticks_processed=ticks,
+            cycles=cycles,
+            elapsed_secs=time.perf_counter() - started,
+            statistics=sim.get_statistics(),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest Grid + HG บนข้อมูลแท่งเทียนย้อนหลัง")
+    parser.add_argument('bars', help="CSV ของแท่งเทียน (time,open,high,low,close[,tick_volume,spread])")
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--leverage', type=int, default=100)
+    parser.add_argument('--spread', type=float, default=0.2, help="spread คงที่ (หน่วยราคา)")
+    parser.add_argument('--digits', type=int, default=2, help="จำนวนทศนิยมของราคา (XAUUSD = 2)")
+    parser.add_argument('--warmup-bars', type=int, default=0)
+    parser.add_argument('--cycle-secs', type=float, default=1.0)
+    parser.add_argument('--equity-csv', default=None)
+    parser.add_argument('--trades-csv', default=None)
+    args = parser.parse_args()
+
+    backtester = Backtester(balance=args.balance, leverage=args.leverage,
+                            cycle_secs=args.cycle_secs, warmup_bars=args.warmup_bars, digits=args.digits)
+    backtester.load_bars(load_bars_csv(args.bars), spread=args.spread)
+    result = backtester.run()
+    print(result.summary())
+    if args.equity_csv:
+        result.save_equity_csv(args.equity_csv)
+    if args.trades_csv:
+        result.save_trades_csv(args.trades_csv)
+
+
+if __name__ == '__main__':
+    main()
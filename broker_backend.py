@@ -0,0 +1,209 @@
+# broker_backend.py
+# Interface กลางสำหรับ broker (MT5 จริง / broker จำลอง) เพื่อให้ระบบรันและทดสอบบน Linux ได้
+
+from abc import ABC, abstractmethod
+from typing import Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BrokerBackend(ABC):
+    """
+    Interface ของ broker ที่ระบบใช้งาน (ครอบคลุมเฉพาะ API ของ MetaTrader5 ที่เรียกใช้จริง)
+    backend ที่ implement method ไม่ครบจะสร้าง instance ไม่ได้ (TypeError ตอนสร้าง ไม่ใช่ตอนเรียกใช้)
+    ค่าคงที่ใช้ตัวเลขเดียวกับ MetaTrader5 เพื่อให้โค้ดเดิมทำงานได้ทั้งสอง backend
+    """
+
+    # ประเภท order
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+
+    # ประเภท trade action
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_SLTP = 6
+
+    # Filling / Time
+    ORDER_FILLING_FOK = 0
+    ORDER_FILLING_IOC = 1
+    ORDER_FILLING_RETURN = 2
+    ORDER_TIME_GTC = 0
+
+    # Return codes
+    TRADE_RETCODE_REQUOTE = 10004
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_INVALID = 10013
+    TRADE_RETCODE_INVALID_VOLUME = 10014
+    TRADE_RETCODE_INVALID_STOPS = 10016
+    TRADE_RETCODE_NO_MONEY = 10019
+    TRADE_RETCODE_PRICE_CHANGED = 10020
+    TRADE_RETCODE_POSITION_CLOSED = 10036
+
+    # Timeframes
+    TIMEFRAME_M1 = 1
+    TIMEFRAME_M5 = 5
+    TIMEFRAME_M15 = 15
+    TIMEFRAME_M30 = 30
+    TIMEFRAME_H1 = 16385
+    TIMEFRAME_H4 = 16388
+    TIMEFRAME_D1 = 16408
+
+    name = "base"
+    # จำนวน order_send ที่เรียกพร้อมกันจากหลาย thread ได้อย่างปลอดภัย (batch close ใช้เป็นขนาด worker pool สูงสุด)
+    max_concurrent_orders = 1
+
+    @abstractmethod
+    def initialize(self, *args, **kwargs) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def login(self, login: int, password: str, server: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def shutdown(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def last_error(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def symbol_info(self, symbol: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def symbol_info_tick(self, symbol: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def symbols_get(self, *args, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def positions_get(self, symbol: Optional[str] = None, ticket: Optional[int] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def order_send(self, request: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def account_info(self):
+        raise NotImplementedError
+
+
+# จำนวนวินาทีต่อแท่งของแต่ละ timeframe
+TIMEFRAME_SECONDS = {
+    BrokerBackend.TIMEFRAME_M1: 60,
+    BrokerBackend.TIMEFRAME_M5: 300,
+    BrokerBackend.TIMEFRAME_M15: 900,
+    BrokerBackend.TIMEFRAME_M30: 1800,
+    BrokerBackend.TIMEFRAME_H1: 3600,
+    BrokerBackend.TIMEFRAME_H4: 14400,
+    BrokerBackend.TIMEFRAME_D1: 86400,
+}
+
+
+class MT5Backend(BrokerBackend):
+    """Backend ที่ส่งต่อคำสั่งไปยัง MetaTrader5 จริง (import แบบ lazy เพื่อให้ import ได้บน Linux)"""
+
+    name = "mt5"
+    # Python bridge ของ MetaTrader5 ไม่ได้ระบุว่า thread-safe → ส่ง order ทีละรายการ
+    max_concurrent_orders = 1
+
+    def __init__(self):
+        self._mt5 = None
+
+    @property
+    def mt5(self):
+        if self._mt5 is None:
+            import MetaTrader5
+            self._mt5 = MetaTrader5
+        return self._mt5
+
+    def initialize(self, *args, **kwargs) -> bool:
+        return self.mt5.initialize(*args, **kwargs)
+
+    def login(self, login: int, password: str, server: str) -> bool:
+        return self.mt5.login(login, password, server)
+
+    def shutdown(self):
+        if self._mt5 is not None:
+            self._mt5.shutdown()
+
+    def last_error(self):
+        return self.mt5.last_error()
+
+    def symbol_info(self, symbol: str):
+        return self.mt5.symbol_info(symbol)
+
+    def symbol_info_tick(self, symbol: str):
+        return self.mt5.symbol_info_tick(symbol)
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        return self.mt5.symbol_select(symbol, enable)
+
+    def symbols_get(self, *args, **kwargs):
+        return self.mt5.symbols_get(*args, **kwargs)
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        return self.mt5.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+
+    def positions_get(self, symbol: Optional[str] = None, ticket: Optional[int] = None):
+        if ticket is not None:
+            return self.mt5.positions_get(ticket=ticket)
+        if symbol is not None:
+            return self.mt5.positions_get(symbol=symbol)
+        return self.mt5.positions_get()
+
+    def order_send(self, request: dict):
+        return self.mt5.order_send(request)
+
+    def account_info(self):
+        return self.mt5.account_info()
+
+
+class BrokerProxy:
+    """
+    ตัวกลางที่โมดูลอื่น import ไปใช้แทน MetaTrader5 (เช่น `from broker_backend import broker as mt5`)
+    ส่งต่อทุกการเรียกไปยัง backend ที่เลือกอยู่ สลับ backend ได้ขณะรันผ่าน use_backend()
+    """
+
+    def __init__(self, backend: BrokerBackend):
+        self._backend = backend
+
+    @property
+    def backend(self) -> BrokerBackend:
+        return self._backend
+
+    def use_backend(self, backend: BrokerBackend) -> BrokerBackend:
+        """
+        เปลี่ยน backend ที่ใช้งาน
+
+        Args:
+            backend: BrokerBackend ตัวใหม่
+
+        Returns:
+            backend เดิม (ใช้สลับกลับได้)
+        """
+        previous = self._backend
+        self._backend = backend
+        logger.info(f"Broker backend switched: {previous.name} → {backend.name}")
+        return previous
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+
+# สร้าง instance หลักสำหรับใช้งาน (ค่าเริ่มต้น = MT5 จริง)
+broker = BrokerProxy(MT5Backend())
@@ -1,12 +1,13 @@
 # candle_volume_detector.py
 # ระบบตรวจจับทิศทาง Grid โดยดูจาก Volume + Candle Pattern
 
-import MetaTrader5 as mt5
+from broker_backend import broker as mt5
 import logging
 from typing import Optional, Dict, List
-from datetime import datetime
 import numpy as np
 from config import config
+from clock import clock
+from rate_cache import rate_cache
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -56,7 +57,7 @@ class CandleVolumeDetector:
         try:
             # position = 1 คือแท่งที่ปิดแล้ว (index 0 คือแท่งปัจจุบันที่กำลังวิ่ง)
             tf = timeframe or self.primary_timeframe
-            rates = mt5.copy_rates_from_pos(self.symbol, tf, position, 1)
+            rates = rate_cache.get_rates(self.symbol, tf, 1, start_pos=position)
             
             if rates is None or len(rates) == 0:
                 logger.error(f"Cannot get closed candle at position {position}")
@@ -80,7 +81,7 @@ class CandleVolumeDetector:
         """
         try:
             tf = timeframe or self.primary_timeframe
-            rates = mt5.copy_rates_from_pos(self.symbol, tf, 1, n)
+            rates = rate_cache.get_rates(self.symbol, tf, n, start_pos=1)
             
             if rates is None or len(rates) == 0:
                 logger.error(f"Cannot get last {n} candles")
@@ -109,9 +110,8 @@ class CandleVolumeDetector:
                 logger.warning(f"Not enough candles for Volume MA calculation")
                 return 0
             
-            # ใช้ tick_volume (Volume ใน MT5)
-            volumes = [candle['tick_volume'] for candle in candles]
-            volume_ma = np.mean(volumes)
+            # ใช้ tick_volume (Volume ใน MT5) อ่านจาก view ของ rate_cache โดยตรง
+            volume_ma = float(np.mean(candles['tick_volume']))
             
             logger.debug(f"Volume MA({period}): {volume_ma:.0f}")
             return volume_ma
@@ -333,7 +333,7 @@ class CandleVolumeDetector:
         """
         try:
             # เช็ค Cache
-            current_time = datetime.now()
+            current_time = clock.now()
             if (self.cached_result and self.cached_time and 
                 (current_time - self.cached_time).total_seconds() < self.cache_duration):
                 logger.debug("Using cached result")
@@ -403,7 +403,7 @@ class CandleVolumeDetector:
                 'volume_ratio': primary_detail['volume']['ratio'],
                 'volume_current': primary_detail['volume']['current'],
                 'volume_ma': primary_detail['volume']['ma'],
-                'timestamp': datetime.now()
+                'timestamp': clock.now()
             }
             
             # Cache ผลลัพธ์
@@ -0,0 +1,56 @@
+# clock.py
+# นาฬิกากลางของระบบ: ใช้เวลาจริงตอนเทรด หรือเวลาจำลอง (virtual) ตอน backtest
+
+from datetime import datetime
+from typing import Optional
+import time as _time
+
+
+class Clock:
+    """
+    แหล่งเวลาเดียวสำหรับ threshold ต่างๆ (ป้องกันวางซ้ำ, cache, zone refresh, auto settings)
+    - โหมดปกติ: คืนเวลาจริง
+    - โหมด virtual: คืนเวลาที่ backtester ตั้งไว้ (ไม่ต้อง sleep รอ)
+    """
+
+    def __init__(self):
+        self._virtual_time: Optional[float] = None
+
+    @property
+    def is_virtual(self) -> bool:
+        return self._virtual_time is not None
+
+    def time(self) -> float:
+        """เวลาปัจจุบันแบบ unix seconds (แทน time.time())"""
+        if self._virtual_time is not None:
+            return self._virtual_time
+        return _time.time()
+
+    def now(self) -> datetime:
+        """เวลาปัจจุบันแบบ datetime (แทน datetime.now())"""
+        if self._virtual_time is not None:
+            return datetime.fromtimestamp(self._virtual_time)
+        return datetime.now()
+
+    def set_virtual(self, timestamp: float):
+        """
+        เปลี่ยนเป็นเวลาจำลองและตั้งเวลา
+
+        Args:
+            timestamp: เวลา unix seconds
+        """
+        self._virtual_time = float(timestamp)
+
+    def advance(self, seconds: float):
+        """เลื่อนเวลาจำลองไปข้างหน้า (ใช้ได้เฉพาะโหมด virtual)"""
+        if self._virtual_time is None:
+            raise RuntimeError("Clock is not in virtual mode")
+        self._virtual_time += seconds
+
+    def use_real_time(self):
+        """กลับไปใช้เวลาจริง"""
+        self._virtual_time = None
+
+
+# สร้าง instance หลักสำหรับใช้งาน
+clock = Clock()
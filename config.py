@@ -7,6 +7,8 @@ from dataclasses import dataclass, field
 from typing import Optional
 from datetime import datetime
 
+CONFIG_FILE_ENV = "GRIDTRADING_CONFIG"  # environment variable สำหรับระบุไฟล์ตั้งค่า (แทน settings.ini)
+
 @dataclass
 class GridSettings:
     """การตั้งค่า Grid Trading"""
@@ -78,6 +80,12 @@ class MT5Settings:
     comment_hg: str = "HG_AI"
     comment_auto: str = "Full_AutoAI"  # Comment สำหรับ Auto Mode
     
+    # Tick Stream (รอบ monitoring)
+    tick_threshold_pips: float = 1.0  # ปลุก strategy เมื่อ bid/ask ขยับอย่างน้อยเท่านี้ (pips)
+    tick_poll_min: float = 0.05       # รอบ poll ตอนราคาวิ่ง (วินาที)
+    tick_poll_max: float = 0.5        # รอบ poll ตอนราคานิ่ง (วินาที)
+    tick_heartbeat: float = 2.0       # รัน strategy อย่างน้อยทุกกี่วินาที แม้ราคาไม่ขยับ
+    
 @dataclass
 class RiskSettings:
     """การตั้งค่าความเสี่ยง"""
@@ -91,6 +99,7 @@ class Config:
     
     def __init__(self, config_file: str = "settings.ini"):
         self.config_file = config_file
+        self.persist = True  # False = ไม่เขียนไฟล์ (ใช้ตอน backtest เพื่อไม่ให้ทับ settings.ini จริง)
         self.grid = GridSettings()
         self.hg = HGSettings()
         self.mt5 = MT5Settings()
@@ -177,6 +186,10 @@ class Config:
                 self.mt5.symbol = parser.get('MT5', 'symbol', fallback='XAUUSD')
                 self.mt5.magic_number = parser.getint('MT5', 'magic_number', fallback=123456)
                 self.mt5.deviation = parser.getint('MT5', 'deviation', fallback=20)
+                self.mt5.tick_threshold_pips = parser.getfloat('MT5', 'tick_threshold_pips', fallback=1.0)
+                self.mt5.tick_poll_min = parser.getfloat('MT5', 'tick_poll_min', fallback=0.05)
+                self.mt5.tick_poll_max = parser.getfloat('MT5', 'tick_poll_max', fallback=0.5)
+                self.mt5.tick_heartbeat = parser.getfloat('MT5', 'tick_heartbeat', fallback=2.0)
             
             # Risk Settings
             if 'Risk' in parser:
@@ -189,6 +202,8 @@ class Config:
     
     def save_to_file(self):
         """บันทึกการตั้งค่าลงไฟล์ .ini"""
+        if not self.persist:
+            return
         parser = configparser.ConfigParser()
         
         # Grid Section
@@ -248,7 +263,11 @@ class Config:
             'magic_number': str(self.mt5.magic_number),
             'deviation': str(self.mt5.deviation),
             'comment_grid': self.mt5.comment_grid,
-            'comment_hg': self.mt5.comment_hg
+            'comment_hg': self.mt5.comment_hg,
+            'tick_threshold_pips': str(self.mt5.tick_threshold_pips),
+            'tick_poll_min': str(self.mt5.tick_poll_min),
+            'tick_poll_max': str(self.mt5.tick_poll_max),
+            'tick_heartbeat': str(self.mt5.tick_heartbeat)
         }
         
         # Risk Section
@@ -286,6 +305,6 @@ class Config:
         return price / self.get_pip_value()
 
 
-# สร้าง instance หลักสำหรับใช้งาน
-config = Config()
+# สร้าง instance หลักสำหรับใช้งาน (daemon กำหนดไฟล์ผ่าน GRIDTRADING_CONFIG ก่อน import)
+config = Config(os.environ.get(CONFIG_FILE_ENV, "settings.ini"))
 
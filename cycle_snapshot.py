@@ -0,0 +1,172 @@
+# cycle_snapshot.py
+# Snapshot ข้อมูลตลาด / positions / account ต่อรอบ monitoring (ใช้ร่วมกันระหว่าง Grid, HG และ GUI)
+
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional, Tuple
+from datetime import datetime
+import logging
+import threading
+from mt5_connection import mt5_connection
+from position_monitor import position_monitor
+from grid_ladder import GridLadder
+from position_table import PositionTable
+from clock import clock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CycleSnapshot:
+    """ข้อมูลที่จับไว้ครั้งเดียวต่อรอบ (อ่านอย่างเดียว)"""
+    bid: float
+    ask: float
+    tick_time: Optional[datetime]
+    positions: Tuple[Dict, ...]
+    grid_positions: Tuple[Dict, ...]
+    hg_positions: Tuple[Dict, ...]
+    account: Optional[Dict]
+    captured_at: float
+    trade_revision: int
+    # Index สำหรับค้นหา O(1) (ใช้ index และ position dicts ของ PositionMonitor ร่วมกัน - monitor สร้างใหม่แทนการแก้ไข)
+    by_ticket: Dict[int, Dict] = field(default_factory=dict, repr=False, compare=False)
+    grid_by_side: Dict[str, Tuple[Dict, ...]] = field(default_factory=dict, repr=False, compare=False)
+    hg_by_side: Dict[str, Tuple[Dict, ...]] = field(default_factory=dict, repr=False, compare=False)
+    grid_tickets: FrozenSet[int] = field(default_factory=frozenset, repr=False, compare=False)
+    # ราคาเปิด Grid เรียงแยกฝั่ง สำหรับค้นหาไม้สุดขอบ / ไม้ใกล้ราคา O(log n)
+    grid_ladder: GridLadder = field(default_factory=GridLadder, repr=False, compare=False)
+    # ตาราง columnar ของรอบนี้ (ผลรวม / ค่าต่ำสุดตาม role ไม่ต้องวน dict)
+    table: PositionTable = field(default_factory=PositionTable, repr=False, compare=False)
+
+    @property
+    def price_info(self) -> Dict:
+        """คืนค่าราคาในรูปแบบเดียวกับ mt5_connection.get_current_price()"""
+        return {'bid': self.bid, 'ask': self.ask, 'time': self.tick_time}
+
+    def get_position(self, ticket: int) -> Optional[Dict]:
+        """
+        ค้นหา position จาก ticket ภายใน snapshot
+
+        Args:
+            ticket: ticket number
+
+        Returns:
+            position dict หรือ None
+        """
+        return self.by_ticket.get(ticket)
+
+    def grid_side(self, side: str) -> Tuple[Dict, ...]:
+        """
+        ดึง Grid positions ของฝั่งที่ระบุ
+
+        Args:
+            side: 'buy' หรือ 'sell'
+
+        Returns:
+            tuple ของ Grid positions ฝั่งนั้น
+        """
+        return self.grid_by_side.get(side, ())
+
+    def hg_side(self, side: str) -> Tuple[Dict, ...]:
+        """
+        ดึง HG positions ของฝั่งที่ระบุ
+
+        Args:
+            side: 'buy' หรือ 'sell'
+
+        Returns:
+            tuple ของ HG positions ฝั่งนั้น
+        """
+        return self.hg_by_side.get(side, ())
+
+
+class SnapshotProvider:
+    """
+    จัดการ CycleSnapshot ของรอบปัจจุบัน
+    - monitoring loop เรียก capture() ครั้งเดียวต่อรอบ
+    - managers เรียก get() ซึ่งจะดึงข้อมูลใหม่เฉพาะเมื่อ snapshot ถูก invalidate
+      (มีการส่ง order หลังจับ snapshot) หรือ snapshot เก่าเกิน max_age
+    """
+
+    def __init__(self, max_age: float = 1.0):
+        self.current: Optional[CycleSnapshot] = None
+        self.max_age = max_age  # วินาที (กันกรณีเรียกจากนอก loop เช่นปุ่ม Refresh)
+        self._invalidated = False
+        self._lock = threading.RLock()
+
+    def capture(self, include_account: bool = True) -> Optional[CycleSnapshot]:
+        """
+        ดึงราคา, positions และ account จาก MT5 ครั้งเดียวแล้วเก็บเป็น snapshot
+
+        Args:
+            include_account: True = ดึงข้อมูล account ด้วย
+
+        Returns:
+            CycleSnapshot หรือ None ถ้าดึงราคาไม่ได้
+        """
+        with self._lock:
+            revision = mt5_connection.trade_revision
+            price_info = mt5_connection.get_current_price()
+            if not price_info:
+                return None
+
+            position_monitor.update_all_positions()
+            position_monitor.refresh_floating(price_info['bid'], price_info['ask'])
+            account = mt5_connection.get_account_info() if include_account else None
+
+            snapshot = CycleSnapshot(
+                bid=price_info['bid'],
+                ask=price_info['ask'],
+                tick_time=price_info.get('time'),
+                positions=position_monitor.positions,
+                grid_positions=position_monitor.grid_positions,
+                hg_positions=position_monitor.hg_positions,
+                account=account,
+                captured_at=clock.time(),
+                trade_revision=revision,
+                by_ticket=position_monitor.positions_by_ticket,
+                grid_by_side=position_monitor.grid_by_side,
+                hg_by_side=position_monitor.hg_by_side,
+                grid_tickets=position_monitor.grid_tickets,
+                grid_ladder=position_monitor.grid_ladder,
+                table=position_monitor.table
+            )
+            self.current = snapshot
+            self._invalidated = False
+            return snapshot
+
+    def invalidate(self):
+        """บังคับให้ get() ครั้งถัดไปดึงข้อมูลใหม่"""
+        self._invalidated = True
+
+    def is_stale(self, snapshot: Optional[CycleSnapshot]) -> bool:
+        """ตรวจสอบว่า snapshot ต้องดึงใหม่หรือไม่"""
+        if snapshot is None or self._invalidated:
+            return True
+        # มี order ถูกส่ง/แก้ไข/ปิด หลังจากจับ snapshot
+        if snapshot.trade_revision != mt5_connection.trade_revision:
+            return True
+        return (clock.time() - snapshot.captured_at) > self.max_age
+
+    def get(self) -> Optional[CycleSnapshot]:
+        """
+        คืน snapshot ของรอบปัจจุบัน (ดึงใหม่เฉพาะเมื่อจำเป็น)
+
+        Returns:
+            CycleSnapshot หรือ None ถ้าดึงข้อมูลไม่ได้
+        """
+        with self._lock:
+            snapshot = self.current
+            if self.is_stale(snapshot):
+                snapshot = self.capture()
+            return snapshot
+
+    def reset(self):
+        """ล้าง snapshot (ใช้ตอนเริ่ม/หยุดระบบ)"""
+        with self._lock:
+            self.current = None
+            self._invalidated = False
+
+
+# สร้าง instance หลักสำหรับใช้งาน
+snapshot_provider = SnapshotProvider()
@@ -0,0 +1,180 @@
+# daemon.py
+# รันระบบเทรดแบบ headless (ไม่มี Tkinter) พร้อม status endpoint ผ่าน HTTP บน localhost
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+import json
+import logging
+import signal
+import threading
+from mt5_connection import mt5_connection
+from grid_manager import grid_manager
+from hg_manager import HGManager
+from position_monitor import position_monitor
+from status_report import status_reporter
+from tick_stream import tick_stream
+from engine import engine, EVENT_STATUS, EVENT_HALTED
+from clock import clock
+from config import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATUS_HOST = "127.0.0.1"  # เปิดเฉพาะ localhost (ดูผ่าน ssh tunnel / monitoring agent บน VPS)
+STATUS_PORT = 8765
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /status → JSON สถานะระบบ, GET /health → 200 ถ้า Engine ทำงาน / 503 ถ้าหยุด
+    อ่านจากข้อมูลที่ Engine จับไว้แล้วเท่านั้น (ไม่เรียก MT5 จาก thread ของ HTTP)
+    """
+
+    daemon: 'TradingDaemon' = None
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('', '/status'):
+            self._send(200, self.daemon.status())
+        elif self.path.rstrip('/') == '/health':
+            healthy = engine.running
+            self._send(200 if healthy else 503, {'ok': healthy, 'halt_reason': engine.halt_reason})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def _send(self, code: int, payload: Dict):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Status request: {format % args}")
+
+
+class TradingDaemon:
+    """
+    ลำดับเดียวกับปุ่ม Start ของ GUI: connect → report status (license) → Grid → HG → Engine
+    แล้วรอจนได้ SIGINT / SIGTERM หรือ Engine หยุดเอง (เช่น license ไม่ active)
+    """
+
+    def __init__(self, login: Optional[int] = None, password: Optional[str] = None,
+                 server: Optional[str] = None, status_host: str = STATUS_HOST,
+                 status_port: int = STATUS_PORT):
+        self.login = login
+        self.password = password
+        self.server = server
+        self.status_host = status_host
+        self.status_port = status_port
+        self.hg_manager = HGManager()
+        self.http_server: Optional[ThreadingHTTPServer] = None
+        self._http_thread: Optional[threading.Thread] = None
+        self._shutdown = threading.Event()
+
+    def start(self) -> bool:
+        """เชื่อมต่อ MT5 และเริ่มระบบเทรด คืน False ถ้าเริ่มไม่สำเร็จ"""
+        if not mt5_connection.connect_to_mt5(login=self.login, password=self.password, server=self.server):
+            logger.error("Cannot connect to MT5")
+            return False
+
+        try:
+            status_reporter.report()
+        except Exception as e:
+            logger.error(f"API Status Error: {e}")
+            return False
+
+        price_info = mt5_connection.get_current_price()
+        if not price_info:
+            logger.error("Cannot get current price - check MT5 terminal (symbol / market hours)")
+            return False
+        current_price = price_info['bid']
+
+        if not grid_manager.start_grid_trading():
+            logger.error("Failed to start Grid Trading")
+            return False
+        logger.info(f"✓ Grid Trading started at {current_price:.2f}")
+
+        if config.hg.enabled:
+            self.hg_manager.start_hg_system(current_price)
+            logger.info(f"✓ HG System started at {current_price:.2f}")
+
+        engine.subscribe(self.on_engine_event)
+        engine.start(self.hg_manager)
+        self.start_status_server()
+        logger.info("🚀 Trading System ACTIVE (headless)")
+        return True
+
+    def start_status_server(self):
+        """เปิด HTTP status endpoint (port 0 = ไม่เปิด)"""
+        if not self.status_port:
+            return
+        handler = type('DaemonStatusHandler', (StatusRequestHandler,), {'daemon': self})
+        try:
+            self.http_server = ThreadingHTTPServer((self.status_host, self.status_port), handler)
+        except OSError as e:
+            logger.error(f"Cannot start status server on {self.status_host}:{self.status_port}: {e}")
+            return
+        self.http_server.daemon_threads = True
+        self._http_thread = threading.Thread(target=self.http_server.serve_forever, name='status-http', daemon=True)
+        self._http_thread.start()
+        logger.info(f"Status endpoint: http://{self.status_host}:{self.http_server.server_port}/status")
+
+    def on_engine_event(self, event: str, data):
+        if event == EVENT_STATUS:
+            logger.info(f"License expiry: {status_reporter.expiry_date or '-'}")
+        elif event == EVENT_HALTED:
+            logger.error(f"Trading stopped: {data}")
+            self._shutdown.set()
+
+    def run_forever(self) -> int:
+        """
+        รอจนถูกสั่งหยุด แล้วหยุดระบบ (positions ยังเปิดอยู่เหมือนปุ่ม Stop ของ GUI)
+
+        Returns:
+            exit code (0 = หยุดตามคำสั่ง, 1 = Engine หยุดเองเพราะ error)
+        """
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self._shutdown.set())
+        while not self._shutdown.wait(1.0):
+            pass
+        self.shutdown()
+        return 1 if engine.halt_reason else 0
+
+    def request_shutdown(self):
+        self._shutdown.set()
+
+    def shutdown(self):
+        """หยุด Engine, Grid, HG และ status endpoint แล้วตัดการเชื่อมต่อ MT5"""
+        engine.stop()
+        engine.unsubscribe(self.on_engine_event)
+        grid_manager.stop_grid_trading(close_positions=False)
+        self.hg_manager.stop_hg_system()
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+        if mt5_connection.connected:
+            mt5_connection.disconnect()
+        logger.info("⏸ Trading System STOPPED (positions remain open)")
+
+    def status(self) -> Dict:
+        """สถานะระบบสำหรับ /status (จาก snapshot ล่าสุดของ Engine)"""
+        snapshot = engine.snapshot
+        account = snapshot.account if snapshot is not None else None
+        return {
+            'running': engine.running,
+            'halt_reason': engine.halt_reason,
+            'uptime': round(clock.time() - engine.started_at, 1) if engine.started_at else None,
+            'symbol': mt5_connection.symbol,
+            'price': {'bid': snapshot.bid, 'ask': snapshot.ask, 'time': snapshot.tick_time} if snapshot else None,
+            'account': account,
+            'positions': position_monitor.get_positions_summary(account) if account else None,
+            'grid': grid_manager.get_grid_status(),
+            'hg': {key: value for key, value in self.hg_manager.get_hg_status().items()
+                   if key in ('active', 'start_price', 'placed_hg_count', 'closed_hg_count')},
+            'license_expiry': status_reporter.expiry_date,
+            'next_report_time': status_reporter.next_report_time,
+            'tasks': engine.stats(),
+            'tick_stream': dict(tick_stream.stats),
+        }
@@ -0,0 +1,441 @@
+# engine.py
+# Scheduler หลักของระบบเทรด (ไม่ขึ้นกับ GUI): รัน task ตามรอบเวลา / event พร้อมงบเวลาและรายงาน overrun
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import threading
+import time
+from broker_backend import TIMEFRAME_SECONDS
+from mt5_connection import mt5_connection
+from grid_manager import grid_manager
+from position_monitor import position_monitor
+from cycle_snapshot import snapshot_provider
+from order_queue import order_queue
+from status_report import status_reporter
+from tick_stream import tick_stream
+from clock import clock
+from config import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENGINE_WORKERS = 2  # thread สำหรับ task ที่ช้า (HTTP / analysis) แยกจาก trading thread
+POSITIONS_MAX_AGE = 5.0  # วินาที: เช็ค risk alerts อย่างน้อยทุกเท่านี้แม้ positions ไม่เปลี่ยน
+DISPLAY_INTERVAL = 1.0
+AUTO_SETTINGS_INTERVAL = 900.0  # 15 นาที
+MIN_RESCHEDULE = 1.0  # วินาที: task ที่ schedule ภายนอกคืนเวลาที่ผ่านไปแล้ว จะรันซ้ำได้เร็วสุดเท่านี้
+OVERRUN_LOG_INTERVAL = 60.0  # log overrun ของ task เดียวกันไม่เกิน 1 ครั้งต่อช่วงนี้
+
+# Events ที่ส่งให้ผู้รับ (GUI / daemon)
+EVENT_DISPLAY = 'display'  # data = CycleSnapshot ล่าสุด
+EVENT_POSITIONS = 'positions'  # data = List[PositionEvent]
+EVENT_ANALYTICS = 'analytics'  # data = ผลจาก calculate_auto_settings()
+EVENT_STATUS = 'status'  # data = response ของ status report
+EVENT_ERROR = 'error'  # data = (ชื่อ task, ข้อความ error)
+EVENT_OVERRUN = 'overrun'  # data = {'task', 'duration', 'budget', 'running'}
+EVENT_HALTED = 'halted'  # data = เหตุผลที่หยุด
+
+
+@dataclass
+class EngineTask:
+    """
+    งานหนึ่งรายการของ Engine
+    - due เมื่อ trigger() คืน True (event) หรือถึง next_run (interval / schedule)
+    - trigger ถูกเรียกครั้งเดียวต่อรอบ จึงอ่านแล้วล้างสถานะในตัวได้
+    """
+    name: str
+    func: Callable[[], None]
+    interval: Optional[float] = None  # รอบเวลาคงที่ (วินาที), None = ไม่มีรอบเวลา
+    budget: float = 1.0  # เวลาที่ยอมให้ใช้ต่อครั้ง (วินาที) เกินนี้ = overrun
+    deadline: Optional[float] = None  # เริ่มช้ากว่ากำหนดได้ไม่เกิน (วินาที), None = ไม่ตรวจ
+    trigger: Optional[Callable[[], bool]] = None
+    schedule: Optional[Callable[[], float]] = None  # เวลาครั้งถัดไป (timestamp) ที่กำหนดจากภายนอก
+    background: bool = False  # True = รันบน worker thread (ไม่ block trading thread)
+    critical: bool = False  # True = error แล้วหยุด Engine
+
+    # สถานะ / สถิติ
+    next_run: float = 0.0
+    runs: int = 0
+    overruns: int = 0
+    late: int = 0
+    skipped: int = 0
+    errors: int = 0
+    last_duration: float = 0.0
+    max_duration: float = 0.0
+    running_since: Optional[float] = None  # perf_counter ตอนเริ่ม (task ที่กำลังรันบน worker)
+    overrun_reported: bool = False
+    last_overrun_log: float = 0.0
+
+    @property
+    def periodic(self) -> bool:
+        return self.interval is not None or self.schedule is not None
+
+    def is_due(self, now: float) -> bool:
+        fired = self.trigger() if self.trigger is not None else False
+        return fired or (self.periodic and now >= self.next_run)
+
+    def reschedule(self, now: float):
+        if self.schedule is not None:
+            self.next_run = self.schedule()
+        elif self.interval is not None:
+            self.next_run = now + self.interval
+
+    def stats(self) -> Dict:
+        return {
+            'runs': self.runs,
+            'overruns': self.overruns,
+            'late': self.late,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'last_ms': round(self.last_duration * 1000, 1),
+            'max_ms': round(self.max_duration * 1000, 1),
+            'budget_ms': round(self.budget * 1000, 1),
+            'running': self.running_since is not None,
+        }
+
+
+class Engine:
+    """
+    Scheduler ของระบบเทรดแทน monitoring loop ใน GUI
+    - trading thread: tick (ทุกครั้งที่ tick_stream ปลุก / heartbeat), positions (เมื่อเปลี่ยน), display (1 วินาที)
+    - worker threads: analytics (ปิดแท่ง), auto settings (15 นาที), status report (ตามเวลาที่ server กำหนด)
+      → HTTP หรือ analysis ที่ช้าไม่ทำให้ trading หยุด
+    - ผู้ใช้ (GUI / daemon) subscribe รับ events แทนการเป็นเจ้าของ loop
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, EngineTask] = {}
+        self.hg_manager = None
+        self.snapshot = None
+        self.analysis: Optional[Dict] = None
+        self.halt_reason: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self._subscribers: List[Callable[[str, Any], None]] = []
+        self._stop_event = threading.Event()
+        self._stop_event.set()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # สถานะของ triggers
+        self._woke = False
+        self._position_events: List = []
+        self._pending_settings = deque()  # (ฟังก์ชัน apply, settings) จาก worker รอ trading thread apply
+        self._bar_seconds = 900  # วินาทีต่อแท่งของ timeframe ที่ใช้วิเคราะห์ (ตั้งตอน start)
+        self._bar: Optional[int] = None
+        self._analysed_bar: Optional[int] = None
+        self._register_default_tasks()
+
+    @property
+    def running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    def register(self, task: EngineTask):
+        """เพิ่ม / แทนที่ task (ลำดับการลงทะเบียน = ลำดับการรันในแต่ละรอบ)"""
+        with self._lock:
+            self.tasks[task.name] = task
+
+    def _register_default_tasks(self):
+        self.register(EngineTask('tick', self._run_tick, interval=tick_stream.heartbeat, budget=0.5,
+                                 trigger=self._consume_wakeup))
+        self.register(EngineTask('positions', self._run_positions, interval=POSITIONS_MAX_AGE, budget=0.2,
+                                 trigger=self._consume_position_events))
+        self.register(EngineTask('display', self._run_display, interval=DISPLAY_INTERVAL, budget=0.05,
+                                 deadline=DISPLAY_INTERVAL))
+        self.register(EngineTask('analytics', self._run_analytics, budget=5.0,
+                                 trigger=self._consume_bar_close, background=True))
+        self.register(EngineTask('auto_settings', self._run_auto_settings, interval=AUTO_SETTINGS_INTERVAL,
+                                 budget=5.0, deadline=60.0, background=True))
+        self.register(EngineTask('status_report', self._run_status_report, budget=10.0, deadline=60.0,
+                                 schedule=status_reporter.next_due, background=True, critical=True))
+
+    def subscribe(self, callback: Callable[[str, Any], None]):
+        """
+        ลงทะเบียนรับ events ของ Engine
+
+        Args:
+            callback: ฟังก์ชัน (event, data) - ถูกเรียกจาก thread ของ Engine (GUI ต้องส่งต่อเข้า main thread เอง)
+        """
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, Any], None]):
+        """ยกเลิกการรับ events"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def publish(self, event: str, data: Any = None):
+        """ส่ง event ให้ผู้รับทุกตัว (error ของผู้รับรายหนึ่งไม่กระทบรายอื่น)"""
+        for callback in list(self._subscribers):
+            try:
+                callback(event, data)
+            except Exception as e:
+                logger.error(f"Error in engine subscriber ({event}): {e}")
+
+    def start(self, hg_manager=None):
+        """
+        เริ่ม tick stream, worker threads และ trading thread
+
+        Args:
+            hg_manager: HGManager ที่เริ่มระบบแล้ว (None = ไม่จัดการ HG)
+        """
+        if self.running:
+            return
+        self.hg_manager = hg_manager
+        self.snapshot = None
+        self.halt_reason = None
+        self._woke = False
+        self._position_events = []
+        self._pending_settings.clear()
+        self._bar = None
+        self._analysed_bar = None
+
+        from candle_volume_detector import candle_volume_detector
+        self._bar_seconds = TIMEFRAME_SECONDS.get(candle_volume_detector.primary_timeframe, 900)
+
+        now = clock.time()
+        for task in self.tasks.values():
+            task.next_run = task.schedule() if task.schedule is not None else now
+            task.running_since = None
+            task.overrun_reported = False
+        self.tasks['tick'].interval = tick_stream.heartbeat
+
+        position_monitor.subscribe(self._on_position_events)
+        tick_stream.start()
+        self._executor = ThreadPoolExecutor(max_workers=ENGINE_WORKERS, thread_name_prefix='engine-worker')
+        self._stop_event.clear()
+        self.started_at = now
+        self._thread = threading.Thread(target=self._run, name='engine', daemon=True)
+        self._thread.start()
+        logger.info(f"Engine started ({len(self.tasks)} tasks: {', '.join(self.tasks)})")
+
+    def stop(self):
+        """หยุด scheduler (ไม่รอ task บน worker ที่ค้างอยู่ เช่น HTTP ที่ยังไม่ timeout)"""
+        if not self.running:
+            return
+        self._stop_event.set()
+        tick_stream.stop()
+        position_monitor.unsubscribe(self._on_position_events)
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5.0)
+        # order intents ที่ค้างคิวต้องไม่ถูกส่งหลังหยุด (และไม่ถูก dispatch ตอนเริ่มรอบหน้า)
+        order_queue.cancel_all()
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        logger.info("Engine stopped")
+
+    def halt(self, reason: str):
+        """หยุด Engine เพราะ error ร้ายแรง (เช่น license ไม่ active) แล้วแจ้งผู้รับ"""
+        logger.error(f"Engine halted: {reason}")
+        self.halt_reason = reason
+        self.stop()
+        self.publish(EVENT_HALTED, reason)
+
+    def stats(self) -> Dict:
+        """สถิติของทุก task (ใช้แสดงผล / status endpoint)"""
+        return {name: task.stats() for name, task in list(self.tasks.items())}
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._woke = tick_stream.wait(self._wait_timeout())
+            if self._stop_event.is_set():
+                break
+            now = clock.time()
+            for task in list(self.tasks.values()):
+                if self._stop_event.is_set():
+                    break
+                if not task.is_due(now):
+                    continue
+                if task.background:
+                    self._submit(task, now)
+                else:
+                    self._execute(task, now)
+            self._check_running(time.perf_counter())
+
+    def _wait_timeout(self) -> float:
+        """รอ tick ได้นานสุดจนถึง task ตามรอบเวลาตัวถัดไป (ไม่เกิน heartbeat)"""
+        now = clock.time()
+        timeout = tick_stream.heartbeat
+        for task in self.tasks.values():
+            if task.periodic and not task.background:
+                timeout = min(timeout, task.next_run - now)
+        return max(timeout, 0.0)
+
+    def _execute(self, task: EngineTask, now: float):
+        """รันบน trading thread"""
+        if task.deadline is not None and task.periodic and now - task.next_run > task.deadline:
+            task.late += 1
+        task.reschedule(now)
+        started = time.perf_counter()
+        try:
+            task.func()
+        except Exception as e:
+            self._on_error(task, e)
+        finally:
+            self._finish(task, time.perf_counter() - started)
+
+    def _submit(self, task: EngineTask, now: float):
+        """ส่งเข้า worker (ถ้ารอบก่อนยังไม่เสร็จ → ข้ามรอบนี้ ไม่ต่อคิว)"""
+        executor = self._executor
+        if executor is None:
+            return
+        if task.running_since is not None:
+            task.skipped += 1
+            return
+        if task.deadline is not None and task.periodic and now - task.next_run > task.deadline:
+            task.late += 1
+        task.running_since = time.perf_counter()
+        task.overrun_reported = False
+        # กันไม่ให้ถูกส่งซ้ำระหว่างรอ (schedule ของ status report อัพเดทหลังรายงานเสร็จ)
+        task.next_run = now + task.interval if task.interval is not None else float('inf')
+        try:
+            executor.submit(self._execute_background, task)
+        except RuntimeError:
+            task.running_since = None
+
+    def _execute_background(self, task: EngineTask):
+        try:
+            if self.running:  # งานที่ค้างคิวหลัง stop() ไม่ต้องรัน
+                task.func()
+        except Exception as e:
+            self._on_error(task, e)
+        finally:
+            if task.schedule is not None:
+                task.next_run = max(task.schedule(), clock.time() + MIN_RESCHEDULE)
+            duration = time.perf_counter() - task.running_since
+            task.running_since = None
+            self._finish(task, duration)
+
+    def _finish(self, task: EngineTask, duration: float):
+        task.runs += 1
+        task.last_duration = duration
+        task.max_duration = max(task.max_duration, duration)
+        if duration > task.budget and not task.overrun_reported:
+            task.overruns += 1
+            self._report_overrun(task, duration)
+        task.overrun_reported = False
+
+    def _check_running(self, now: float):
+        """รายงาน task บน worker ที่ยังไม่เสร็จแต่ใช้เวลาเกินงบแล้ว (เช่น HTTP ค้าง)"""
+        for task in list(self.tasks.values()):
+            started = task.running_since
+            if started is not None and not task.overrun_reported and now - started > task.budget:
+                task.overrun_reported = True
+                task.overruns += 1
+                self._report_overrun(task, now - started, still_running=True)
+
+    def _report_overrun(self, task: EngineTask, duration: float, still_running: bool = False):
+        now = time.monotonic()
+        if now - task.last_overrun_log < OVERRUN_LOG_INTERVAL:
+            return
+        task.last_overrun_log = now
+        state = "still running after" if still_running else "took"
+        logger.warning(f"Task '{task.name}' {state} {duration * 1000:.0f} ms "
+                       f"(budget {task.budget * 1000:.0f} ms, overruns: {task.overruns})")
+        self.publish(EVENT_OVERRUN, {'task': task.name, 'duration': duration, 'budget': task.budget,
+                                     'running': still_running})
+
+    def _on_error(self, task: EngineTask, error: Exception):
+        task.errors += 1
+        logger.error(f"Error in task '{task.name}': {error}", exc_info=not task.critical)
+        if task.critical:
+            self.halt(str(error))
+        else:
+            self.publish(EVENT_ERROR, (task.name, str(error)))
+
+    def _consume_wakeup(self) -> bool:
+        woke, self._woke = self._woke, False
+        return woke
+
+    def _on_position_events(self, events: List):
+        self._position_events.extend(events)
+
+    def _consume_position_events(self) -> bool:
+        return bool(self._position_events)
+
+    def _consume_bar_close(self) -> bool:
+        """True ครั้งเดียวต่อแท่ง (แท่งแรกหลังเริ่ม และทุกครั้งที่ tick ข้ามไปแท่งใหม่)"""
+        if self._bar is None or self._bar == self._analysed_bar:
+            return False
+        self._analysed_bar = self._bar
+        return True
+
+    def _run_tick(self):
+        """จับ snapshot แล้วอัพเดท Grid / HG (แทนรอบหลักของ monitoring loop เดิม)"""
+        snapshot = snapshot_provider.capture()
+        if snapshot is None:
+            logger.warning("Cannot get price info - skipping this cycle")
+            return
+        self.snapshot = snapshot
+        if snapshot.tick_time is not None:
+            self._bar = int(snapshot.tick_time.timestamp() // self._bar_seconds)
+        self._apply_pending_settings()
+
+        # อัพเดท Grid (Auto Settings แยกเป็น task analytics / auto_settings)
+        try:
+            grid_manager.update_grid_status(auto_settings=False)
+        except Exception as e:
+            logger.error(f"Error in grid manager: {e}", exc_info=True)
+            self.publish(EVENT_ERROR, ('grid', str(e)))
+
+        # อัพเดท HG (ถ้าเปิดใช้งาน) - ใช้ราคาจาก snapshot
+        if config.hg.enabled and self.hg_manager is not None:
+            try:
+                self.hg_manager.manage_multiple_hg(snapshot.bid)
+            except Exception as e:
+                logger.error(f"Error in HG manager: {e}", exc_info=True)
+                self.publish(EVENT_ERROR, ('hg', str(e)))
+
+    def _run_positions(self):
+        """ตรวจสอบความเสี่ยงเมื่อ positions เปลี่ยน (หรือครบ POSITIONS_MAX_AGE)"""
+        events, self._position_events = self._position_events, []
+        position_monitor.send_alerts()
+        if events:
+            self.publish(EVENT_POSITIONS, events)
+
+    def _run_display(self):
+        if self.snapshot is not None:
+            self.publish(EVENT_DISPLAY, self.snapshot)
+
+    def _run_analytics(self):
+        """คำนวณ signal ใหม่เมื่อปิดแท่ง (worker) แล้วส่ง Direction ให้ trading thread apply (Auto Mode)"""
+        if not config.grid.auto_mode or not grid_manager.active:
+            return
+        settings = grid_manager.calculate_auto_settings()
+        self.analysis = settings
+        self._pending_settings.append((grid_manager.apply_auto_direction, settings))
+        self.publish(EVENT_ANALYTICS, settings)
+
+    def _run_auto_settings(self):
+        """Grid/HG Distance ทุก 15 นาที จาก signal ล่าสุด (คำนวณบน worker, apply บน trading thread)"""
+        if not config.grid.auto_mode or not grid_manager.active:
+            return
+        settings = self.analysis or grid_manager.calculate_auto_settings()
+        self._pending_settings.append((grid_manager.apply_auto_distances, settings))
+
+    def _apply_pending_settings(self):
+        """
+        apply ผลของ analytics / auto_settings บน trading thread ระหว่างรอบ
+        (config.grid ไม่ถูกแก้กลางรอบ Grid / HG)
+        """
+        while self._pending_settings:
+            apply, settings = self._pending_settings.popleft()
+            try:
+                apply(settings)
+            except Exception as e:
+                logger.error(f"Error applying auto settings: {e}")
+                self.publish(EVENT_ERROR, ('auto settings', str(e)))
+
+    def _run_status_report(self):
+        if not mt5_connection.connected:
+            return
+        response = status_reporter.report()
+        self.publish(EVENT_STATUS, response)
+
+
+# สร้าง instance หลักสำหรับใช้งาน
+engine = Engine()
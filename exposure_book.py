@@ -0,0 +1,156 @@
+# exposure_book.py
+# ผลรวม volume / ราคาเฉลี่ย / จุดคุ้มทุน / P&L ต่อ role และฝั่ง อัพเดทแบบ incremental จาก position events
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+ROLES = ('grid', 'hg', 'other')
+SIDES = ('buy', 'sell')
+VOLUME_UNITS = 10 ** 8  # เก็บ volume เป็นจำนวนเต็ม (1e-8 lot) → บวก/ลบซ้ำๆ ไม่มี error สะสม
+
+
+def _units(volume: float) -> int:
+    return int(round(volume * VOLUME_UNITS))
+
+
+@dataclass
+class SideExposure:
+    """ผลรวมของ positions role / ฝั่งเดียวกัน"""
+    count: int = 0
+    units: int = 0  # volume รวม (หน่วย 1e-8 lot)
+    notional: float = 0.0  # Σ volume × open_price
+    floating_pnl: float = 0.0  # P&L จาก tick ล่าสุด (refresh_pnl)
+
+    @property
+    def volume(self) -> float:
+        return self.units / VOLUME_UNITS
+
+    @property
+    def average_price(self) -> Optional[float]:
+        """ราคาเปิดเฉลี่ยถ่วงน้ำหนักด้วย volume (= จุดคุ้มทุนของฝั่งนี้)"""
+        return self.notional / self.volume if self.units > 0 else None
+
+    def add(self, volume: float, open_price: float, sign: int = 1):
+        self.units += sign * _units(volume)
+        self.notional += sign * volume * open_price
+        if self.units <= 0:
+            self.units = 0
+            self.notional = 0.0
+
+
+class ExposureBook:
+    """
+    Exposure ต่อ (role, ฝั่ง) ที่ PositionMonitor อัพเดทจาก opened / closed / volume_changed events
+    - อ่านค่าได้ O(1) (GUI, HG lot sizing, risk checks ใช้ตัวเลขชุดเดียวกัน)
+    - floating P&L คำนวณจากราคาเฉลี่ยกับ tick ล่าสุด (refresh_pnl) ไม่ต้องวน positions
+    """
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[str, str], SideExposure] = {
+            (role, side): SideExposure() for role in ROLES for side in SIDES
+        }
+        self.value_per_price = 100.0  # P&L (สกุลเงินบัญชี) ต่อราคาเปลี่ยน 1.0 ต่อ 1 lot
+        self.last_bid: Optional[float] = None
+        self.last_ask: Optional[float] = None
+
+    def side(self, role: str, side: str) -> SideExposure:
+        return self.buckets[(role, side)]
+
+    def reset(self):
+        for bucket in self.buckets.values():
+            bucket.count = 0
+            bucket.units = 0
+            bucket.notional = 0.0
+            bucket.floating_pnl = 0.0
+
+    def rebuild(self, positions_by_role: Dict[str, Iterable[Dict]]):
+        """สร้างใหม่ทั้งหมดจาก positions แยก role (ใช้เมื่อจำนวนไม่ตรงกับ index)"""
+        self.reset()
+        for role, positions in positions_by_role.items():
+            for pos in positions:
+                bucket = self.buckets[(role, pos['type'])]
+                bucket.count += 1
+                bucket.add(pos['volume'], pos['open_price'])
+        self._refresh_from_last_tick()
+
+    def apply(self, kind: str, role: str, position: Dict, previous: Optional[Dict] = None):
+        """
+        อัพเดทจาก position event หนึ่งรายการ
+
+        Args:
+            kind: 'opened' / 'closed' / 'volume_changed' (อย่างอื่นไม่กระทบ exposure)
+            role: role ของ position
+            position: ข้อมูลล่าสุดของ position
+            previous: ข้อมูลรอบก่อน (กรณี volume_changed)
+        """
+        bucket = self.buckets.get((role, position['type']))
+        if bucket is None:
+            return
+        if kind == 'opened':
+            bucket.count += 1
+            bucket.add(position['volume'], position['open_price'])
+        elif kind == 'closed':
+            bucket.count = max(0, bucket.count - 1)
+            bucket.add(position['volume'], position['open_price'], sign=-1)
+        elif kind == 'volume_changed' and previous is not None:
+            bucket.add(previous['volume'] - position['volume'], position['open_price'], sign=-1)
+
+    def refresh_pnl(self, bid: float, ask: float, value_per_price: Optional[float] = None):
+        """
+        คำนวณ floating P&L ทุก bucket จาก tick (O(จำนวน bucket))
+
+        Args:
+            bid, ask: ราคาปัจจุบัน
+            value_per_price: tick_value / tick_size จาก SymbolSpec (None = ใช้ค่าล่าสุด)
+        """
+        if value_per_price:
+            self.value_per_price = value_per_price
+        self.last_bid = bid
+        self.last_ask = ask
+        for (role, side), bucket in self.buckets.items():
+            if bucket.units <= 0:
+                bucket.floating_pnl = 0.0
+            elif side == 'buy':
+                bucket.floating_pnl = (bid * bucket.volume - bucket.notional) * self.value_per_price
+            else:
+                bucket.floating_pnl = (bucket.notional - ask * bucket.volume) * self.value_per_price
+
+    def _refresh_from_last_tick(self):
+        if self.last_bid is not None and self.last_ask is not None:
+            self.refresh_pnl(self.last_bid, self.last_ask)
+
+    def count(self, role: Optional[str] = None) -> int:
+        return sum(bucket.count for (r, _), bucket in self.buckets.items() if role is None or r == role)
+
+    def pnl(self, role: Optional[str] = None) -> float:
+        """floating P&L รวมของ role (None = ทุก role)"""
+        return sum(bucket.floating_pnl for (r, _), bucket in self.buckets.items() if role is None or r == role)
+
+    def net_volume(self, role: str) -> float:
+        """volume สุทธิ (buy เป็นบวก, sell เป็นลบ)"""
+        return (self.buckets[(role, 'buy')].units - self.buckets[(role, 'sell')].units) / VOLUME_UNITS
+
+    def break_even(self, role: str) -> Optional[float]:
+        """
+        จุดคุ้มทุนรวมของทั้งสองฝั่ง (ราคาที่ P&L สุทธิ = 0) หรือ None ถ้า volume สุทธิเป็นศูนย์
+        """
+        buy = self.buckets[(role, 'buy')]
+        sell = self.buckets[(role, 'sell')]
+        net_units = buy.units - sell.units
+        if net_units == 0:
+            return None
+        return (buy.notional - sell.notional) / (net_units / VOLUME_UNITS)
+
+    def net_exposure(self, role: str) -> Dict:
+        """exposure สุทธิของ role (รูปแบบเดียวกับ PositionMonitor.get_net_grid_exposure)"""
+        buy = self.buckets[(role, 'buy')]
+        sell = self.buckets[(role, 'sell')]
+        return {
+            'buy_volume': buy.volume,
+            'sell_volume': sell.volume,
+            'net_volume': abs(buy.units - sell.units) / VOLUME_UNITS,
+            'net_direction': 'buy' if buy.units > sell.units else 'sell',
+            'buy_average_price': buy.average_price,
+            'sell_average_price': sell.average_price,
+            'break_even_price': self.break_even(role),
+        }
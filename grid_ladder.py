@@ -0,0 +1,86 @@
+# grid_ladder.py
+# ราคาเปิดของ Grid positions แยกฝั่ง เรียงไว้สำหรับค้นหาไม้สุดขอบ / ไม้ใกล้ราคาแบบ O(log n)
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+
+SIDES = ('buy', 'sell')
+
+
+class GridLadder:
+    """
+    ราคาเปิดของ Grid positions ต่อฝั่ง เรียงจากน้อยไปมาก (คู่กับ ticket)
+    - immutable: การเปลี่ยนแปลงคืน instance ใหม่ → snapshot ถือ reference ได้โดยไม่ต้อง copy
+    - PositionMonitor อัพเดทจาก opened / closed events (ไม่สร้างใหม่ทั้งหมดทุกรอบ)
+    """
+
+    __slots__ = ('prices', 'tickets')
+
+    def __init__(self, prices: Optional[Dict[str, List[float]]] = None,
+                 tickets: Optional[Dict[str, List[int]]] = None):
+        self.prices = prices or {side: [] for side in SIDES}
+        self.tickets = tickets or {side: [] for side in SIDES}
+
+    @classmethod
+    def from_positions(cls, by_side: Dict[str, Iterable[Dict]]) -> 'GridLadder':
+        """สร้างจาก positions แยกฝั่ง (เช่น PositionMonitor.grid_by_side)"""
+        prices = {}
+        tickets = {}
+        for side in SIDES:
+            entries = sorted((pos['open_price'], pos['ticket']) for pos in by_side.get(side, ()))
+            prices[side] = [price for price, _ in entries]
+            tickets[side] = [ticket for _, ticket in entries]
+        return cls(prices, tickets)
+
+    def updated(self, opened: Iterable[Dict], closed: Iterable[Dict]) -> 'GridLadder':
+        """
+        คืน ladder ใหม่หลังเพิ่ม positions ที่เปิดและลบ positions ที่ปิด
+
+        Args:
+            opened: positions ที่เปิดใหม่
+            closed: positions ที่ถูกปิด (ข้อมูลสุดท้ายที่เห็น)
+        """
+        prices = {side: list(values) for side, values in self.prices.items()}
+        tickets = {side: list(values) for side, values in self.tickets.items()}
+        for pos in closed:
+            side_prices, side_tickets = prices[pos['type']], tickets[pos['type']]
+            index = bisect_left(side_prices, pos['open_price'])
+            while index < len(side_prices) and side_prices[index] == pos['open_price']:
+                if side_tickets[index] == pos['ticket']:
+                    del side_prices[index]
+                    del side_tickets[index]
+                    break
+                index += 1
+        for pos in opened:
+            side_prices, side_tickets = prices[pos['type']], tickets[pos['type']]
+            index = bisect_right(side_prices, pos['open_price'])
+            side_prices.insert(index, pos['open_price'])
+            side_tickets.insert(index, pos['ticket'])
+        return GridLadder(prices, tickets)
+
+    def count(self, side: str) -> int:
+        return len(self.prices[side])
+
+    def lowest(self, side: str) -> Optional[float]:
+        """ราคาเปิดต่ำสุดของฝั่ง (None ถ้าไม่มีไม้)"""
+        prices = self.prices[side]
+        return prices[0] if prices else None
+
+    def highest(self, side: str) -> Optional[float]:
+        """ราคาเปิดสูงสุดของฝั่ง (None ถ้าไม่มีไม้)"""
+        prices = self.prices[side]
+        return prices[-1] if prices else None
+
+    def nearest(self, side: str, price: float) -> Optional[float]:
+        """ราคาเปิดที่ใกล้ price ที่สุดของฝั่ง (None ถ้าไม่มีไม้)"""
+        prices = self.prices[side]
+        if not prices:
+            return None
+        index = bisect_left(prices, price)
+        candidates = prices[max(0, index - 1):index + 1]
+        return min(candidates, key=lambda value: abs(value - price))
+
+    def has_within(self, side: str, price: float, distance: float) -> bool:
+        """มีไม้ที่ |open_price - price| < distance หรือไม่"""
+        nearest = self.nearest(side, price)
+        return nearest is not None and abs(nearest - price) < distance
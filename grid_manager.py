@@ -2,10 +2,14 @@
 # ไฟล์จัดการระบบ Grid Trading
 
 from typing import List, Dict, Optional
+from collections import deque
 import logging
-import time
+from clock import clock
 from mt5_connection import mt5_connection
-from position_monitor import position_monitor
+from position_monitor import position_monitor, EVENT_CLOSED
+from cycle_snapshot import snapshot_provider
+from order_queue import order_queue
+from position_roles import encode_comment
 from config import config
 
 # ตั้ง log level เป็น WARNING เพื่อลด log ที่ไม่สำคัญ
@@ -30,9 +34,24 @@ class GridManager:
         self.last_log_time = {}  # เก็บเวลา log ล่าสุดของแต่ละประเภท
         self.log_throttle_duration = 10  # วินาที (log ซ้ำได้ทุก 10 วินาที)
         
-        # 🆕 เก็บเวลาการวางออเดอร์ (ป้องกัน infinite loop)
-        self.last_order_placement_time = {}  # เก็บเวลาที่วางออเดอร์ล่าสุด
-        self.last_order_submission_time = {}  # เก็บเวลาที่ส่งออเดอร์ล่าสุด
+        # 🆕 ticket ของ Grid ที่ถูกปิด (ได้จาก closed events ของ PositionMonitor)
+        self.closed_tickets = deque()
+        self.full_sync_interval = 30  # วินาที (ตรวจ grid_levels ทั้งหมดเป็นระยะ กันกรณีเปิด-ปิดภายในรอบเดียว)
+        self.last_full_sync = 0.0
+        position_monitor.subscribe(self.on_position_events)
+    
+    def on_position_events(self, events: List):
+        """
+        รับ events จาก PositionMonitor แล้วเก็บ ticket ของ Grid ที่ถูกปิด
+        
+        Args:
+            events: List ของ PositionEvent
+        """
+        if not self.active:
+            return
+        for event in events:
+            if event.kind == EVENT_CLOSED and event.role == 'grid':
+                self.closed_tickets.append(event.ticket)
     
     def place_initial_orders(self, current_price: float):
         """
@@ -54,13 +73,13 @@ class GridManager:
             buy_tp_distance = config.pips_to_price(config.grid.buy_take_profit)
             buy_tp = current_price + buy_tp_distance
             
-            # ใช้ comment ตาม mode
-            comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
+            # ใช้ comment ตาม mode (level 0 = ไม้เริ่มต้น)
+            base_comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
             ticket = mt5_connection.place_order(
                 order_type='buy',
                 volume=config.grid.buy_lot_size,
                 tp=buy_tp,
-                comment=comment
+                comment=encode_comment(base_comment, 'buy', 0)
             )
             
             if ticket:
@@ -81,13 +100,13 @@ class GridManager:
             sell_tp_distance = config.pips_to_price(config.grid.sell_take_profit)
             sell_tp = current_price - sell_tp_distance
             
-            # ใช้ comment ตาม mode
-            comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
+            # ใช้ comment ตาม mode (level 0 = ไม้เริ่มต้น)
+            base_comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
             ticket = mt5_connection.place_order(
                 order_type='sell',
                 volume=config.grid.sell_lot_size,
                 tp=sell_tp,
-                comment=comment
+                comment=encode_comment(base_comment, 'sell', 0)
             )
             
             if ticket:
@@ -114,18 +133,33 @@ class GridManager:
         if not self.active:
             return
         
-        # อัพเดท positions
-        position_monitor.update_all_positions()
+        # ใช้ snapshot ของรอบนี้ (ไม่ดึง positions ซ้ำ)
+        snapshot = snapshot_provider.get()
+        if snapshot is None:
+            return
+        
+        # ดึง ticket ที่ถูกปิดจาก closed events (ไม่ต้องวน grid_levels ทุกรอบ)
+        closed_tickets = set()
+        while self.closed_tickets:
+            closed_tickets.add(self.closed_tickets.popleft())
+        
+        # ตรวจ grid_levels ทั้งหมดเป็นระยะ (กรณี position เปิดและปิดก่อนถูกเห็นใน snapshot)
+        now = clock.time()
+        if now - self.last_full_sync >= self.full_sync_interval:
+            self.last_full_sync = now
+            for grid in self.grid_levels:
+                if grid['placed'] and 'ticket' in grid and snapshot.get_position(grid['ticket']) is None:
+                    closed_tickets.add(grid['ticket'])
+        
+        if not closed_tickets:
+            return
         
         # ตรวจสอบ Grid positions ที่ถูกปิดแล้ว
         for grid in self.grid_levels[:]:  # ใช้ slice เพื่อป้องกันปัญหาเมื่อลบ element
             if not grid['placed'] or 'ticket' not in grid:
                 continue
             
-            # ตรวจสอบว่า position ยังเปิดอยู่หรือไม่
-            pos = position_monitor.get_position_by_ticket(grid['ticket'])
-            
-            if pos is None:
+            if grid['ticket'] in closed_tickets:
                 # Position ถูกปิดแล้ว (ถึง TP)
                 logger.debug(f"Grid closed: {grid['level_key']} at {grid['price']:.2f}")
                 
@@ -154,12 +188,12 @@ class GridManager:
             logger.warning("Pending orders found - waiting for completion")
             return None
         
-        # ดึงราคาปัจจุบัน
-        price_info = mt5_connection.get_current_price()
-        if not price_info:
+        # ดึงราคาและ positions จาก snapshot ของรอบนี้
+        snapshot = snapshot_provider.get()
+        if snapshot is None:
             return
         
-        current_price = price_info['bid']
+        current_price = snapshot.bid
         
         # ตรวจสอบโหมดที่ตั้งไว้
         if order_type == 'buy' and config.grid.direction not in ['buy', 'both']:
@@ -167,19 +201,10 @@ class GridManager:
         if order_type == 'sell' and config.grid.direction not in ['sell', 'both']:
             return
         
-        # อัพเดท positions เพื่อเช็คไม้ที่มีอยู่
-        position_monitor.update_all_positions()
-        grid_positions = position_monitor.grid_positions
-        
         # ตรวจสอบว่ามีไม้อยู่ใกล้ราคาปัจจุบันไหม (ป้องกันการวางซ้ำ)
         grid_distance_price = config.pips_to_price(config.grid.grid_distance)
         nearby_distance = grid_distance_price * 0.5
-        has_nearby_order = False
-        
-        for pos in grid_positions:
-            if pos['type'] == order_type and abs(pos['open_price'] - current_price) < nearby_distance:
-                has_nearby_order = True
-                break
+        has_nearby_order = snapshot.grid_ladder.has_within(order_type, current_price, nearby_distance)
         
         # ถ้าไม่มีไม้อยู่ใกล้ → วางไม้ใหม่
         if not has_nearby_order:
@@ -195,35 +220,28 @@ class GridManager:
     def check_recent_orders(self) -> bool:
         """
         ตรวจสอบว่ามี Order ใหม่เกิดขึ้นในระบบหรือไม่
-        - ตรวจสอบ order ที่วางไปเมื่อไม่นานมานี้ (ภายใน 5 วินาที) - ป้องกันการวางซ้ำถี่ๆ
+        - ตรวจสอบ order intent ที่ส่งสำเร็จแล้วแต่ snapshot ยังไม่เห็น position (ตาม trade_revision ไม่ใช่เวลา)
         - ตรวจสอบ order ที่อยู่ใน placed_orders - ป้องกันการวางซ้ำในรอบเดียวกัน
         
         Returns:
             True ถ้ามี Order ใหม่เกิดขึ้น
         """
         try:
-            import time
-            current_time = time.time()
+            # ใช้ positions จาก snapshot ของรอบนี้
+            snapshot = snapshot_provider.get()
+            if snapshot is None:
+                return False
             
-            # 🆕 เก็บเวลาที่วางออเดอร์ล่าสุด (ถ้ายังไม่มีให้สร้าง)
-            if not hasattr(self, 'last_order_placement_time'):
-                self.last_order_placement_time = {}
+            # 🆕 intent ที่ยังไม่สะท้อนใน snapshot (กำลังส่ง หรือส่งสำเร็จหลัง snapshot ถูกจับ)
+            if order_queue.has_unsettled('grid', snapshot.trade_revision):
+                logger.debug("Grid order intent not yet reflected in snapshot - preventing duplicate")
+                return True
             
-            # 🆕 ตรวจสอบว่ามีออเดอร์ที่วางไปเมื่อไม่นานมานี้ (ภายใน 5 วินาที) - ป้องกันการวางซ้ำถี่ๆ
-            recent_threshold = 5.0  # 5 วินาที
-            for order_type, placement_time in self.last_order_placement_time.items():
-                if (current_time - placement_time) < recent_threshold:
-                    logger.debug(f"Recent {order_type} order placed {current_time - placement_time:.1f}s ago - preventing duplicate")
-                    return True
-            
-            # อัพเดท positions
-            position_monitor.update_all_positions()
-            grid_positions = position_monitor.grid_positions
+            tickets_in_mt5 = snapshot.grid_tickets  # set → ตรวจสอบ O(1)
             
             # 🆕 ตรวจสอบว่ามี order ที่อยู่ใน placed_orders แต่ยังไม่อยู่ใน MT5 (กำลังดำเนินการ)
             # ป้องกันการวางซ้ำในรอบเดียวกัน
             if len(self.placed_orders) > 0:
-                tickets_in_mt5 = [pos['ticket'] for pos in grid_positions]
                 for level_key, ticket in self.placed_orders.items():
                     if ticket not in tickets_in_mt5:
                         # Order นี้ยังไม่อยู่ใน MT5 (อาจกำลังดำเนินการ) - ป้องกันการวางซ้ำ
@@ -231,7 +249,6 @@ class GridManager:
                         return True
             
             # ซิงค์ placed_orders กับ MT5 positions เพื่อลบ order ที่ปิดไปแล้ว
-            tickets_in_mt5 = [pos['ticket'] for pos in grid_positions]
             for level_key, ticket in list(self.placed_orders.items()):
                 if ticket not in tickets_in_mt5:
                     # Order นี้ปิดไปแล้ว ลบออก
@@ -246,36 +263,48 @@ class GridManager:
     
     def check_pending_orders(self) -> bool:
         """
-        ตรวจสอบว่ามี Order ที่กำลังดำเนินการอยู่หรือไม่ (ภายใน 3 วินาทีที่ผ่านมา)
-        ตรวจสอบเฉพาะ order ที่เพิ่งส่งไป ไม่ใช่ order เก่าทั้งหมด
+        ตรวจสอบว่ามี Grid order intent ที่ยังอยู่ในคิว / กำลังส่งอยู่หรือไม่
         
         Returns:
-            True ถ้ามี Order ที่กำลังดำเนินการ (ภายใน 3 วินาที)
+            True ถ้ามี Order ที่กำลังดำเนินการ
         """
-        try:
-            import time
-            current_time = time.time()
-            
-            # 🆕 เก็บเวลาที่ส่งออเดอร์ล่าสุด (ถ้ายังไม่มีให้สร้าง)
-            if not hasattr(self, 'last_order_submission_time'):
-                self.last_order_submission_time = {}
-            
-            # 🆕 ตรวจสอบว่ามีออเดอร์ที่ส่งไปเมื่อไม่นานมานี้ (ภายใน 3 วินาที)
-            pending_threshold = 3.0  # 3 วินาที
-            for order_type, submission_time in self.last_order_submission_time.items():
-                if (current_time - submission_time) < pending_threshold:
-                    logger.debug(f"Pending {order_type} order submitted {current_time - submission_time:.1f}s ago - waiting")
-                    return True
-            
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error checking pending orders: {e}")
-            return False  # 🆕 Return False เพื่อไม่ให้บล็อกการวางออเดอร์
-
+        if order_queue.has_active('grid'):
+            logger.debug("Pending grid order intent - waiting")
+            return True
+        return False
+    
+    def _on_grid_order_done(self, intent):
+        """
+        รับผลของ Grid order intent (เรียกจาก order_queue.dispatch_completed() ใน monitoring loop)
+        
+        Args:
+            intent: OrderIntent ที่เสร็จแล้ว
+        """
+        if not self.active:
+            return
+        side = intent.side
+        if not intent.ticket:
+            # ล้มเหลว ไม่ retry เพื่อป้องกัน hang (จะลองใหม่ในรอบถัดไป)
+            logger.debug(f"Order placement failed - will retry in next cycle")
+            return
+        
+        level_key = intent.context['level_key']
+        self.placed_orders[level_key] = intent.ticket
+        self.grid_levels.append({
+            'level_key': level_key,
+            'price': intent.price,
+            'type': side,
+            'tp': intent.tp,
+            'placed': True,
+            'ticket': intent.ticket
+        })
+        
+        logger.info(f"✓ New {side.upper()} placed: {intent.volume} lots at {intent.price:.2f} | TP: {intent.tp:.2f} | Ticket: {intent.ticket} | ID: {level_key}")
+    
     def place_new_buy_order(self, current_price: float):
         """
         วาง Buy order ใหม่ (ใช้ค่า Buy) พร้อมป้องกันการวางซ้ำ
+        ส่งเป็น order intent เข้า order_queue (ไม่รอ broker) → คืน Future ของ ticket หรือ None ถ้าไม่ได้ส่ง
         """
         # ตรวจสอบว่ามี Order ใหม่เกิดขึ้นในระบบหรือไม่
         if self.check_recent_orders():
@@ -296,18 +325,18 @@ class GridManager:
             self.placing_order_lock = True
             
             # เช็คซ้ำอีกครั้งว่ามีไม้ใกล้เคียงหรือไม่ (ป้องกันการวางซ้ำ)
-            position_monitor.update_all_positions()
-            grid_positions = position_monitor.grid_positions
+            snapshot = snapshot_provider.get()
+            if snapshot is None:
+                return
             
             buy_grid_distance_price = config.pips_to_price(config.grid.buy_grid_distance)
             min_distance = buy_grid_distance_price * 0.3  # ลดเหลือ 30% เพื่อป้องกันเข้มงวดขึ้น
             
-            for pos in grid_positions:
-                if pos['type'] == 'buy':
-                    distance = abs(pos['open_price'] - current_price)
-                    if distance < min_distance:
-                        logger.debug(f"⚠️ DUPLICATE PREVENTED: BUY order too close ({distance:.2f} < {min_distance:.2f}) to existing position at {pos['open_price']:.2f}")
-                        return
+            nearest_price = snapshot.grid_ladder.nearest('buy', current_price)
+            if nearest_price is not None and abs(nearest_price - current_price) < min_distance:
+                distance = abs(nearest_price - current_price)
+                logger.debug(f"⚠️ DUPLICATE PREVENTED: BUY order too close ({distance:.2f} < {min_distance:.2f}) to existing position at {nearest_price:.2f}")
+                return
             
             tp_distance = config.pips_to_price(config.grid.buy_take_profit)
             tp_price = current_price + tp_distance
@@ -321,46 +350,28 @@ class GridManager:
                 self.order_counter += 1
                 level_key = f"buy_{self.order_counter}"
             
-            # ใช้ comment ตาม mode
-            comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
+            # ใช้ comment ตาม mode (ต่อท้ายด้วยฝั่ง + ลำดับไม้ เพื่อกู้ level_key ได้หลังรีสตาร์ท)
+            base_comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
+            comment = encode_comment(base_comment, 'buy', self.order_counter)
             
-            # 🆕 บันทึกเวลาที่ส่งออเดอร์ (ป้องกัน infinite loop)
-            import time
-            self.last_order_submission_time['buy'] = time.time()
-            
-            # วาง order
-            ticket = mt5_connection.place_order(
-                order_type='buy',
+            # ส่ง order intent เข้าคิว (ผลลัพธ์บันทึกใน _on_grid_order_done)
+            return order_queue.submit(
+                side='buy',
                 volume=config.grid.buy_lot_size,
+                role='grid',
+                price=current_price,
                 tp=tp_price,
-                comment=comment
+                comment=comment,
+                context={'level_key': level_key},
+                on_done=self._on_grid_order_done
             )
-            
-            # ตรวจสอบว่า Order สำเร็จจริงหรือไม่
-            if ticket:
-                # 🆕 บันทึกเวลาที่วางออเดอร์สำเร็จ (ป้องกัน infinite loop)
-                self.last_order_placement_time['buy'] = time.time()
-                # สำเร็จแล้ว
-                self.placed_orders[level_key] = ticket
-                self.grid_levels.append({
-                    'level_key': level_key,
-                    'price': current_price,
-                    'type': 'buy',
-                    'tp': tp_price,
-                    'placed': True,
-                    'ticket': ticket
-                })
-                
-                logger.info(f"✓ New BUY placed: {config.grid.buy_lot_size} lots at {current_price:.2f} | TP: {tp_price:.2f} | Ticket: {ticket} | ID: {level_key}")
-            else:
-                # ล้มเหลว ไม่ retry เพื่อป้องกัน hang (จะลองใหม่ในรอบถัดไป)
-                logger.debug(f"Order placement failed - will retry in next cycle")
         finally:
             self.placing_order_lock = False
     
     def place_new_sell_order(self, current_price: float):
         """
         วาง Sell order ใหม่ (ใช้ค่า Sell) พร้อมป้องกันการวางซ้ำ
+        ส่งเป็น order intent เข้า order_queue (ไม่รอ broker) → คืน Future ของ ticket หรือ None ถ้าไม่ได้ส่ง
         """
         # ตรวจสอบว่ามี Order ใหม่เกิดขึ้นในระบบหรือไม่
         if self.check_recent_orders():
@@ -381,18 +392,18 @@ class GridManager:
             self.placing_order_lock = True
             
             # เช็คซ้ำอีกครั้งว่ามีไม้ใกล้เคียงหรือไม่ (ป้องกันการวางซ้ำ)
-            position_monitor.update_all_positions()
-            grid_positions = position_monitor.grid_positions
+            snapshot = snapshot_provider.get()
+            if snapshot is None:
+                return
             
             sell_grid_distance_price = config.pips_to_price(config.grid.sell_grid_distance)
             min_distance = sell_grid_distance_price * 0.3  # ลดเหลือ 30% เพื่อป้องกันเข้มงวดขึ้น
             
-            for pos in grid_positions:
-                if pos['type'] == 'sell':
-                    distance = abs(pos['open_price'] - current_price)
-                    if distance < min_distance:
-                        logger.debug(f"⚠️ DUPLICATE PREVENTED: SELL order too close ({distance:.2f} < {min_distance:.2f}) to existing position at {pos['open_price']:.2f}")
-                        return
+            nearest_price = snapshot.grid_ladder.nearest('sell', current_price)
+            if nearest_price is not None and abs(nearest_price - current_price) < min_distance:
+                distance = abs(nearest_price - current_price)
+                logger.debug(f"⚠️ DUPLICATE PREVENTED: SELL order too close ({distance:.2f} < {min_distance:.2f}) to existing position at {nearest_price:.2f}")
+                return
             
             tp_distance = config.pips_to_price(config.grid.sell_take_profit)
             tp_price = current_price - tp_distance
@@ -406,53 +417,40 @@ class GridManager:
                 self.order_counter += 1
                 level_key = f"sell_{self.order_counter}"
             
-            # ใช้ comment ตาม mode
-            comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
-            
-            # 🆕 บันทึกเวลาที่ส่งออเดอร์ (ป้องกัน infinite loop)
-            import time
-            self.last_order_submission_time['sell'] = time.time()
+            # ใช้ comment ตาม mode (ต่อท้ายด้วยฝั่ง + ลำดับไม้ เพื่อกู้ level_key ได้หลังรีสตาร์ท)
+            base_comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
+            comment = encode_comment(base_comment, 'sell', self.order_counter)
             
-            # วาง order
-            ticket = mt5_connection.place_order(
-                order_type='sell',
+            # ส่ง order intent เข้าคิว (ผลลัพธ์บันทึกใน _on_grid_order_done)
+            return order_queue.submit(
+                side='sell',
                 volume=config.grid.sell_lot_size,
+                role='grid',
+                price=current_price,
                 tp=tp_price,
-                comment=comment
+                comment=comment,
+                context={'level_key': level_key},
+                on_done=self._on_grid_order_done
             )
-            
-            # ตรวจสอบว่า Order สำเร็จจริงหรือไม่
-            if ticket:
-                # 🆕 บันทึกเวลาที่วางออเดอร์สำเร็จ (ป้องกัน infinite loop)
-                self.last_order_placement_time['sell'] = time.time()
-                # สำเร็จแล้ว
-                self.placed_orders[level_key] = ticket
-                self.grid_levels.append({
-                    'level_key': level_key,
-                    'price': current_price,
-                    'type': 'sell',
-                    'tp': tp_price,
-                    'placed': True,
-                    'ticket': ticket
-                })
-                
-                logger.info(f"✓ New SELL placed: {config.grid.sell_lot_size} lots at {current_price:.2f} | TP: {tp_price:.2f} | Ticket: {ticket} | ID: {level_key}")
-            else:
-                # ล้มเหลว ไม่ retry เพื่อป้องกัน hang (จะลองใหม่ในรอบถัดไป)
-                logger.debug(f"Order placement failed - will retry in next cycle")
         finally:
             self.placing_order_lock = False
     
     
-    def update_grid_status(self):
+    def update_grid_status(self, auto_settings: bool = True):
         """
         อัพเดทสถานะ Grid ทั้งหมด
+        
+        Args:
+            auto_settings: False = ไม่เช็ค Auto Settings ในรอบนี้ (Engine แยกไปทำเป็น task ของตัวเอง)
         """
         if not self.active:
             return
         
+        # ผลของ order intents ที่ส่งเสร็จแล้ว (บันทึก ticket ลง grid_levels)
+        order_queue.dispatch_completed()
+        
         # 🆕 ถ้าเปิด Auto Mode → ตรวจสอบว่าควรอัพเดทค่าหรือยัง
-        if config.grid.auto_mode:
+        if config.grid.auto_mode and auto_settings:
             self.check_and_update_auto_settings()
         
         # ติดตาม Grid positions
@@ -470,65 +468,81 @@ class GridManager:
         - Direction: อัพเดททันทีเมื่อ signal เปลี่ยน (ไม่ต้องรอ 15 นาที)
         - Grid/HG Distance: อัพเดททุก 15 นาที (เพราะไม่ค่อยเปลี่ยนบ่อย)
         """
-        from datetime import datetime, timedelta
-        
         try:
-            current_time = datetime.now()
-            
             # คำนวณค่าใหม่จาก signal (ทุกครั้ง)
-            from auto_config_manager import auto_config_manager
-            new_settings = auto_config_manager.calculate_auto_settings(
-                risk_profile=config.grid.risk_profile
-            )
-            
-            # 🆕 ตรวจสอบ Direction: อัพเดททันทีเมื่อ signal เปลี่ยน
-            new_direction = new_settings['direction']
-            current_direction = config.grid.direction
+            new_settings = self.calculate_auto_settings()
             
-            if new_direction != current_direction:
-                logger.info(f"🔄 Auto Mode: Direction changed: {current_direction} → {new_direction}")
-                logger.info(f"   Signal: {new_settings.get('confidence', 'UNKNOWN')} confidence")
-                
-                # อัพเดท direction ทันที
-                config.update_grid_settings(direction=new_direction)
-                logger.info(f"✓ Direction updated immediately: {new_direction}")
-            
-            # ตรวจสอบว่าควรอัพเดท Grid/HG Distance หรือยัง (ทุก 15 นาที)
-            should_update_distances = False
-            if config.grid.last_auto_update is None:
-                should_update_distances = True
-            else:
-                time_diff = (current_time - config.grid.last_auto_update).total_seconds()
-                should_update_distances = time_diff >= 900  # 15 minutes = 900 seconds
+            self.apply_auto_direction(new_settings)
             
-            if should_update_distances:
-                logger.info("🔄 Auto Mode: Updating Grid/HG distances...")
-                
-                # อัพเดท Grid Distance
-                config.update_grid_settings(
-                    buy_grid_distance=new_settings['buy_grid_distance'],
-                    sell_grid_distance=new_settings['sell_grid_distance']
-                )
-                
-                # อัพเดท HG Distance
-                config.update_hg_settings(
-                    buy_hg_distance=new_settings['buy_hg_distance'],
-                    sell_hg_distance=new_settings['sell_hg_distance'],
-                    buy_hg_sl_trigger=new_settings['buy_hg_sl_trigger'],
-                    sell_hg_sl_trigger=new_settings['sell_hg_sl_trigger']
-                )
-                
-                config.grid.last_auto_update = current_time
-                
-                # บันทึกลงไฟล์
-                config.save_to_file()
-                
-                logger.info(f"✓ Auto settings updated: Grid={new_settings['buy_grid_distance']}pips, "
-                           f"HG={new_settings['buy_hg_distance']}pips")
+            if self.auto_distances_due():
+                self.apply_auto_distances(new_settings)
                 
         except Exception as e:
             logger.error(f"Error updating auto settings: {e}")
     
+    def calculate_auto_settings(self) -> Dict:
+        """คำนวณค่า Auto Settings จาก signal ปัจจุบัน (ยังไม่ apply)"""
+        from auto_config_manager import auto_config_manager
+        return auto_config_manager.calculate_auto_settings(
+            risk_profile=config.grid.risk_profile
+        )
+    
+    def apply_auto_direction(self, new_settings: Dict):
+        """
+        🆕 อัพเดท Direction ทันทีเมื่อ signal เปลี่ยน
+        
+        Args:
+            new_settings: ผลจาก calculate_auto_settings()
+        """
+        new_direction = new_settings['direction']
+        current_direction = config.grid.direction
+        
+        if new_direction != current_direction:
+            logger.info(f"🔄 Auto Mode: Direction changed: {current_direction} → {new_direction}")
+            logger.info(f"   Signal: {new_settings.get('confidence', 'UNKNOWN')} confidence")
+            
+            # อัพเดท direction ทันที
+            config.update_grid_settings(direction=new_direction)
+            logger.info(f"✓ Direction updated immediately: {new_direction}")
+    
+    def auto_distances_due(self) -> bool:
+        """ตรวจสอบว่าควรอัพเดท Grid/HG Distance หรือยัง (ทุก 15 นาที)"""
+        if config.grid.last_auto_update is None:
+            return True
+        time_diff = (clock.now() - config.grid.last_auto_update).total_seconds()
+        return time_diff >= 900  # 15 minutes = 900 seconds
+    
+    def apply_auto_distances(self, new_settings: Dict):
+        """
+        อัพเดท Grid/HG Distance และบันทึกลงไฟล์
+        
+        Args:
+            new_settings: ผลจาก calculate_auto_settings()
+        """
+        logger.info("🔄 Auto Mode: Updating Grid/HG distances...")
+        
+        # อัพเดท Grid Distance
+        config.update_grid_settings(
+            buy_grid_distance=new_settings['buy_grid_distance'],
+            sell_grid_distance=new_settings['sell_grid_distance']
+        )
+        
+        # อัพเดท HG Distance
+        config.update_hg_settings(
+            buy_hg_distance=new_settings['buy_hg_distance'],
+            sell_hg_distance=new_settings['sell_hg_distance'],
+            buy_hg_sl_trigger=new_settings['buy_hg_sl_trigger'],
+            sell_hg_sl_trigger=new_settings['sell_hg_sl_trigger']
+        )
+        
+        config.grid.last_auto_update = clock.now()
+        
+        # บันทึกลงไฟล์
+        config.save_to_file()
+        
+        logger.info(f"✓ Auto settings updated: Grid={new_settings['buy_grid_distance']}pips, "
+                   f"HG={new_settings['buy_hg_distance']}pips")
+    
     def _should_log(self, log_key: str) -> bool:
         """
         เช็คว่าควร log หรือไม่ (throttling)
@@ -539,8 +553,7 @@ class GridManager:
         Returns:
             True ถ้าควร log
         """
-        import time
-        current_time = time.time()
+        current_time = clock.time()
         
         if log_key not in self.last_log_time:
             self.last_log_time[log_key] = current_time
@@ -561,11 +574,12 @@ class GridManager:
         if not self.active:
             return
         
-        # อัพเดท positions
-        position_monitor.update_all_positions()
+        snapshot = snapshot_provider.get()
+        if snapshot is None:
+            return
         
         # นับจำนวน Grid positions ที่เปิดอยู่
-        grid_positions = position_monitor.grid_positions
+        grid_positions = snapshot.grid_positions
         
         # ถ้าไม่มีไม้เลย และ grid_levels ว่างเปล่า
         if len(grid_positions) == 0 and len(self.grid_levels) == 0:
@@ -575,13 +589,7 @@ class GridManager:
                 logger.info("⚠️ No Grid positions found - Auto Restarting...")
                 logger.info("=" * 60)
             
-            # ดึงราคาปัจจุบัน
-            price_info = mt5_connection.get_current_price()
-            if not price_info:
-                logger.error("Cannot get current price for restart")
-                return
-            
-            current_price = price_info['bid']
+            current_price = snapshot.bid
             
             # วางไม้ใหม่
             self.place_initial_orders(current_price)
@@ -598,37 +606,23 @@ class GridManager:
         if not self.active:
             return
         
-        # ดึงราคาปัจจุบัน
-        price_info = mt5_connection.get_current_price()
-        if not price_info:
+        # ดึงราคาและ positions จาก snapshot ของรอบนี้
+        snapshot = snapshot_provider.get()
+        if snapshot is None:
             return
         
-        current_price = price_info['bid']
+        current_price = snapshot.bid
         
         # ใช้ระยะห่างแยก Buy/Sell
         buy_grid_distance_price = config.pips_to_price(config.grid.buy_grid_distance)
         sell_grid_distance_price = config.pips_to_price(config.grid.sell_grid_distance)
         
-        # อัพเดท positions
-        position_monitor.update_all_positions()
-        grid_positions = position_monitor.grid_positions
-        
-        # หาไม้ Buy และ Sell ล่าสุดจาก MT5 positions
-        latest_buy_price = None
-        latest_sell_price = None
-        has_buy_position = False
-        has_sell_position = False
-        
-        for pos in grid_positions:
-            if pos['type'] == 'buy' and (config.mt5.comment_grid in pos['comment'] or config.mt5.comment_auto in pos['comment']):
-                has_buy_position = True
-                if latest_buy_price is None or pos['open_price'] > latest_buy_price:
-                    latest_buy_price = pos['open_price']
-            
-            if pos['type'] == 'sell' and (config.mt5.comment_grid in pos['comment'] or config.mt5.comment_auto in pos['comment']):
-                has_sell_position = True
-                if latest_sell_price is None or pos['open_price'] < latest_sell_price:
-                    latest_sell_price = pos['open_price']
+        # หาไม้ Buy และ Sell ล่าสุดจาก MT5 positions (ใช้ GridLadder ของ snapshot: O(1) / O(log n))
+        ladder = snapshot.grid_ladder
+        has_buy_position = ladder.count('buy') > 0
+        has_sell_position = ladder.count('sell') > 0
+        latest_buy_price = ladder.highest('buy')
+        latest_sell_price = ladder.lowest('sell')
         
         # 🆕 เก็บ flag ว่า Grid Entry วางออเดอร์ไปแล้วหรือไม่ (ป้องกัน Recovery Entry ทับซ้อน)
         grid_entry_placed_buy = False
@@ -654,12 +648,8 @@ class GridManager:
                         logger.debug(f"[Grid Entry] BUY ladder: price moved {buy_grid_distance_price:.2f} → add BUY at {current_price:.2f}")
             
             if should_place_buy:
-                has_nearby_buy = False
                 nearby_distance = buy_grid_distance_price * 0.5
-                for pos in grid_positions:
-                    if pos['type'] == 'buy' and abs(pos['open_price'] - current_price) < nearby_distance:
-                        has_nearby_buy = True
-                        break
+                has_nearby_buy = ladder.has_within('buy', current_price, nearby_distance)
                 if not has_nearby_buy:
                     self.place_new_buy_order(current_price)
                     grid_entry_placed_buy = True
@@ -684,12 +674,8 @@ class GridManager:
                         logger.debug(f"[Grid Entry] SELL ladder: price moved {sell_grid_distance_price:.2f} → add SELL at {current_price:.2f}")
             
             if should_place_sell:
-                has_nearby_sell = False
                 nearby_distance = sell_grid_distance_price * 0.5
-                for pos in grid_positions:
-                    if pos['type'] == 'sell' and abs(pos['open_price'] - current_price) < nearby_distance:
-                        has_nearby_sell = True
-                        break
+                has_nearby_sell = ladder.has_within('sell', current_price, nearby_distance)
                 if not has_nearby_sell:
                     self.place_new_sell_order(current_price)
                     grid_entry_placed_sell = True
@@ -736,11 +722,10 @@ class GridManager:
         buy_grid_distance_price = config.pips_to_price(config.grid.buy_grid_distance)
         sell_grid_distance_price = config.pips_to_price(config.grid.sell_grid_distance)
         
-        # อัพเดท positions เพื่อดูกำไร/ขาดทุน
-        position_monitor.update_all_positions()
-        
-        # ตรวจสอบ Grid positions ทั้งหมดจาก MT5
-        grid_positions = position_monitor.grid_positions
+        # ใช้ positions จาก snapshot ของรอบนี้
+        snapshot = snapshot_provider.get()
+        if snapshot is None:
+            return
         
         # กำหนด comment ที่ใช้ตาม mode
         grid_comment = config.mt5.comment_auto if config.grid.auto_mode else config.mt5.comment_grid
@@ -748,27 +733,18 @@ class GridManager:
         # แก้ไม้ Buy (Recovery Entry - เมื่อไม้ Buy ขาดทุน)
         if config.grid.direction in ['buy', 'both']:
             # หาไม้ Buy ล่าสุด (ราคาต่ำสุด) - ไม้ที่ขาดทุนมากที่สุด
-            latest_buy = None
-            for pos in grid_positions:
-                if pos['type'] == 'buy' and (config.mt5.comment_grid in pos['comment'] or config.mt5.comment_auto in pos['comment']):
-                    if latest_buy is None or pos['open_price'] < latest_buy['open_price']:
-                        latest_buy = pos
+            latest_buy_price = snapshot.grid_ladder.lowest('buy')
             
             # ตรวจสอบว่าควรออก Buy เพิ่มไหม (Recovery Entry: เมื่อไม้ Buy ขาดทุน)
-            if latest_buy:
+            if latest_buy_price is not None:
                 # ราคาลงจากไม้ Buy → ไม้ Buy ขาดทุน
-                distance_from_latest = config.price_to_pips(latest_buy['open_price'] - current_price)
+                distance_from_latest = config.price_to_pips(latest_buy_price - current_price)
                 
                 # 🆕 Recovery Entry: วางเมื่อราคาลงจากไม้ Buy >= Buy Grid Distance (ไม้ขาดทุน)
                 if distance_from_latest >= config.grid.buy_grid_distance:
                     # ตรวจสอบว่ามีไม้ Buy อยู่ใกล้ราคาปัจจุบันไหม (ป้องกันการวางซ้ำ)
                     nearby_distance = buy_grid_distance_price * 0.5
-                    has_nearby_buy = False
-                    
-                    for pos in grid_positions:
-                        if pos['type'] == 'buy' and abs(pos['open_price'] - current_price) < nearby_distance:
-                            has_nearby_buy = True
-                            break
+                    has_nearby_buy = snapshot.grid_ladder.has_within('buy', current_price, nearby_distance)
                     
                     if not has_nearby_buy:
                         self.place_new_buy_order(current_price)
@@ -780,27 +756,18 @@ class GridManager:
         # แก้ไม้ Sell (Recovery Entry - เมื่อไม้ Sell ขาดทุน)
         if config.grid.direction in ['sell', 'both']:
             # หาไม้ Sell ล่าสุด (ราคาสูงสุด) - ไม้ที่ขาดทุนมากที่สุด
-            latest_sell = None
-            for pos in grid_positions:
-                if pos['type'] == 'sell' and (config.mt5.comment_grid in pos['comment'] or config.mt5.comment_auto in pos['comment']):
-                    if latest_sell is None or pos['open_price'] > latest_sell['open_price']:
-                        latest_sell = pos
+            latest_sell_price = snapshot.grid_ladder.highest('sell')
             
             # ตรวจสอบว่าควรออก Sell เพิ่มไหม (Recovery Entry: เมื่อไม้ Sell ขาดทุน)
-            if latest_sell:
+            if latest_sell_price is not None:
                 # ราคาขึ้นจากไม้ Sell → ไม้ Sell ขาดทุน
-                distance_from_latest = config.price_to_pips(current_price - latest_sell['open_price'])
+                distance_from_latest = config.price_to_pips(current_price - latest_sell_price)
                 
                 # 🆕 Recovery Entry: วางเมื่อราคาขึ้นจากไม้ Sell >= Sell Grid Distance (ไม้ขาดทุน)
                 if distance_from_latest >= config.grid.sell_grid_distance:
                     # ตรวจสอบว่ามีไม้ Sell อยู่ใกล้ราคาปัจจุบันไหม (ป้องกันการวางซ้ำ)
                     nearby_distance = sell_grid_distance_price * 0.5
-                    has_nearby_sell = False
-                    
-                    for pos in grid_positions:
-                        if pos['type'] == 'sell' and abs(pos['open_price'] - current_price) < nearby_distance:
-                            has_nearby_sell = True
-                            break
+                    has_nearby_sell = snapshot.grid_ladder.has_within('sell', current_price, nearby_distance)
                     
                     if not has_nearby_sell:
                         self.place_new_sell_order(current_price)
@@ -816,11 +783,10 @@ class GridManager:
         """
         logger.info("Restoring existing Grid positions...")
         
-        # อัพเดท positions
-        position_monitor.update_all_positions()
+        snapshot = snapshot_provider.get()
         
         # ดึง Grid positions ที่มีอยู่
-        grid_positions = position_monitor.grid_positions
+        grid_positions = snapshot.grid_positions if snapshot else ()
         
         if not grid_positions:
             logger.info("No existing Grid positions found")
@@ -829,27 +795,34 @@ class GridManager:
         # จดจำ Grid positions ที่มีอยู่
         restored_count = 0
         for pos in grid_positions:
-            # ตรวจสอบว่าเป็น Grid position หรือไม่ (จาก comment)
-            comment = pos['comment']
-            if config.mt5.comment_grid in comment or config.mt5.comment_auto in comment:
-                # สร้าง level_key ใหม่โดยใช้ ticket number (เพราะ comment ไม่มี level_key แล้ว)
+            # level_key จาก metadata ใน comment (comment แบบเดิมไม่มี level → ใช้ ticket number)
+            info = position_monitor.get_comment_info(pos['ticket'])
+            if info is not None and info.level is not None and info.side == pos['type']:
+                if info.level == 0:
+                    level_key = f"initial_{pos['type']}"
+                else:
+                    level_key = f"{pos['type']}_{info.level}"
+                    self.order_counter = max(self.order_counter, info.level)
+            else:
                 level_key = f"{pos['type']}_{pos['ticket']}"
-                
-                # บันทึกลง placed_orders
-                self.placed_orders[level_key] = pos['ticket']
-                
-                # เพิ่มลง grid_levels
-                self.grid_levels.append({
-                    'level_key': level_key,
-                    'price': pos['open_price'],
-                    'type': pos['type'],
-                    'tp': pos['tp'],
-                    'placed': True,
-                    'ticket': pos['ticket']
-                })
-                
-                restored_count += 1
-                logger.info(f"Restored Grid: {level_key} | Ticket: {pos['ticket']} | Price: {pos['open_price']:.2f}")
+            if level_key in self.placed_orders:
+                level_key = f"{pos['type']}_{pos['ticket']}"
+            
+            # บันทึกลง placed_orders
+            self.placed_orders[level_key] = pos['ticket']
+            
+            # เพิ่มลง grid_levels
+            self.grid_levels.append({
+                'level_key': level_key,
+                'price': pos['open_price'],
+                'type': pos['type'],
+                'tp': pos['tp'],
+                'placed': True,
+                'ticket': pos['ticket']
+            })
+            
+            restored_count += 1
+            logger.info(f"Restored Grid: {level_key} | Ticket: {pos['ticket']} | Price: {pos['open_price']:.2f}")
         
         logger.info(f"✓ Restored {restored_count} Grid positions")
         return restored_count
@@ -858,13 +831,16 @@ class GridManager:
         """
         เริ่มต้นระบบ Grid Trading
         """
-        price_info = mt5_connection.get_current_price()
-        if not price_info:
+        # จับ snapshot ใหม่ตอนเริ่มระบบ
+        snapshot = snapshot_provider.capture()
+        if not snapshot:
             logger.error("Cannot get current price")
             return False
         
-        self.start_price = price_info['bid']
+        self.start_price = snapshot.bid
         self.active = True
+        self.closed_tickets.clear()
+        self.last_full_sync = 0.0
         
         # จดจำ Grid positions ที่มีอยู่แล้ว (ถ้ามี)
         restored_count = self.restore_existing_positions()
@@ -901,6 +877,7 @@ class GridManager:
         # รีเซ็ต
         self.grid_levels = []
         self.placed_orders = {}
+        self.closed_tickets.clear()
     
     def get_total_grid_exposure(self) -> Dict:
         """
@@ -909,7 +886,7 @@ class GridManager:
         Returns:
             Dict ที่มีข้อมูล exposure
         """
-        position_monitor.update_all_positions()
+        snapshot_provider.get()
         return position_monitor.get_net_grid_exposure()
     
     def get_grid_status(self) -> Dict:
@@ -0,0 +1,479 @@
+# grid_sweep.py
+# Backtest แบบ vectorized (NumPy) สำหรับ sweep พารามิเตอร์ Grid: distance / TP / lot / risk profile
+
+from typing import Dict, Iterable, List, Optional, Sequence
+import argparse
+import itertools
+import logging
+import time
+import numpy as np
+from config import config
+from auto_config_manager import RISK_PROFILES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CONTRACT_SIZE = 100.0  # XAUUSD: 1 lot = 100 oz
+
+# ผลลัพธ์ต่อ 1 ชุดพารามิเตอร์
+SWEEP_RESULT_DTYPE = np.dtype([
+    ('buy_grid_distance', '<f8'), ('sell_grid_distance', '<f8'), ('take_profit', '<f8'),
+    ('lot', '<f8'), ('grid_atr_multiplier', '<f8'),
+    ('net_profit', '<f8'), ('realized', '<f8'), ('floating', '<f8'),
+    ('max_drawdown', '<f8'), ('min_margin_level', '<f8'),
+    ('trades', '<i8'), ('max_positions', '<i8'), ('overflow', '<i8'),
+    ('blown', '?'), ('blown_at', '<i8'),
+])
+
+
+def compress_path(prices: np.ndarray, resolution: float) -> np.ndarray:
+    """
+    ลดจำนวนจุดราคาโดยเก็บเฉพาะจุดที่ราคาเปลี่ยนระดับ (ความละเอียด resolution)
+
+    Args:
+        prices: ราคา (เรียงตามเวลา)
+        resolution: ความละเอียดราคา (หน่วยราคา) ถ้า <= 0 จะไม่บีบอัด
+
+    Returns:
+        index ของจุดที่เก็บไว้
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if resolution <= 0 or len(prices) == 0:
+        return np.arange(len(prices))
+    levels = np.floor(prices / resolution)
+    keep = np.empty(len(prices), dtype=bool)
+    keep[0] = True
+    keep[1:] = levels[1:] != levels[:-1]
+    keep[-1] = True
+    return np.flatnonzero(keep)
+
+
+def atr_pips_series(rates: np.ndarray, timeframe_secs: int = 900, period: int = 14) -> Dict[str, np.ndarray]:
+    """
+    คำนวณ ATR (SMA ของ True Range แบบเดียวกับ ATRCalculator) บน timeframe ที่ resample จาก rates
+
+    Args:
+        rates: structured array (time/open/high/low/close) เช่น M1
+        timeframe_secs: timeframe ที่ใช้คำนวณ ATR (default M15)
+        period: ATR period
+
+    Returns:
+        Dict ที่มี 'time' (เวลาปิดแท่ง) และ 'atr' (pips) ของแท่งที่ปิดแล้ว
+    """
+    rates = np.asarray(rates)
+    bucket = rates['time'] // timeframe_secs
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    high = np.maximum.reduceat(rates['high'], starts)
+    low = np.minimum.reduceat(rates['low'], starts)
+    close = rates['close'][np.r_[starts[1:] - 1, len(rates) - 1]]
+    close_time = (bucket[starts] + 1) * timeframe_secs
+
+    prev_close = close[:-1]
+    tr = np.maximum.reduce([high[1:] - low[1:], np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)])
+    if len(tr) < period:
+        return {'time': np.empty(0, dtype=np.int64), 'atr': np.empty(0)}
+    csum = np.cumsum(np.r_[0.0, tr])
+    atr = (csum[period:] - csum[:-period]) / period
+    return {'time': close_time[period:], 'atr': config.price_to_pips(atr)}
+
+
+def simulate_grid_batch(bids: np.ndarray, buy_distances: np.ndarray, sell_distances: np.ndarray,
+                        take_profits: np.ndarray, lots: np.ndarray, direction: str = "both",
+                        recovery: bool = True, spread_pips: float = 2.0, balance: float = 10000.0,
+                        leverage: int = 100, stop_out_level: float = 50.0, max_positions: int = 200,
+                        atr_path: Optional[np.ndarray] = None,
+                        atr_multipliers: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    จำลองกฎ Grid ของ GridManager แบบ vectorized (แกน P = จำนวนชุดพารามิเตอร์)
+    ต่อ 1 จุดราคา ทำตามลำดับเดียวกับ update_grid_status:
+      1. TP: ปิดที่ราคา TP แล้ววางไม้แทนฝั่งเดิม (place_replacement_order_after_tp)
+      2. ไม่มีไม้เลย → วางเริ่มต้นใหม่ (check_and_restart_if_no_positions)
+      3. Grid Entry (check_grid_distance_and_place_orders)
+      4. Recovery Entry ถ้าขั้นที่ 3 ไม่ได้วาง (recovery_wrong_direction_orders)
+    ไม่จำลองเวลา 3s/5s และ HG; stop out = ปิดทั้งหมดแล้วหยุดชุดนั้น (blown)
+
+    Args:
+        bids: ราคา bid ตามเวลา (แนะนำให้ผ่าน compress_path ก่อน)
+        buy_distances / sell_distances: ระยะ Grid (pips) ต่อชุด, shape (P,)
+        take_profits: TP (pips) ต่อชุด
+        lots: lot ต่อชุด
+        direction: 'both', 'buy' หรือ 'sell'
+        recovery: True = เปิด Recovery Entry (Auto Mode / โหมด both)
+        spread_pips: spread คงที่
+        balance / leverage / stop_out_level: ข้อมูลบัญชี
+        max_positions: จำนวนไม้สูงสุดต่อฝั่งที่เก็บได้ (เกินจะนับเป็น overflow)
+        atr_path: ATR (pips) ต่อจุดราคา ถ้าระบุพร้อม atr_multipliers จะคำนวณ distance ใหม่ทุกจุด
+                  เหมือน ATR profile ของ Auto Mode: clip(round(ATR * multiplier), 20, 200)
+        atr_multipliers: grid_atr_multiplier ต่อชุด
+
+    Returns:
+        structured array แบบ SWEEP_RESULT_DTYPE
+    """
+    bids = np.asarray(bids, dtype=np.float64)
+    lots = np.asarray(lots, dtype=np.float64)
+    P = len(lots)
+    K = max_positions
+    pip = config.get_pip_value()
+    spread = spread_pips * pip
+    buy_dist = np.asarray(buy_distances, dtype=np.float64) * pip
+    sell_dist = np.asarray(sell_distances, dtype=np.float64) * pip
+    tp = np.asarray(take_profits, dtype=np.float64) * pip
+    use_atr = atr_path is not None and atr_multipliers is not None
+    if use_atr:
+        atr_mult = np.asarray(atr_multipliers, dtype=np.float64)
+
+    allow_buy = direction in ('buy', 'both')
+    allow_sell = direction in ('sell', 'both')
+    value = lots * CONTRACT_SIZE  # $ ต่อ 1 หน่วยราคา
+
+    # ตำแหน่งที่เปิดอยู่ (NaN = ว่าง) และค่าสรุปต่อชุด
+    buy_open = np.full((P, K), np.nan)
+    sell_open = np.full((P, K), np.nan)
+    agg = {
+        'buy_cnt': np.zeros(P), 'buy_sum': np.zeros(P), 'buy_min': np.full(P, np.inf), 'buy_max': np.full(P, -np.inf),
+        'sell_cnt': np.zeros(P), 'sell_sum': np.zeros(P), 'sell_min': np.full(P, np.inf), 'sell_max': np.full(P, -np.inf),
+    }
+    realized = np.zeros(P)
+    trades = np.zeros(P, dtype=np.int64)
+    overflow = np.zeros(P, dtype=np.int64)
+    max_open = np.zeros(P, dtype=np.int64)
+    alive = np.ones(P, dtype=bool)
+    blown_at = np.full(P, -1, dtype=np.int64)
+    peak = np.full(P, balance)
+    max_dd = np.zeros(P)
+    min_ml = np.full(P, np.inf)
+    final_equity = np.full(P, np.nan)
+
+    def refresh(side: str, rows: np.ndarray):
+        opens = buy_open if side == 'buy' else sell_open
+        block = opens[rows]
+        valid = ~np.isnan(block)
+        agg[f'{side}_cnt'][rows] = valid.sum(axis=1)
+        agg[f'{side}_sum'][rows] = np.where(valid, block, 0.0).sum(axis=1)
+        agg[f'{side}_min'][rows] = np.where(valid, block, np.inf).min(axis=1)
+        agg[f'{side}_max'][rows] = np.where(valid, block, -np.inf).max(axis=1)
+
+    def equity_margin(bid: float):
+        ask = bid + spread
+        floating = value * ((bid * agg['buy_cnt'] - agg['buy_sum']) + (agg['sell_sum'] - ask * agg['sell_cnt']))
+        margin = value * (agg['buy_sum'] + agg['sell_sum']) / leverage
+        return balance + realized + floating, margin, floating
+
+    def has_nearby(side: str, rows: np.ndarray, bid: float, dist: np.ndarray) -> np.ndarray:
+        opens = buy_open if side == 'buy' else sell_open
+        return (np.abs(opens[rows] - bid) < (0.5 * dist[rows])[:, None]).any(axis=1)
+
+    def place(side: str, mask: np.ndarray, price: float) -> np.ndarray:
+        """วางไม้ให้ชุดที่ mask=True (ตรวจ free margin + ช่องว่าง) คืน mask ของชุดที่วางสำเร็จ"""
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return mask
+        equity, margin, _ = equity_margin(price)
+        required = value[rows] * price / leverage
+        rows = rows[(equity[rows] - margin[rows]) >= required]
+        opens = buy_open if side == 'buy' else sell_open
+        free = np.isnan(opens[rows])
+        has_free = free.any(axis=1)
+        overflow[rows[~has_free]] += 1
+        rows = rows[has_free]
+        if len(rows):
+            slots = free[has_free].argmax(axis=1)
+            opens[rows, slots] = price
+            agg[f'{side}_cnt'][rows] += 1
+            agg[f'{side}_sum'][rows] += price
+            agg[f'{side}_min'][rows] = np.minimum(agg[f'{side}_min'][rows], price)
+            agg[f'{side}_max'][rows] = np.maximum(agg[f'{side}_max'][rows], price)
+        placed = np.zeros(P, dtype=bool)
+        placed[rows] = True
+        return placed
+
+    for t in range(len(bids)):
+        bid = bids[t]
+        ask = bid + spread
+        if use_atr:
+            dist = np.clip(np.round(atr_path[t] * atr_mult), 20, 200) * pip
+            buy_dist = dist
+            sell_dist = dist
+
+        # 1. TP → ปิดแล้ววางไม้แทน
+        tp_buy = alive & (agg['buy_min'] <= bid - tp)
+        if tp_buy.any():
+            rows = np.flatnonzero(tp_buy)
+            hit = buy_open[rows] <= (bid - tp[rows])[:, None]
+            n_hit = hit.sum(axis=1)
+            realized[rows] += n_hit * tp[rows] * value[rows]
+            trades[rows] += n_hit
+            block = buy_open[rows]
+            block[hit] = np.nan
+            buy_open[rows] = block
+            refresh('buy', rows)
+            if allow_buy:
+                need = np.zeros(P, dtype=bool)
+                need[rows] = ~has_nearby('buy', rows, bid, buy_dist)
+                place('buy', need, ask)
+        tp_sell = alive & (agg['sell_max'] >= ask + tp)
+        if tp_sell.any():
+            rows = np.flatnonzero(tp_sell)
+            hit = sell_open[rows] >= (ask + tp[rows])[:, None]
+            n_hit = hit.sum(axis=1)
+            realized[rows] += n_hit * tp[rows] * value[rows]
+            trades[rows] += n_hit
+            block = sell_open[rows]
+            block[hit] = np.nan
+            sell_open[rows] = block
+            refresh('sell', rows)
+            if allow_sell:
+                need = np.zeros(P, dtype=bool)
+                need[rows] = ~has_nearby('sell', rows, bid, sell_dist)
+                place('sell', need, bid)
+
+        # 2. ไม่มีไม้เลย → วางเริ่มต้นใหม่
+        empty = alive & (agg['buy_cnt'] == 0) & (agg['sell_cnt'] == 0)
+        if empty.any():
+            if allow_buy:
+                place('buy', empty, ask)
+            if allow_sell:
+                place('sell', empty, bid)
+
+        # 3. Grid Entry
+        has_buy = agg['buy_cnt'] > 0
+        has_sell = agg['sell_cnt'] > 0
+        latest_buy = agg['buy_max'].copy()
+        latest_sell = agg['sell_min'].copy()
+        entry_buy = np.zeros(P, dtype=bool)
+        entry_sell = np.zeros(P, dtype=bool)
+        if allow_buy:
+            if direction == 'both':
+                want = ~has_buy | (has_sell & (bid <= latest_sell - sell_dist))
+            else:
+                want = ~has_buy | (bid <= latest_buy - buy_dist)
+            want &= alive
+            if want.any():
+                rows = np.flatnonzero(want)
+                want[rows] = ~has_nearby('buy', rows, bid, buy_dist)
+                entry_buy = place('buy', want, ask)
+        if allow_sell:
+            if direction == 'both':
+                want = ~has_sell | (has_buy & (bid >= latest_buy + buy_dist))
+            else:
+                want = ~has_sell | (bid >= latest_sell + sell_dist)
+            want &= alive
+            if want.any():
+                rows = np.flatnonzero(want)
+                want[rows] = ~has_nearby('sell', rows, bid, sell_dist)
+                entry_sell = place('sell', want, bid)
+
+        # 4. Recovery Entry (เฉพาะชุดที่ Grid Entry ไม่ได้วาง)
+        if recovery:
+            idle = alive & ~entry_buy & ~entry_sell
+            if allow_buy:
+                want = idle & (agg['buy_cnt'] > 0) & (agg['buy_min'] - bid >= buy_dist)
+                if want.any():
+                    rows = np.flatnonzero(want)
+                    want[rows] = ~has_nearby('buy', rows, bid, buy_dist)
+                    place('buy', want, ask)
+            if allow_sell:
+                want = idle & (agg['sell_cnt'] > 0) & (bid - agg['sell_max'] >= sell_dist)
+                if want.any():
+                    rows = np.flatnonzero(want)
+                    want[rows] = ~has_nearby('sell', rows, bid, sell_dist)
+                    place('sell', want, bid)
+
+        # สถิติ equity / drawdown / margin level
+        equity, margin, _ = equity_margin(bid)
+        np.maximum(max_open, (agg['buy_cnt'] + agg['sell_cnt']).astype(np.int64), out=max_open)
+        np.maximum(peak, equity, out=peak)
+        np.maximum(max_dd, np.where(alive, peak - equity, 0.0), out=max_dd)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            margin_level = np.where(margin > 0, equity / margin * 100, np.inf)
+        np.minimum(min_ml, np.where(alive, margin_level, np.inf), out=min_ml)
+
+        # Stop out → ปิดทั้งหมดแล้วหยุดชุดนั้น
+        blown = alive & (margin_level < stop_out_level)
+        if blown.any():
+            rows = np.flatnonzero(blown)
+            realized[rows] = equity[rows] - balance
+            final_equity[rows] = equity[rows]
+            buy_open[rows] = np.nan
+            sell_open[rows] = np.nan
+            refresh('buy', rows)
+            refresh('sell', rows)
+            alive[rows] = False
+            blown_at[rows] = t
+
+    equity, _, floating = equity_margin(bids[-1]) if len(bids) else (np.full(P, balance), None, np.zeros(P))
+    final_equity = np.where(alive, equity, final_equity)
+    floating = np.where(alive, floating, 0.0)
+
+    result = np.zeros(P, dtype=SWEEP_RESULT_DTYPE)
+    result['buy_grid_distance'] = buy_distances if not use_atr else np.nan
+    result['sell_grid_distance'] = sell_distances if not use_atr else np.nan
+    result['take_profit'] = take_profits
+    result['lot'] = lots
+    result['grid_atr_multiplier'] = atr_multipliers if use_atr else np.nan
+    result['net_profit'] = final_equity - balance
+    result['realized'] = realized
+    result['floating'] = floating
+    result['max_drawdown'] = max_dd
+    result['min_margin_level'] = min_ml
+    result['trades'] = trades
+    result['max_positions'] = max_open
+    result['overflow'] = overflow
+    result['blown'] = ~alive
+    result['blown_at'] = blown_at
+    return result
+
+
+def _auto_resolution(distances: Iterable[float], take_profits: Iterable[float]) -> float:
+    """ความละเอียดของ path = 1/5 ของระยะที่เล็กที่สุด (หน่วยราคา)"""
+    smallest = min(min(distances), min(take_profits))
+    return config.pips_to_price(smallest) / 5.0
+
+
+def sweep_grid(bids: np.ndarray, buy_distances: Sequence[float], sell_distances: Sequence[float],
+               take_profits: Sequence[float], lots: Sequence[float],
+               resolution: Optional[float] = None, batch_size: int = 4096, **kwargs) -> np.ndarray:
+    """
+    Sweep ทุกชุด (buy_grid_distance, sell_grid_distance, take_profit, lot)
+
+    Args:
+        bids: ราคา bid ตามเวลา (tick หรือ path จาก bars_to_ticks)
+        buy_distances / sell_distances / take_profits / lots: ค่าที่ต้องการทดสอบ
+        resolution: ความละเอียดของ path (หน่วยราคา) None = อัตโนมัติ, 0 = ไม่บีบอัด
+        batch_size: จำนวนชุดต่อ batch (คุมหน่วยความจำ)
+        **kwargs: ส่งต่อให้ simulate_grid_batch
+
+    Returns:
+        structured array แบบ SWEEP_RESULT_DTYPE เรียงตาม net_profit มาก→น้อย
+    """
+    combos = np.array(list(itertools.product(buy_distances, sell_distances, take_profits, lots)), dtype=np.float64)
+    if resolution is None:
+        resolution = _auto_resolution(list(buy_distances) + list(sell_distances), take_profits)
+    path = np.asarray(bids, dtype=np.float64)[compress_path(bids, resolution)]
+
+    results = []
+    for start in range(0, len(combos), batch_size):
+        chunk = combos[start:start + batch_size]
+        results.append(simulate_grid_batch(path, chunk[:, 0], chunk[:, 1], chunk[:, 2], chunk[:, 3], **kwargs))
+    return rank_results(np.concatenate(results))
+
+
+def sweep_risk_profiles(rates: np.ndarray, grid_atr_multipliers: Optional[Sequence[float]] = None,
+                        take_profits: Sequence[float] = (50,), lots: Sequence[float] = (0.01,),
+                        spread: float = 0.2, resolution: Optional[float] = None, **kwargs) -> np.ndarray:
+    """
+    Sweep grid_atr_multiplier ของ RISK_PROFILES (ATR profile ของ Auto Mode) บนข้อมูลย้อนหลัง
+    distance = clip(round(ATR_M15 * multiplier), 20, 200) คำนวณใหม่ทุกแท่ง M15 ที่ปิด
+    (hg_grid_multiplier / hg_sl_ratio มีผลเฉพาะ HG จึงไม่อยู่ใน fast path นี้)
+
+    Args:
+        rates: แท่งเทียนย้อนหลัง (เช่น M1) แบบ RATES_DTYPE
+        grid_atr_multipliers: ค่าที่ต้องการทดสอบ (None = ค่าจาก RISK_PROFILES ทั้ง 5 แบบ)
+        take_profits / lots: ค่าที่ต้องการทดสอบ
+        spread: spread คงที่ (หน่วยราคา) สำหรับแปลงแท่งเป็น tick
+        resolution: ความละเอียดของ path (หน่วยราคา) None = 1/5 ของระยะขั้นต่ำ 20 pips
+        **kwargs: ส่งต่อให้ simulate_grid_batch
+
+    Returns:
+        structured array แบบ SWEEP_RESULT_DTYPE เรียงตาม net_profit มาก→น้อย
+    """
+    from backtester import bars_to_ticks
+
+    if grid_atr_multipliers is None:
+        grid_atr_multipliers = sorted({p['grid_atr_multiplier'] for p in RISK_PROFILES.values()})
+    times, bids, _ = bars_to_ticks(rates, spread)
+    atr = atr_pips_series(rates)
+    if len(atr['atr']) == 0:
+        raise ValueError("Not enough bars to calculate ATR")
+
+    # เริ่มจำลองตั้งแต่มี ATR แท่งแรก
+    start = np.searchsorted(times, atr['time'][0])
+    times, bids = times[start:], bids[start:]
+    if resolution is None:
+        resolution = _auto_resolution([20], take_profits)
+    keep = compress_path(bids, resolution)
+    path_times, path = times[keep], bids[keep]
+    atr_path = atr['atr'][np.searchsorted(atr['time'], path_times, side='right') - 1]
+
+    combos = np.array(list(itertools.product(grid_atr_multipliers, take_profits, lots)), dtype=np.float64)
+    nan = np.full(len(combos), np.nan)
+    result = simulate_grid_batch(path, nan, nan, combos[:, 1], combos[:, 2],
+                                 atr_path=atr_path, atr_multipliers=combos[:, 0], **kwargs)
+    return rank_results(result)
+
+
+def rank_results(results: np.ndarray) -> np.ndarray:
+    """เรียงผล: ชุดที่ไม่ blown ก่อน แล้วตาม net_profit มาก→น้อย และ drawdown น้อย→มาก"""
+    order = np.lexsort((results['max_drawdown'], -results['net_profit'], results['blown']))
+    return results[order]
+
+
+def format_results(results: np.ndarray, top: int = 20) -> str:
+    """
+    แปลงผล sweep เป็นตารางข้อความ
+
+    Args:
+        results: ผลจาก sweep_grid / sweep_risk_profiles
+        top: จำนวนแถวที่แสดง
+
+    Returns:
+        ตารางข้อความ
+    """
+    header = f"{'#':>3} {'BuyD':>6} {'SellD':>6} {'ATRx':>5} {'TP':>5} {'Lot':>5} {'Net$':>10} {'MaxDD$':>9} {'MinML%':>8} {'Trades':>6} {'MaxPos':>6} {'Blown':>5}"
+    lines = [header, "-" * len(header)]
+    for i, row in enumerate(results[:top], 1):
+        min_ml = f"{row['min_margin_level']:.0f}" if np.isfinite(row['min_margin_level']) else "-"
+        atr_mult = f"{row['grid_atr_multiplier']:.2f}" if np.isfinite(row['grid_atr_multiplier']) else "-"
+        buy_d = f"{row['buy_grid_distance']:.0f}" if np.isfinite(row['buy_grid_distance']) else "atr"
+        sell_d = f"{row['sell_grid_distance']:.0f}" if np.isfinite(row['sell_grid_distance']) else "atr"
+        lines.append(
+            f"{i:>3} {buy_d:>6} {sell_d:>6} {atr_mult:>5} {row['take_profit']:>5.0f} {row['lot']:>5.2f} "
+            f"{row['net_profit']:>10.2f} {row['max_drawdown']:>9.2f} {min_ml:>8} {row['trades']:>6} "
+            f"{row['max_positions']:>6} {'yes' if row['blown'] else 'no':>5}"
+        )
+    return "\n".join(lines)
+
+
+def _parse_list(text: str) -> List[float]:
+    return [float(v) for v in text.split(',') if v.strip()]
+
+
+def main():
+    from backtester import bars_to_ticks, load_bars_csv
+
+    parser = argparse.ArgumentParser(description="Vectorized Grid parameter sweep")
+    parser.add_argument('bars', help="CSV ของแท่งเทียน (time,open,high,low,close[,tick_volume,spread])")
+    parser.add_argument('--buy-dist', default="100,200,300")
+    parser.add_argument('--sell-dist', default="100,200,300")
+    parser.add_argument('--tp', default="50,100,200")
+    parser.add_argument('--lot', default="0.01")
+    parser.add_argument('--direction', default="both", choices=['both', 'buy', 'sell'])
+    parser.add_argument('--no-recovery', action='store_true')
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--leverage', type=int, default=100)
+    parser.add_argument('--spread', type=float, default=0.2, help="spread (หน่วยราคา)")
+    parser.add_argument('--resolution', type=float, default=None, help="ความละเอียด path (หน่วยราคา)")
+    parser.add_argument('--risk-profiles', action='store_true', help="sweep grid_atr_multiplier แทน distance คงที่")
+    parser.add_argument('--atr-mult', default=None, help="ค่า grid_atr_multiplier ที่ต้องการทดสอบ")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    rates = load_bars_csv(args.bars)
+    common = dict(direction=args.direction, recovery=not args.no_recovery, spread_pips=config.price_to_pips(args.spread),
+                  balance=args.balance, leverage=args.leverage)
+    started = time.perf_counter()
+    if args.risk_profiles:
+        multipliers = _parse_list(args.atr_mult) if args.atr_mult else None
+        results = sweep_risk_profiles(rates, multipliers, _parse_list(args.tp), _parse_list(args.lot),
+                                      spread=args.spread, resolution=args.resolution, **common)
+    else:
+        _, bids, _ = bars_to_ticks(rates, args.spread)
+        results = sweep_grid(bids, _parse_list(args.buy_dist), _parse_list(args.sell_dist),
+                             _parse_list(args.tp), _parse_list(args.lot), resolution=args.resolution, **common)
+    elapsed = time.perf_counter() - started
+    print(format_results(results, args.top))
+    print(f"\n{len(results)} combinations in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
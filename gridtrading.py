@@ -0,0 +1,127 @@
+# gridtrading.py
+# Entry point แบบ command line: python -m gridtrading run --config settings.ini (headless ไม่ใช้ Tkinter)
+
+"""
+Grid Trading System with HG - Headless Mode
+===========================================
+
+ใช้บน VPS ที่ไม่ต้องการ GUI:
+
+    python -m gridtrading run --config settings.ini --log-dir logs --status-port 8765
+    python -m gridtrading gui
+
+- run: เริ่มเทรดทันทีด้วยค่าจากไฟล์ตั้งค่า, log ลงไฟล์, สถานะดูได้ที่ http://127.0.0.1:<port>/status
+- gui: เปิด GUI แบบเดิม (เหมือน main.py)
+- รหัสผ่าน MT5 อ่านจาก environment variable MT5_PASSWORD (ไม่รับผ่าน command line)
+"""
+
+import argparse
+import logging
+import logging.handlers
+import os
+import sys
+import traceback
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+
+def setup_logging(log_dir: str, level: str = "INFO"):
+    """
+    ตั้งค่า logging ก่อน import module ของระบบ (แต่ละ module เรียก basicConfig ซึ่งจะไม่มีผลถ้ามี handler แล้ว)
+
+    Args:
+        log_dir: โฟลเดอร์เก็บ trading_bot.log / error.log (หมุนไฟล์เมื่อเกิน 10 MB)
+        level: ระดับ log
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    main_file = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, 'trading_bot.log'), maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    main_file.setFormatter(formatter)
+
+    error_file = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, 'error.log'), maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    error_file.setLevel(logging.ERROR)
+    error_file.setFormatter(formatter)
+
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+    for handler in (main_file, error_file, console):
+        root.addHandler(handler)
+
+
+def cmd_run(args) -> int:
+    """รันระบบเทรดแบบ headless จนกว่าจะได้ SIGINT / SIGTERM"""
+    # กำหนดไฟล์ตั้งค่าก่อน import config (config โหลดไฟล์ตอน import)
+    os.environ["GRIDTRADING_CONFIG"] = os.path.abspath(args.config)  # = config.CONFIG_FILE_ENV
+    setup_logging(args.log_dir, args.log_level)
+    logger = logging.getLogger("gridtrading")
+
+    from daemon import TradingDaemon
+    from config import config
+
+    logger.info("=" * 60)
+    logger.info("Grid Trading System with HG - Headless Starting...")
+    logger.info(f"Config: {config.config_file} | Symbol: {config.mt5.symbol}")
+    logger.info("=" * 60)
+
+    daemon = TradingDaemon(
+        login=args.login,
+        password=os.environ.get("MT5_PASSWORD"),
+        server=args.server,
+        status_host=args.status_host,
+        status_port=args.status_port
+    )
+    if not daemon.start():
+        daemon.shutdown()
+        return 1
+    return daemon.run_forever()
+
+
+def cmd_gui(args) -> int:
+    """เปิด GUI แบบเดิม"""
+    from main import main
+    main()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="gridtrading", description="Grid Trading System with HG")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the trading engine headless (no Tk)")
+    run.add_argument("--config", default="settings.ini", help="settings file (default: settings.ini)")
+    run.add_argument("--log-dir", default="logs", help="directory for trading_bot.log / error.log")
+    run.add_argument("--log-level", default="INFO", help="DEBUG, INFO, WARNING, ERROR")
+    run.add_argument("--login", type=int, default=None, help="MT5 account (default: account open in terminal)")
+    run.add_argument("--server", default=None, help="MT5 server (password from MT5_PASSWORD)")
+    run.add_argument("--status-host", default="127.0.0.1", help="status endpoint bind address")
+    run.add_argument("--status-port", type=int, default=8765, help="status endpoint port (0 = disabled)")
+    run.set_defaults(func=cmd_run)
+
+    gui = commands.add_parser("gui", help="start the Tkinter GUI")
+    gui.set_defaults(func=cmd_gui)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 0
+    except Exception as e:
+        logging.getLogger("gridtrading").error(f"Fatal error: {e}\n{traceback.format_exc()}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
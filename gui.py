@@ -5,13 +5,15 @@ import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import threading
 import logging
-from datetime import datetime, timezone
-
-import requests
+from datetime import datetime
 from mt5_connection import mt5_connection
 from grid_manager import grid_manager
 from hg_manager import HGManager
 from position_monitor import position_monitor
+from cycle_snapshot import snapshot_provider
+from order_queue import order_queue
+from status_report import status_reporter
+from engine import engine, EVENT_DISPLAY, EVENT_ANALYTICS, EVENT_STATUS, EVENT_ERROR, EVENT_OVERRUN, EVENT_HALTED
 from config import config
 from risk_calculator import risk_calculator
 
@@ -29,23 +31,14 @@ class TradingGUI:
         self.root.minsize(1200, 700)  # 🆕 เพิ่มขนาดขั้นต่ำ
         self.root.maxsize(1600, 1000)  # 🆕 เพิ่มขนาดสูงสุด
         
-        self.api_base_url ="http://123.253.62.50:8080/api"
-
         # สถานะระบบ
         self.is_running = False
-        self.monitoring_thread = None
-        self.stop_monitoring = False
         
         # สร้าง HG Manager
         self.hg_manager = HGManager()
         
-        # 🆕 Auto Mode: ตัวนับสำหรับ refresh (ทุก 60 วินาที = 120 cycles)
-        self.auto_refresh_counter = 0
-        self.auto_refresh_interval = 120  # รอบ (120 * 0.5s = 60 วินาที)
-        
-        # 🆕 Performance: Throttling สำหรับ GUI updates
-        self.last_display_update = 0
-        self.display_update_interval = 1.0  # อัพเดท GUI ทุก 1 วินาที (ไม่ใช่ทุก 0.5 วินาที)
+        # รับ events จาก Engine (display ทุก 1 วินาที, analytics เมื่อปิดแท่ง, status report ฯลฯ)
+        engine.subscribe(self.on_engine_event)
         
         # สร้าง GUI components
         self.create_widgets()
@@ -872,7 +865,6 @@ class TradingGUI:
     def refresh_auto_analysis(self):
         """อัพเดทข้อมูลใน Auto Mode (Full - รวม Survivability)"""
         try:
-            from auto_config_manager import auto_config_manager
             from candle_volume_detector import candle_volume_detector
             from atr_calculator import atr_calculator
             
@@ -950,17 +942,7 @@ class TradingGUI:
             # คำนวณ Survivability
             account_info = mt5_connection.get_account_info()
             price_info = mt5_connection.get_current_price()
-            
-            if settings and account_info and price_info:
-                survival = auto_config_manager.calculate_survivability(
-                    balance=account_info['balance'],
-                    price=price_info['bid'],
-                    leverage=account_info.get('leverage', 100),
-                    settings=settings
-                )
-                
-                # แสดงผล Survivability
-                self.display_survivability(survival, account_info)
+            self.update_survivability(settings, account_info, price_info)
             
             self.log_message("✓ Auto analysis refreshed")
             
@@ -969,9 +951,8 @@ class TradingGUI:
             self.log_message(f"✗ Error: {e}")
     
     def refresh_auto_analysis_light(self):
-        """อัพเดทข้อมูลใน Auto Mode แบบเบา (ไม่คำนวณ Survivability)"""
+        """อัพเดทข้อมูลใน Auto Mode แบบเบา (ใช้ cache ของ ATR/Trend และ snapshot ของรอบล่าสุด)"""
         try:
-            from auto_config_manager import auto_config_manager
             from candle_volume_detector import candle_volume_detector
             from atr_calculator import atr_calculator
             
@@ -1036,11 +1017,29 @@ class TradingGUI:
             )
             
             # อัพเดท Auto Plan แบบย่อ (ไม่แสดง popup)
-            self.calculate_resilience_plan()
+            settings = self.calculate_resilience_plan()
+            
+            # คำนวณ Survivability (closed-form เร็วพอสำหรับทุกรอบ) ใช้ account/ราคา จาก snapshot ของรอบล่าสุด
+            snapshot = snapshot_provider.get()
+            if snapshot:
+                self.update_survivability(settings, snapshot.account, snapshot.price_info)
             
         except Exception as e:
             logger.error(f"Error refreshing auto analysis (light): {e}")
     
+    def update_survivability(self, settings, account_info, price_info):
+        """คำนวณและแสดงผล Survivability จาก settings ล่าสุด"""
+        if not settings or not account_info or not price_info:
+            return
+        from auto_config_manager import auto_config_manager
+        survival = auto_config_manager.calculate_survivability(
+            balance=account_info['balance'],
+            price=price_info['bid'],
+            leverage=account_info.get('leverage', 100),
+            settings=settings
+        )
+        self.display_survivability(survival, account_info)
+    
     def display_survivability(self, survival, account_info):
         """แสดงผล Survivability Analysis"""
         self.survivability_text.config(state=tk.NORMAL)
@@ -1254,9 +1253,13 @@ class TradingGUI:
             self.risk_result_text.insert(tk.END, "   3. ไม่รวมค่า Spread และ Commission\n")
             self.risk_result_text.insert(tk.END, "   4. ราคาทองคำเคลื่อนไหวเร็ว ระวังความเสี่ยง!\n")
             self.risk_result_text.insert(tk.END, "   5. แนะนำให้เหลือ Buffer อย่างน้อย 30-50%\n\n")
+            self.risk_result_text.insert(tk.END, "⏳ กำลังคำนวณ Survivability Surface...\n")
             
             self.risk_result_text.config(state=tk.DISABLED)
             
+            # คำนวณ Surface (balance × lot) ใน background thread
+            self.start_risk_surface(result['balance'], result['price'], result['leverage'])
+            
         except ValueError:
             messagebox.showerror("Error", "กรุณาใส่ตัวเลขที่ถูกต้อง")
         except Exception as e:
@@ -1265,6 +1268,46 @@ class TradingGUI:
             self.risk_result_text.config(state=tk.DISABLED)
             messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {str(e)}")
     
+    def start_risk_surface(self, balance: float, price: float, leverage: int):
+        """คำนวณ Survivability Surface ใน background thread (ไม่ให้ Tk ค้าง)"""
+        def worker():
+            try:
+                surface = risk_calculator.calculate_survivability_surface(balance, price, leverage)
+            except Exception as e:
+                logger.error(f"Survivability surface error: {e}")
+                return
+            self.root.after(0, lambda: self.display_risk_surface(surface))
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def display_risk_surface(self, surface: dict):
+        """แสดงตาราง Max Distance (pips) ของทุกคู่ balance × lot ต่อท้ายผล Risk Analysis"""
+        text = self.risk_result_text
+        text.config(state=tk.NORMAL)
+        
+        # ลบข้อความ "กำลังคำนวณ" (ถ้ามี)
+        pending = text.search("⏳ กำลังคำนวณ Survivability Surface", "1.0", tk.END)
+        if pending:
+            text.delete(pending, f"{pending} lineend +1c")
+        
+        lot_header = "".join(f"{lot:>10.2f}" for lot in surface['lot_sizes'])
+        tables = [("📊 GRID ONLY", surface['grid_only'])]
+        if surface['with_hg'] is not None:
+            tables.append(("🛡️ GRID + HG", surface['with_hg']))
+        
+        text.insert(tk.END, "=" * 80 + "\n")
+        text.insert(tk.END, "🗺️  SURVIVABILITY SURFACE (Max Distance, pips):\n")
+        text.insert(tk.END, "=" * 80 + "\n")
+        for title, values in tables:
+            text.insert(tk.END, f"   {title}\n")
+            text.insert(tk.END, f"   {'Balance / Lot':>14}{lot_header}\n")
+            for balance, row in zip(surface['balances'], values):
+                cells = "".join(f"{int(v):>10,}" for v in row)
+                text.insert(tk.END, f"   ${balance:>13,.0f}{cells}\n")
+            text.insert(tk.END, "\n")
+        
+        text.config(state=tk.DISABLED)
+    
     def log_message(self, message: str):
         """
         แสดงข้อความใน log display
@@ -1305,7 +1348,7 @@ class TradingGUI:
             account_info = mt5_connection.get_account_info()
             if account_info:
                 # แสดง account number
-                import MetaTrader5 as mt5
+                from broker_backend import broker as mt5
                 account = mt5.account_info()
                 self.account_number_var.set(str(account.login))
                 
@@ -1348,6 +1391,7 @@ class TradingGUI:
             messagebox.showwarning("Warning", "Please stop trading before disconnecting.")
             return
         
+        order_queue.shutdown()  # รอ order intents ที่ค้างอยู่ส่งให้เสร็จก่อนตัดการเชื่อมต่อ
         mt5_connection.disconnect()
         self.connection_status.set("Disconnected")
         self.status_label.configure(foreground="red")
@@ -1508,7 +1552,7 @@ class TradingGUI:
     def refresh_accounts(self):
         """รีเฟรชรายการบัญชี MT5 ที่มีอยู่"""
         try:
-            import MetaTrader5 as mt5
+            from broker_backend import broker as mt5
             
             # เริ่มต้น MT5
             if not mt5.initialize():
@@ -1541,72 +1585,12 @@ class TradingGUI:
             self.account_combo['values'] = ["Auto"]
             self.account_var.set("Auto")
     
-    def should_report_status(self):
-        """Check if it's time to report status"""
-        if hasattr(self, 'next_report_time') and self.next_report_time:
-            current_utc = datetime.now(timezone.utc)
-            next_report_utc = self.next_report_time.astimezone(timezone.utc)
-            
-            return current_utc >= next_report_utc
-        return True  # Report if no scheduled time
-
     def report_status(self):
         """Report the current status to the API"""
-
         try:
-            account_info = mt5_connection.get_account_info()
-        except Exception as e:
-            raise Exception(f"Failed to get account data: {str(e)}")
-        
-        status_response = requests.post(
-            f"{self.api_base_url}/customer-clients/status",
-            json={
-                "tradingAccountId": str(account_info['login']),
-                "name": account_info['name'],
-                "brokerName": account_info['company'],
-                "currentBalance":  str(account_info['balance']),
-                "currentProfit": str(account_info['profit']),
-                "currency": account_info['currency'],
-                "botName": "Grid Trading AI",
-                "botVersion": "0.0.1"
-            },
-            timeout=10
-        )
-        
-        if status_response.status_code == 200:
-            response_data = status_response.json()
-            
-            expiry_date_var = response_data.get("expiryDate")
-            if expiry_date_var:
-                self.expiry_date_var.set(expiry_date_var)
-            else:
-                self.expiry_date_var.set("-")
-
-            # Check if trading is inactive
-            if response_data.get("processedStatus") == "inactive":
-                # message = response_data.get("message", "Unknown reason")
-                raise Exception(f"ไม่สามารถเริ่มระบบเทรดได้: หมดอายุไอฟาย ^^")
-                
-            # Store next report time for scheduling
-            next_report_time = response_data.get("nextReportTime")
-            if next_report_time:
-                # Fix microseconds to 6 digits
-                if '.' in next_report_time and '+' in next_report_time:
-                    parts = next_report_time.split('.')
-                    microseconds = parts[1].split('+')[0]
-                    timezone_part = '+' + parts[1].split('+')[1]
-                    
-                    # Truncate microseconds to 6 digits
-                    if len(microseconds) > 6:
-                        microseconds = microseconds[:6]
-                    
-                    next_report_time = f"{parts[0]}.{microseconds}{timezone_part}"
-                
-                self.next_report_time = datetime.fromisoformat(next_report_time)
-                print(f"Next report scheduled for: {self.next_report_time}")
-                
-        else:
-            raise Exception(f"Failed to check status: {status_response.status_code}")
+            status_reporter.report()
+        finally:
+            self.expiry_date_var.set(status_reporter.expiry_date or "-")
 
     def start_trading(self):
         """เริ่มต้นระบบเทรด"""
@@ -1656,9 +1640,8 @@ class TradingGUI:
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         
-        # เริ่ม monitoring thread
-        self.monitoring_thread = threading.Thread(target=self.monitoring_loop, daemon=True)
-        self.monitoring_thread.start()
+        # เริ่ม Engine (tick stream + trading thread + worker สำหรับ status report / analytics)
+        engine.start(self.hg_manager)
         
         self.log_message("🚀 Trading System ACTIVE")
     
@@ -1672,7 +1655,7 @@ class TradingGUI:
 
     def _stop_trading_internal(self):
         self.is_running = False
-        self.stop_monitoring = True
+        engine.stop()
         
         grid_manager.stop_grid_trading(close_positions=False)
         self.hg_manager.stop_hg_system()
@@ -1694,18 +1677,24 @@ class TradingGUI:
         
         # หยุดระบบ
         self.is_running = False
-        self.stop_monitoring = True
+        engine.stop()
+        # ยกเลิก order intents ที่ค้างอยู่ก่อนปิด (ไม่ให้มี order ใหม่เปิดหลัง batch close)
+        order_queue.cancel_all()
         
-        # ปิด positions ทั้งหมด
-        closed = mt5_connection.close_all_positions()
+        # ปิด positions ทั้งหมด (batch close: ส่งพร้อมกัน ไม่ปิดทีละตัว)
+        report = mt5_connection.close_positions_batch()
+        closed = report.closed_count
         
         grid_manager.stop_grid_trading(close_positions=False)
         
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
         
-        self.log_message(f"🛑 Emergency Stop: Closed {closed} positions")
-        messagebox.showinfo("Emergency Stop", f"Closed {closed} positions")
+        self.log_message(f"🛑 Emergency Stop: Closed {closed} positions in {report.wall_time * 1000:.0f} ms")
+        for outcome in report.failed:
+            self.log_message(f"✗ Close failed: ticket {outcome.ticket} (retcode {outcome.retcode}, {outcome.attempts} attempts)")
+        messagebox.showinfo("Emergency Stop", f"Closed {closed} positions"
+                            + (f" ({len(report.failed)} failed)" if report.failed else ""))
     
     def refresh_status(self):
         """รีเฟรชสถานะทั้งหมด"""
@@ -1731,101 +1720,43 @@ class TradingGUI:
             self.log_message("✗ Price test failed")
             messagebox.showerror("Error", "Cannot get price data!\n\nPlease check:\n1. Symbol is available in MT5\n2. Market is open\n3. Symbol is selected in MT5")
     
-    def monitoring_loop(self):
+    def on_engine_event(self, event: str, data):
         """
-        Loop หลักสำหรับ monitoring ระบบ
-        ทำงานใน background thread
-        Optimized: ลดการเรียกซ้ำ get_current_price และ update_all_positions
+        รับ events จาก Engine (เรียกจาก thread ของ Engine → ส่งต่อเข้า Tk main thread ด้วย root.after)
         """
-        while not self.stop_monitoring and self.is_running:
-            # API Status Check (หยุดระบบถ้า API error เพราะถูก lock จากภายนอก)
-            try:
-                if self.should_report_status():
-                    self.report_status()
-            except Exception as e:
-                # หยุดการทำงาน ถ้า API error (ระบบถูก lock จากภายนอก)
-                logger.error(f"API Status Error: {e}")
-                self._stop_trading_internal()
-                self.log_message(f"✗ Trading stopped: {e}")
-                # ย้าย messagebox ไปใช้ root.after() เพื่อป้องกัน hang ใน background thread
-                self.root.after(0, lambda err=str(e): messagebox.showerror("Error", f"Trading stopped: {err}"))
-                break
-
-            # 🆕 Auto Mode: อัพเดท UI เฉพาะทุก 60 วินาที (ไม่ใช่ทุกรอบ)
+        if event == EVENT_DISPLAY:
+            self.root.after(0, self.update_display)
+        elif event == EVENT_ANALYTICS:
+            # 🆕 Auto Mode: อัพเดท UI เมื่อ signal คำนวณใหม่ (ปิดแท่ง)
             if config.grid.auto_mode:
-                self.auto_refresh_counter += 1
-                if self.auto_refresh_counter >= self.auto_refresh_interval:
-                    self.auto_refresh_counter = 0
-                    # เรียกแบบ non-blocking
-                    self.root.after(0, lambda: self.refresh_auto_analysis_light())
-
-            # Main Monitoring Section
-            try:
-                # ดึงราคาเพียงครั้งเดียวแล้วใช้ต่อ (ลดการเรียกซ้ำ)
-                price_info = mt5_connection.get_current_price()
-                if not price_info:
-                    logger.warning("Cannot get price info - skipping this cycle")
-                    threading.Event().wait(0.5)
-                    continue
-                
-                current_price = price_info['bid']
-                
-                # อัพเดท positions ครั้งเดียว (ใช้ร่วมกันทั้ง Grid และ HG)
-                try:
-                    position_monitor.update_all_positions()
-                except Exception as e:
-                    logger.error(f"Error updating positions: {e}")
-                    # ยังทำงานต่อ แต่ข้ามส่วนที่ใช้ positions
-                
-                # อัพเดท Grid (มี error handling แยก - ไม่หยุดระบบ)
-                try:
-                    grid_manager.update_grid_status()
-                except Exception as e:
-                    logger.error(f"Error in grid manager: {e}", exc_info=True)
-                    self.root.after(0, lambda err=str(e): self.log_message(f"✗ Grid Error: {err}"))
-                
-                # อัพเดท HG (ถ้าเปิดใช้งาน) - ใช้ราคาที่ดึงไว้แล้ว
-                if config.hg.enabled:
-                    try:
-                        self.hg_manager.manage_multiple_hg(current_price)
-                    except Exception as e:
-                        logger.error(f"Error in HG manager: {e}", exc_info=True)
-                        self.root.after(0, lambda err=str(e): self.log_message(f"✗ HG Error: {err}"))
-                
-                # ตรวจสอบความเสี่ยง
-                try:
-                    position_monitor.send_alerts()
-                except Exception as e:
-                    logger.error(f"Error in risk alerts: {e}")
-                
-                # 🆕 อัพเดท GUI (ใช้ throttling เพื่อลดการอัพเดทบ่อยเกินไป)
-                try:
-                    import time
-                    current_time = time.time()
-                    if current_time - self.last_display_update >= self.display_update_interval:
-                        self.last_display_update = current_time
-                        self.root.after(0, self.update_display)
-                except Exception as e:
-                    logger.error(f"Error scheduling GUI update: {e}")
-                
-                # รอ 0.5 วินาที
-                threading.Event().wait(0.5)
-                
-            except Exception as e:
-                # Error handling สำหรับ main section (ไม่หยุด loop)
-                logger.error(f"Error in monitoring loop: {e}", exc_info=True)
-                import traceback
-                logger.error(traceback.format_exc())
-                self.root.after(0, lambda err=str(e): self.log_message(f"✗ Monitoring Error: {err}"))
-                # รอสักครู่ก่อน retry (ป้องกัน infinite error loop)
-                threading.Event().wait(1.0)
+                self.root.after(0, self.refresh_auto_analysis_light)
+        elif event == EVENT_STATUS:
+            self.root.after(0, lambda: self.expiry_date_var.set(status_reporter.expiry_date or "-"))
+        elif event == EVENT_ERROR:
+            name, error = data
+            self.root.after(0, lambda: self.log_message(f"✗ {name.upper()} Error: {error}"))
+        elif event == EVENT_OVERRUN:
+            message = f"⚠️ Task '{data['task']}' overrun ({data['duration'] * 1000:.0f} ms, budget {data['budget'] * 1000:.0f} ms)"
+            self.root.after(0, lambda: self.log_message(message))
+        elif event == EVENT_HALTED:
+            # หยุดการทำงาน ถ้า API error (ระบบถูก lock จากภายนอก)
+            self.root.after(0, lambda: self._on_engine_halted(data))
+    
+    def _on_engine_halted(self, reason: str):
+        if self.is_running:
+            self._stop_trading_internal()
+        self.log_message(f"✗ Trading stopped: {reason}")
+        messagebox.showerror("Error", f"Trading stopped: {reason}")
     
     def update_display(self):
         """อัพเดทการแสดงผลใน GUI (Optimized - ลดการอัพเดทบ่อยเกินไป)"""
         try:
+            # ใช้ snapshot ล่าสุดของ monitoring loop (ดึงใหม่เฉพาะเมื่อเก่าเกินไป)
+            snapshot = snapshot_provider.get() if mt5_connection.connected else None
+            
             # อัพเดท Account Balance (real-time)
-            if mt5_connection.connected:
-                account_info = mt5_connection.get_account_info()
+            if snapshot:
+                account_info = snapshot.account
                 if account_info:
                     self.balance_var.set(f"${account_info['balance']:,.2f}")
                     if hasattr(self, 'auto_balance_snapshot_var'):
@@ -1836,16 +1767,12 @@ class TradingGUI:
                         self.auto_free_margin_snapshot_var.set(f"${account_info['free_margin']:,.2f}")
             
             # อัพเดท positions summary
-            summary = position_monitor.get_positions_summary()
+            summary = position_monitor.get_positions_summary(snapshot.account if snapshot else None)
             pnl = summary['total_pnl']
             margin_usage = summary['margin_usage']
             
-            # ดึงราคาปัจจุบัน
-            price_info = mt5_connection.get_current_price()
-            if price_info:
-                current_price = price_info['bid']
-            else:
-                current_price = 0
+            # ราคาปัจจุบันจาก snapshot
+            current_price = snapshot.bid if snapshot else 0
             
             # อัพเดท Grid และ HG status (สำหรับ Statistics tab)
             grid_status = grid_manager.get_grid_status()
@@ -1859,7 +1786,7 @@ class TradingGUI:
                     self.total_orders_var.set(str(total_orders))
                     
                     # Active Positions
-                    active_positions = len(position_monitor.grid_positions) + len(position_monitor.hg_positions)
+                    active_positions = summary['grid_positions'] + summary['hg_positions']
                     self.active_positions_var.set(str(active_positions))
                     
                     # Total P&L (Statistics)
@@ -2,13 +2,20 @@
 # ไฟล์จัดการระบบ Hedge (HG)
 
 from typing import List, Dict, Optional
-import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import Future
 import logging
+import sys
 from mt5_connection import mt5_connection
-from position_monitor import position_monitor
+from position_monitor import position_monitor, EVENT_CLOSED
+from cycle_snapshot import snapshot_provider
+from order_queue import order_queue
+from position_roles import encode_comment
 from config import config
+from clock import clock
 from hg_profiles import get_hg_profile
-from hg_zone_detector import detect_zones
+from hg_zone_detector import ZoneTracker, ZoneIndex
 from atr_calculator import atr_calculator
 
 logging.basicConfig(level=logging.INFO)
@@ -25,11 +32,58 @@ class HGManager:
         self.closed_hg_levels = set()  # เก็บ HG levels ที่ถูกปิดแล้ว (SL/TP)
         self.start_price = 0.0
         self.zone_cache: Dict[str, List[Dict]] = {'buy': [], 'sell': [], 'generated_at': 0}
+        self.zone_tracker = ZoneTracker()  # อัพเดท zones ทีละแท่งที่ปิด (ไม่สแกนใหม่ทั้งหน้าต่าง)
+        self.zone_index: Dict[str, ZoneIndex] = {'buy': ZoneIndex(), 'sell': ZoneIndex()}  # หา zone ที่ครอบราคาด้วย bisect
         self.last_zone_refresh = 0.0
         self.current_profile: Optional[Dict] = None
         self.active_zone_ids = set()
         self.last_hg_entry_price = {'buy': None, 'sell': None}
         self.last_price: Optional[float] = None
+        self.closed_tickets = deque()  # ticket ของ HG ที่ถูกปิด (จาก closed events)
+        self.pending_hg: Dict[str, Optional[Future]] = {}  # level_key → Future ของ order intent ที่ยังไม่ dispatch
+        self.hg_ladder: Optional[Dict] = None  # ราคา/level key ของ HG fixed levels (คำนวณไว้ล่วงหน้า)
+        self.hg_ladder_key = None
+        position_monitor.subscribe(self.on_position_events)
+    
+    def on_position_events(self, events: List):
+        """
+        รับ events จาก PositionMonitor แล้วเก็บ ticket ของ HG ที่ถูกปิด
+        
+        Args:
+            events: List ของ PositionEvent
+        """
+        if not self.active:
+            return
+        for event in events:
+            if event.kind == EVENT_CLOSED and event.role == 'hg':
+                self.closed_tickets.append(event.ticket)
+    
+    def _mark_hg_closed(self, level_key: str):
+        """
+        บันทึกว่า HG level ถูกปิดแล้ว (SL/TP) และลบออกจาก placed_hg
+        
+        Args:
+            level_key: key ของ HG level
+        """
+        hg_data = self.placed_hg.pop(level_key, None)
+        if hg_data is None:
+            return
+        logger.info(f"HG closed: {level_key}")
+        # เพิ่มลง closed_hg_levels เพื่อไม่ให้วางซ้ำ
+        self.closed_hg_levels.add(level_key)
+        zone_id = hg_data.get('zone_id')
+        if zone_id in self.active_zone_ids:
+            self.active_zone_ids.discard(zone_id)
+    
+    def _process_closed_events(self):
+        """จัดการ HG ที่ถูกปิดตาม closed events (ทำงานเฉพาะเมื่อมีการเปลี่ยนแปลง)"""
+        if not self.closed_tickets:
+            return
+        closed_tickets = set()
+        while self.closed_tickets:
+            closed_tickets.add(self.closed_tickets.popleft())
+        for level_key in [key for key, data in self.placed_hg.items() if data['ticket'] in closed_tickets]:
+            self._mark_hg_closed(level_key)
     
     def _get_active_profile(self) -> Dict:
         plan = getattr(config.grid, "auto_plan", {}) or {}
@@ -39,25 +93,28 @@ class HGManager:
         return profile
     
     def _refresh_zones_if_needed(self):
+        """
+        อัพเดท zones เมื่อมีแท่งใหม่ปิด (หรือ profile เปลี่ยน)
+        ZoneTracker ยืนยันเฉพาะ pivot ที่ครบ lookahead แล้วและลบ zone ที่หมดอายุ → id ของ zone คงที่
+        """
         profile = self._get_active_profile()
-        refresh_secs = profile['zone_refresh_secs']
-        now = time.time()
-        if now - self.last_zone_refresh < refresh_secs:
-            return
         if not mt5_connection.connected:
             return
         
-        rates = mt5_connection.get_recent_rates(count=profile['lookback_bars'])
-        if not rates:
+        rates = mt5_connection.get_rates_array(count=profile['lookback_bars'], start_pos=1)
+        if not self.zone_tracker.needs_update(rates, profile):
             return
         
         atr_value = atr_calculator.calculate_atr()
         if atr_value is None or atr_value <= 0:
             atr_value = profile['fallback_distance_factor'] * config.grid.buy_grid_distance
         
-        zones = detect_zones(atr_value, profile, rates)
+        self.last_zone_refresh = clock.time()
+        if not self.zone_tracker.update(rates, atr_value, profile):
+            return
+        zones = self.zone_tracker.snapshot()
         self.zone_cache = zones
-        self.last_zone_refresh = now
+        self.zone_index = {zone_type: ZoneIndex(zones.get(zone_type, [])) for zone_type in ('buy', 'sell')}
         current_ids = {zone['id'] for zone in zones.get('buy', [])} | {zone['id'] for zone in zones.get('sell', [])}
         self.active_zone_ids = {zone_id for zone_id in self.active_zone_ids if zone_id in current_ids}
     
@@ -96,14 +153,11 @@ class HGManager:
         
         prev_price = self.last_price
         for zone_type, hg_type in zone_map.items():
-            for zone in self.zone_cache.get(zone_type, []):
+            # เฉพาะ zone ที่ครอบราคาปัจจุบัน (lower <= price <= upper) จาก interval index
+            for zone in self.zone_index[zone_type].containing(current_price):
                 if zone['id'] in self.active_zone_ids:
                     continue
                 
-                in_zone = zone['lower'] <= current_price <= zone['upper']
-                if not in_zone:
-                    continue
-                
                 if prev_price is not None:
                     if zone_type == 'buy' and not (prev_price >= zone['upper']):
                         continue
@@ -121,9 +175,45 @@ class HGManager:
                 self.active_zone_ids.add(zone['id'])
         return triggers
         
+    def _get_hg_ladder(self) -> Dict:
+        """
+        Ladder ของ HG fixed levels คำนวณใหม่เฉพาะเมื่อ start_price / ระยะ / จำนวน level เปลี่ยน
+        ราคาแต่ละฝั่งเรียงจากน้อยไปมากเพื่อใช้ bisect, level key ถูก intern ไว้ (ไม่สร้าง string ทุก tick)
+        """
+        key = (self.start_price, config.hg.buy_hg_distance, config.hg.sell_hg_distance,
+               config.hg.buy_max_hg_levels, config.hg.sell_max_hg_levels)
+        if self.hg_ladder is not None and self.hg_ladder_key == key:
+            return self.hg_ladder
+        
+        buy_hg_distance_price = config.pips_to_price(config.hg.buy_hg_distance)
+        sell_hg_distance_price = config.pips_to_price(config.hg.sell_hg_distance)
+        buy_levels = range(config.hg.buy_max_hg_levels, 0, -1)  # ลึกสุดก่อน → ราคาน้อยไปมาก
+        sell_levels = range(1, config.hg.sell_max_hg_levels + 1)
+        self.hg_ladder = {
+            'buy_levels': list(buy_levels),
+            'buy_prices': [self.start_price - (buy_hg_distance_price * i) for i in buy_levels],
+            'buy_keys': [sys.intern(f"HG_BUY_{i}") for i in buy_levels],
+            'sell_levels': list(sell_levels),
+            'sell_prices': [self.start_price + (sell_hg_distance_price * i) for i in sell_levels],
+            'sell_keys': [sys.intern(f"HG_SELL_{i}") for i in sell_levels],
+        }
+        self.hg_ladder_key = key
+        return self.hg_ladder
+    
+    def _ladder_trigger(self, level_key: str, price: float, hg_type: str, level: int, current_price: float) -> Optional[Dict]:
+        if level_key in self.placed_hg or level_key in self.closed_hg_levels or level_key in self.pending_hg:
+            return None
+        logger.info(f"HG Trigger detected: {level_key} | Target: {price:.2f} | Current: {current_price:.2f}")
+        return {
+            'level_key': level_key,
+            'price': price,
+            'type': hg_type,
+            'level': level
+        }
+    
     def check_hg_trigger(self, current_price: float, direction_mode: Optional[str] = None) -> List[Dict]:
         """
-        ตรวจสอบว่าถึงเงื่อนไขวาง HG หรือยัง
+        ตรวจสอบว่าถึงเงื่อนไขวาง HG หรือยัง (bisect หา level ที่ราคาผ่านแล้วจาก ladder ที่คำนวณไว้)
         
         Args:
             current_price: ราคาปัจจุบัน
@@ -132,46 +222,27 @@ class HGManager:
             List ของ HG ที่ควรวาง
         """
         triggers = []
-        
-        # ใช้ระยะห่างแยก Buy/Sell
-        buy_hg_distance_price = config.pips_to_price(config.hg.buy_hg_distance)
-        sell_hg_distance_price = config.pips_to_price(config.hg.sell_hg_distance)
-        
+        ladder = self._get_hg_ladder()
         direction_setting = direction_mode or config.hg.direction
         
-        # HG Buy (ด้านล่าง)
+        # HG Buy (ด้านล่าง): level ที่ราคา >= current_price ถูก trigger แล้ว (ไล่จาก level 1)
         if direction_setting in ['buy', 'both']:
-            for i in range(1, config.hg.buy_max_hg_levels + 1):
-                level_price_buy = self.start_price - (buy_hg_distance_price * i)
-                level_key_buy = f"HG_BUY_{i}"
-                
-                if (current_price <= level_price_buy and 
-                    level_key_buy not in self.placed_hg and 
-                    level_key_buy not in self.closed_hg_levels):
-                    logger.info(f"HG Trigger detected: {level_key_buy} | Target: {level_price_buy:.2f} | Current: {current_price:.2f}")
-                    triggers.append({
-                        'level_key': level_key_buy,
-                        'price': level_price_buy,
-                        'type': 'buy',
-                        'level': -i
-                    })
-        
-        # HG Sell (ด้านบน)
+            prices = ladder['buy_prices']
+            first = bisect_left(prices, current_price)
+            for j in range(len(prices) - 1, first - 1, -1):
+                trigger = self._ladder_trigger(ladder['buy_keys'][j], prices[j], 'buy',
+                                               -ladder['buy_levels'][j], current_price)
+                if trigger:
+                    triggers.append(trigger)
+        
+        # HG Sell (ด้านบน): level ที่ราคา <= current_price ถูก trigger แล้ว
         if direction_setting in ['sell', 'both']:
-            for i in range(1, config.hg.sell_max_hg_levels + 1):
-                level_price_sell = self.start_price + (sell_hg_distance_price * i)
-                level_key_sell = f"HG_SELL_{i}"
-                
-                if (current_price >= level_price_sell and 
-                    level_key_sell not in self.placed_hg and 
-                    level_key_sell not in self.closed_hg_levels):
-                    logger.info(f"HG Trigger detected: {level_key_sell} | Target: {level_price_sell:.2f} | Current: {current_price:.2f}")
-                    triggers.append({
-                        'level_key': level_key_sell,
-                        'price': level_price_sell,
-                        'type': 'sell',
-                        'level': i
-                    })
+            prices = ladder['sell_prices']
+            for j in range(bisect_right(prices, current_price)):
+                trigger = self._ladder_trigger(ladder['sell_keys'][j], prices[j], 'sell',
+                                               ladder['sell_levels'][j], current_price)
+                if trigger:
+                    triggers.append(trigger)
         
         return triggers
     
@@ -261,51 +332,79 @@ class HGManager:
         
         return hg_lot
     
-    def place_hg_order(self, hg_info: Dict) -> Optional[int]:
+    def place_hg_order(self, hg_info: Dict) -> Optional[Future]:
         """
-        วาง HG order
+        วาง HG order (ส่งเป็น order intent เข้า order_queue ผลลัพธ์บันทึกใน _on_hg_order_done)
         
         Args:
             hg_info: ข้อมูล HG ที่ต้องวาง
             
         Returns:
-            ticket number หรือ None
+            Future ของ ticket หรือ None ถ้า level นี้มี intent ค้างอยู่แล้ว
         """
+        level_key = hg_info['level_key']
+        if level_key in self.pending_hg:
+            return None
+        
         # คำนวณ lot size (แยก Buy/Sell)
         hg_lot = self.calculate_hg_lot(hg_info['type'], context=hg_info)
         
         # กำหนด comment สำหรับ HG (ใช้ comment_hg เสมอเพื่อให้แยกประเภทได้ชัดเจน)
-        comment = config.mt5.comment_hg
+        # ต่อท้ายด้วย level / zone id เพื่อกู้ level_key ได้หลังรีสตาร์ท
+        comment = encode_comment(config.mt5.comment_hg, hg_info['type'],
+                                 level=hg_info.get('level') or None, zone_id=hg_info.get('zone_id'))
+        
+        # จอง level ไว้ก่อนส่ง (โหมด synchronous เรียก _on_hg_order_done ก่อน submit คืนค่า)
+        self.pending_hg[level_key] = None
         
         # วาง order (ไม่มี TP เพราะจะใช้วิธี breakeven)
-        ticket = mt5_connection.place_order(
-            order_type=hg_info['type'],
+        future = order_queue.submit(
+            side=hg_info['type'],
             volume=hg_lot,
-            comment=comment
+            role='hg',
+            price=hg_info['price'],
+            comment=comment,
+            context=hg_info,
+            on_done=self._on_hg_order_done
         )
+        if level_key in self.pending_hg:
+            self.pending_hg[level_key] = future
+        return future
+    
+    def _on_hg_order_done(self, intent):
+        """
+        รับผลของ HG order intent (เรียกจาก order_queue.dispatch_completed() ใน monitoring loop)
         
-        if ticket:
-            # บันทึก HG position
-            self.placed_hg[hg_info['level_key']] = {
-                'ticket': ticket,
-                'open_price': hg_info['price'],
-                'type': hg_info['type'],
-                'lot': hg_lot,
-                'breakeven_set': False,
-                'level': hg_info.get('level'),
-                'source': hg_info.get('source', 'distance'),
-                'zone_id': hg_info.get('zone_id'),
-                'zone_width_pips': hg_info.get('zone_width_pips'),
-                'partial_close_ratio': hg_info.get('partial_close_ratio'),
-                'partial_close_trigger_pips': hg_info.get('partial_close_trigger_pips'),
-                'partial_closed': False,
-            }
-            self.last_hg_entry_price[hg_info['type']] = hg_info['price']
-            
-            logger.info(f"HG placed: {hg_info['type'].upper()} {hg_lot} lots at {hg_info['price']:.2f}")
-            logger.info(f"Level: {hg_info['level_key']}")
+        Args:
+            intent: OrderIntent ที่เสร็จแล้ว
+        """
+        hg_info = intent.context
+        # ปลด level ของ intent นี้ และ level อื่นที่ถูก dedupe มาใช้ intent เดียวกัน
+        self.pending_hg.pop(hg_info['level_key'], None)
+        for level_key in [key for key, future in self.pending_hg.items() if future is intent.future]:
+            del self.pending_hg[level_key]
+        if not intent.ticket or not self.active:
+            return
         
-        return ticket
+        # บันทึก HG position
+        self.placed_hg[hg_info['level_key']] = {
+            'ticket': intent.ticket,
+            'open_price': hg_info['price'],
+            'type': hg_info['type'],
+            'lot': intent.volume,
+            'breakeven_set': False,
+            'level': hg_info.get('level'),
+            'source': hg_info.get('source', 'distance'),
+            'zone_id': hg_info.get('zone_id'),
+            'zone_width_pips': hg_info.get('zone_width_pips'),
+            'partial_close_ratio': hg_info.get('partial_close_ratio'),
+            'partial_close_trigger_pips': hg_info.get('partial_close_trigger_pips'),
+            'partial_closed': False,
+        }
+        self.last_hg_entry_price[hg_info['type']] = hg_info['price']
+        
+        logger.info(f"HG placed: {hg_info['type'].upper()} {intent.volume} lots at {hg_info['price']:.2f}")
+        logger.info(f"Level: {hg_info['level_key']}")
     
     def monitor_hg_profit(self):
         """
@@ -316,29 +415,27 @@ class HGManager:
             return
         
         try:
-            # อัพเดท positions
-            position_monitor.update_all_positions()
+            # ใช้ snapshot ของรอบนี้ (ไม่ดึง positions ซ้ำ)
+            snapshot = snapshot_provider.get()
         except Exception as e:
             logger.error(f"Error updating positions in monitor_hg_profit: {e}")
             return
+        if snapshot is None:
+            return
+        
+        # HG ที่ถูกปิด (SL/TP) มาจาก closed events
+        self._process_closed_events()
         
         # ใช้ list() เพื่อสร้าง copy ของ keys เพื่อป้องกันปัญหาเมื่อลบ element ขณะ iterate
         for level_key in list(self.placed_hg.keys()):
             try:
                 hg_data = self.placed_hg[level_key]
                 # ตรวจสอบว่า position ยังเปิดอยู่หรือไม่
-                pos = position_monitor.get_position_by_ticket(hg_data['ticket'])
+                pos = snapshot.get_position(hg_data['ticket'])
                 
                 if pos is None:
-                    # Position ถูกปิดแล้ว (SL/TP)
-                    logger.info(f"HG closed: {level_key}")
-                    # เพิ่มลง closed_hg_levels เพื่อไม่ให้วางซ้ำ
-                    self.closed_hg_levels.add(level_key)
-                    zone_id = hg_data.get('zone_id')
-                    if zone_id in self.active_zone_ids:
-                        self.active_zone_ids.discard(zone_id)
-                    # ลบออกจาก placed_hg เพื่อไม่ให้ log ซ้ำอีก
-                    del self.placed_hg[level_key]
+                    # ไม่พบใน snapshot แต่ไม่มี closed event (เปิด-ปิดภายในรอบเดียว)
+                    self._mark_hg_closed(level_key)
                     continue
                 
                 # ตรวจสอบว่าตั้ง breakeven แล้วหรือยัง
@@ -415,9 +512,9 @@ class HGManager:
             )
             
             if success:
-                # ตรวจสอบว่า SL ถูกตั้งจริงหรือไม่ (อัพเดท position ใหม่)
-                position_monitor.update_all_positions()
-                updated_pos = position_monitor.get_position_by_ticket(hg_data['ticket'])
+                # ตรวจสอบว่า SL ถูกตั้งจริงหรือไม่ (snapshot ถูก invalidate หลัง modify จึงดึงใหม่)
+                snapshot = snapshot_provider.get()
+                updated_pos = snapshot.get_position(hg_data['ticket']) if snapshot else None
                 if updated_pos and updated_pos.get('sl'):
                     hg_data['breakeven_set'] = True
                 else:
@@ -463,18 +560,19 @@ class HGManager:
         Args:
             available_profit: กำไรที่ได้จาก HG partial close (USD)
         """
-        position_monitor.update_all_positions()
-        worst = None
-        for pos in position_monitor.grid_positions:
-            if worst is None or pos['profit'] < worst['profit']:
-                worst = pos
+        snapshot = snapshot_provider.get()
+        if snapshot is None:
+            return
+        table = snapshot.table
+        worst = table.lowest('profit', role='grid')
         
-        if worst and worst['profit'] < 0:
+        if worst is not None and table.rows['profit'][worst] < 0:
             # เช็คว่ากำไรจาก HG >= ขาดทุนของ Grid (ใช้ค่าสัมบูรณ์)
-            grid_loss = abs(worst['profit'])
+            grid_loss = abs(float(table.rows['profit'][worst]))
+            ticket = int(table.rows['ticket'][worst])
             if available_profit >= grid_loss:
-                logger.info(f"Closing worst grid position ticket {worst['ticket']} (loss: ${grid_loss:.2f}, covered by HG profit: ${available_profit:.2f})")
-                mt5_connection.close_order(worst['ticket'])
+                logger.info(f"Closing worst grid position ticket {ticket} (loss: ${grid_loss:.2f}, covered by HG profit: ${available_profit:.2f})")
+                mt5_connection.close_order(ticket)
             else:
                 logger.debug(f"Skipping grid close: HG profit ${available_profit:.2f} < Grid loss ${grid_loss:.2f}")
         else:
@@ -490,6 +588,9 @@ class HGManager:
         if not self.active or not config.hg.enabled:
             return
         
+        # ผลของ order intents ที่ส่งเสร็จแล้ว (บันทึก HG ลง placed_hg)
+        order_queue.dispatch_completed()
+        
         # อัพเดท start_price ถ้าจำเป็น
         self.update_hg_start_price_if_needed(current_price)
         
@@ -528,6 +629,8 @@ class HGManager:
         self.start_price = start_price
         self.placed_hg = {}
         self.closed_hg_levels = set()
+        self.closed_tickets.clear()
+        self.pending_hg = {}
         self.last_hg_entry_price = {'buy': None, 'sell': None}
         
         restored = self.restore_existing_hg_positions()
@@ -556,30 +659,50 @@ class HGManager:
             จำนวน HG positions ที่กู้คืนได้
         """
         try:
-            position_monitor.update_all_positions()
+            snapshot = snapshot_provider.get()
+            if snapshot is None:
+                return 0
             profile = self.current_profile or self._get_active_profile()
             restored = 0
             
-            for pos in position_monitor.hg_positions:
+            known_tickets = {data['ticket'] for data in self.placed_hg.values()}
+            for pos in snapshot.hg_positions:
                 ticket = pos['ticket']
-                level_key = f"HG_RESTORE_{ticket}"
                 
                 # ตรวจสอบว่าเราเคยเก็บไว้แล้วหรือยัง
-                if level_key in self.placed_hg:
+                if ticket in known_tickets:
                     continue
                 
                 entry_type = pos['type']
                 has_sl = pos.get('sl') not in (None, 0.0)
                 
+                # level / zone จาก metadata ใน comment (comment แบบเดิมไม่มี → HG_RESTORE_<ticket>)
+                info = position_monitor.get_comment_info(ticket)
+                level = None
+                zone_id = None
+                source = 'restored'
+                level_key = f"HG_RESTORE_{ticket}"
+                if info is not None and info.zone_id is not None:
+                    zone_id = info.zone_id
+                    source = 'zone'
+                    level_key = f"HG_ZONE_{entry_type.upper()}_{zone_id}"
+                    self.active_zone_ids.add(zone_id)
+                elif info is not None and info.level is not None and info.side == entry_type:
+                    level = -info.level if entry_type == 'buy' else info.level
+                    source = 'distance'
+                    level_key = f"HG_{entry_type.upper()}_{info.level}"
+                if level_key in self.placed_hg:
+                    level_key = f"HG_RESTORE_{ticket}"
+                
                 self.placed_hg[level_key] = {
                     'ticket': ticket,
                     'open_price': pos['open_price'],
                     'type': entry_type,
                     'lot': pos['volume'],
                     'breakeven_set': has_sl,
-                    'level': None,
-                    'source': 'restored',
-                    'zone_id': None,
+                    'level': level,
+                    'source': source,
+                    'zone_id': zone_id,
                     'zone_width_pips': None,
                     'partial_close_ratio': profile.get('partial_close_ratio'),
                     'partial_close_trigger_pips': None,
@@ -2,124 +2,281 @@
 Hedge zone detector based on simple supply/demand heuristics and price action confirmation.
 """
 
-from typing import Dict, List
-from datetime import datetime
-
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
 from config import config
+from clock import clock
 
+VOLUME_RATIO_WINDOW = 10
 
-def _is_pivot_low(rates: List[Dict], index: int, pivot_lookback: int) -> bool:
-    low = rates[index]['low']
-    for i in range(index - pivot_lookback, index):
-        if rates[i]['low'] <= low:
-            return False
-    for i in range(index + 1, index + 1 + pivot_lookback):
-        if rates[i]['low'] < low:
-            return False
-    return True
 
+def _as_columns(rates: Union[np.ndarray, Sequence[Dict]]) -> Dict[str, np.ndarray]:
+    """
+    แปลง rates เป็นคอลัมน์ numpy (structured array ใช้ field โดยตรงไม่ copy, list ของ dict แปลงครั้งเดียว)
+    """
+    if isinstance(rates, np.ndarray):
+        return {name: rates[name] for name in ('time', 'high', 'low', 'tick_volume')}
+    return {
+        'time': np.array([r['time'] for r in rates], dtype=np.int64),
+        'high': np.array([r['high'] for r in rates], dtype=np.float64),
+        'low': np.array([r['low'] for r in rates], dtype=np.float64),
+        'tick_volume': np.array([r['tick_volume'] for r in rates], dtype=np.int64),
+    }
 
-def _is_pivot_high(rates: List[Dict], index: int, pivot_lookback: int) -> bool:
-    high = rates[index]['high']
-    for i in range(index - pivot_lookback, index):
-        if rates[i]['high'] >= high:
-            return False
-    for i in range(index + 1, index + 1 + pivot_lookback):
-        if rates[i]['high'] > high:
-            return False
-    return True
 
+def _window_reduce(values: np.ndarray, size: int, starts: np.ndarray, ufunc, empty: float) -> np.ndarray:
+    """
+    ค่า ufunc.reduce(values[s:s+size]) ของทุก s ใน starts (size = 0 → empty)
+    starts ต่อเนื่องกันเสมอ → คอลัมน์ที่ k ของ window คือ slice ที่เลื่อนไป k แท่ง
+    reduce ทีละคอลัมน์ (window สั้น ๆ แบบนี้เร็วกว่า reduce(axis=1) และไม่มี overhead ของ sliding_window_view)
+    """
+    if size <= 0:
+        return np.full(len(starts), empty)
+    first, count = int(starts[0]), len(starts)
+    result = values[first:first + count].copy()
+    for k in range(1, size):
+        ufunc(result, values[first + k:first + k + count], out=result)
+    return result
 
-def _calculate_volume_ratio(rates: List[Dict], index: int, window: int = 10) -> float:
-    start = max(0, index - window)
-    volumes = [rate['tick_volume'] for rate in rates[start:index]]
-    avg = sum(volumes) / len(volumes) if volumes else 1.0
-    if avg == 0:
-        return 1.0
-    return rates[index]['tick_volume'] / avg
 
+def _volume_ratios(volumes: np.ndarray, indices: np.ndarray, window: int = VOLUME_RATIO_WINDOW) -> np.ndarray:
+    """volume[i] / ค่าเฉลี่ย volume ของ window แท่งก่อนหน้า (ค่าเฉลี่ยเป็น 0 → 1.0)"""
+    volumes = volumes.astype(np.int64)
+    csum = np.concatenate(([0], np.cumsum(volumes)))
+    starts = np.maximum(0, indices - window)
+    counts = indices - starts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg = np.where(counts > 0, (csum[indices] - csum[starts]) / np.maximum(counts, 1), 1.0)
+        return np.where(avg == 0, 1.0, volumes[indices] / avg)
 
-def detect_zones(atr_pips: float, profile: Dict, rates: List[Dict]) -> Dict[str, List[Dict]]:
-    """
-    ตรวจหา Demand/Supply zone จากข้อมูลแท่งเทียนล่าสุด
-    """
-    if len(rates) < profile['lookback_bars'] // 2:
-        return {'buy': [], 'sell': [], 'generated_at': datetime.utcnow().timestamp()}
 
-    zone_width_price = config.pips_to_price(max(atr_pips * profile['zone_width_factor'], 10))
-    breakout_factor = config.pips_to_price(max(atr_pips, 10))
+def _scores(strength: np.ndarray, breakout_factor: float, volume_ratio: np.ndarray) -> np.ndarray:
+    return (np.minimum(1.0, strength / breakout_factor) + np.minimum(1.0, volume_ratio / 2.0)) / 2.0
+
 
+def _confirm_zones(columns: Dict[str, np.ndarray], idx: np.ndarray, atr_pips: float, profile: Dict,
+                   cutoff: Optional[int] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    ประเมิน pivot ที่ index idx (ต่อเนื่องกัน) พร้อมกัน แล้วคืน (buy_zones, sell_zones) เรียงตามเวลา
+    cutoff: เวลาแท่งเก่าสุดที่ยังไม่หมดอายุ (None = ไม่กรอง)
+    """
     buy_zones: List[Dict] = []
     sell_zones: List[Dict] = []
+    if len(idx) == 0:
+        return buy_zones, sell_zones
 
+    zone_width_price = config.pips_to_price(max(atr_pips * profile['zone_width_factor'], 10))
+    breakout_factor = config.pips_to_price(max(atr_pips, 10))
+    times, highs, lows = columns['time'], columns['high'], columns['low']
     pivot_lookback = profile['pivot_lookback']
     breakout_lookahead = profile['breakout_lookahead']
-    max_index = len(rates) - breakout_lookahead - 1
-
-    for idx in range(pivot_lookback, max_index):
-        # Demand zone (pivot low + bullish breakout)
-        if _is_pivot_low(rates, idx, pivot_lookback):
-            base_low = min(r['low'] for r in rates[idx - pivot_lookback: idx + 1])
-            base_high = max(r['high'] for r in rates[idx - pivot_lookback: idx + 1])
-            zone_height = max(base_high - base_low, zone_width_price)
-            breakout_high = max(r['high'] for r in rates[idx + 1: idx + 1 + breakout_lookahead])
-            breakout_strength = breakout_high - base_high
-            if breakout_strength > 0:
-                volume_ratio = _calculate_volume_ratio(rates, idx + 1)
-                score = 0.0
-                score += min(1.0, breakout_strength / breakout_factor)
-                score += min(1.0, volume_ratio / 2.0)
-                score /= 2.0
-                if score >= profile['score_threshold']:
-                    zone_id = f"demand_{rates[idx]['time']}"
-                    buy_zones.append({
-                        'id': zone_id,
-                        'lower': base_low,
-                        'upper': base_low + zone_height,
-                        'score': score,
-                        'created_at': rates[idx]['time'],
-                        'width_pips': config.price_to_pips(zone_height),
-                        'type': 'buy',
-                    })
-
-        # Supply zone (pivot high + bearish breakout)
-        if _is_pivot_high(rates, idx, pivot_lookback):
-            base_high = max(r['high'] for r in rates[idx - pivot_lookback: idx + 1])
-            base_low = min(r['low'] for r in rates[idx - pivot_lookback: idx + 1])
-            zone_height = max(base_high - base_low, zone_width_price)
-            breakout_low = min(r['low'] for r in rates[idx + 1: idx + 1 + breakout_lookahead])
-            breakout_strength = base_low - breakout_low
-            if breakout_strength > 0:
-                volume_ratio = _calculate_volume_ratio(rates, idx + 1)
-                score = 0.0
-                score += min(1.0, breakout_strength / breakout_factor)
-                score += min(1.0, volume_ratio / 2.0)
-                score /= 2.0
-                if score >= profile['score_threshold']:
-                    zone_id = f"supply_{rates[idx]['time']}"
-                    sell_zones.append({
-                        'id': zone_id,
-                        'upper': base_high,
-                        'lower': base_high - zone_height,
-                        'score': score,
-                        'created_at': rates[idx]['time'],
-                        'width_pips': config.price_to_pips(zone_height),
-                        'type': 'sell',
-                    })
-
-    now = datetime.utcnow().timestamp()
+
+    before = idx - pivot_lookback  # แท่งก่อน pivot: [idx - lookback, idx)
+    after = idx + 1  # แท่งหลัง pivot: (idx, idx + lookback]
+    pivot_low = ((_window_reduce(lows, pivot_lookback, before, np.minimum, np.inf) > lows[idx]) &
+                 (_window_reduce(lows, pivot_lookback, after, np.minimum, np.inf) >= lows[idx]))
+    pivot_high = ((_window_reduce(highs, pivot_lookback, before, np.maximum, -np.inf) < highs[idx]) &
+                  (_window_reduce(highs, pivot_lookback, after, np.maximum, -np.inf) <= highs[idx]))
+    if not (pivot_low.any() or pivot_high.any()):
+        return buy_zones, sell_zones
+
+    base_low = _window_reduce(lows, pivot_lookback + 1, before, np.minimum, np.inf)
+    base_high = _window_reduce(highs, pivot_lookback + 1, before, np.maximum, -np.inf)
+    volume_ratio = _volume_ratios(columns['tick_volume'], idx + 1)
+
+    # Demand zone (pivot low + bullish breakout)
+    breakout_high = _window_reduce(highs, breakout_lookahead, after, np.maximum, -np.inf)
+    demand_strength = breakout_high - base_high
+    demand_score = _scores(demand_strength, breakout_factor, volume_ratio)
+    demand = pivot_low & (demand_strength > 0) & (demand_score >= profile['score_threshold'])
+
+    # Supply zone (pivot high + bearish breakout)
+    breakout_low = _window_reduce(lows, breakout_lookahead, after, np.minimum, np.inf)
+    supply_strength = base_low - breakout_low
+    supply_score = _scores(supply_strength, breakout_factor, volume_ratio)
+    supply = pivot_high & (supply_strength > 0) & (supply_score >= profile['score_threshold'])
+
+    # กรองอายุ zone ก่อนสร้าง dict (ผลเท่ากับกรองทีหลัง แต่ไม่ต้องสร้าง zone ที่หมดอายุ)
+    if cutoff is not None:
+        fresh = times[idx] >= cutoff
+        demand &= fresh
+        supply &= fresh
+
+    zone_height = np.maximum(base_high - base_low, zone_width_price)
+
+    for k in np.flatnonzero(demand):
+        created_at = int(times[idx[k]])
+        buy_zones.append({
+            'id': f"demand_{created_at}",
+            'lower': float(base_low[k]),
+            'upper': float(base_low[k] + zone_height[k]),
+            'score': float(demand_score[k]),
+            'created_at': created_at,
+            'width_pips': config.price_to_pips(float(zone_height[k])),
+            'type': 'buy',
+        })
+
+    for k in np.flatnonzero(supply):
+        created_at = int(times[idx[k]])
+        sell_zones.append({
+            'id': f"supply_{created_at}",
+            'upper': float(base_high[k]),
+            'lower': float(base_high[k] - zone_height[k]),
+            'score': float(supply_score[k]),
+            'created_at': created_at,
+            'width_pips': config.price_to_pips(float(zone_height[k])),
+            'type': 'sell',
+        })
+
+    return buy_zones, sell_zones
+
+
+def _age_cutoff(times: np.ndarray, profile: Dict) -> Optional[int]:
+    """เวลาสร้างเก่าสุดที่ยังไม่เกิน max_zone_age_bars (None = ไม่จำกัดอายุ)"""
     max_age_bars = profile['max_zone_age_bars']
-    if max_age_bars > 0 and len(rates) > 1:
-        latest_time = rates[-1]['time']
-        time_step = rates[1]['time'] - rates[0]['time']
-        cutoff = latest_time - max_age_bars * time_step
-        buy_zones = [z for z in buy_zones if z['created_at'] >= cutoff]
-        sell_zones = [z for z in sell_zones if z['created_at'] >= cutoff]
+    if max_age_bars <= 0 or len(times) < 2:
+        return None
+    return int(times[-1]) - max_age_bars * int(times[1] - times[0])
+
+
+def detect_zones(atr_pips: float, profile: Dict, rates: Union[np.ndarray, Sequence[Dict]]) -> Dict[str, List[Dict]]:
+    """
+    ตรวจหา Demand/Supply zone จากข้อมูลแท่งเทียนล่าสุด (สแกนทั้งหน้าต่าง)
+    คำนวณทุก index พร้อมกันด้วย window แบบ vectorized (รับ structured array จาก rate_cache หรือ list ของ dict)
+    """
+    if len(rates) < profile['lookback_bars'] // 2:
+        return {'buy': [], 'sell': [], 'generated_at': clock.time()}
+
+    columns = _as_columns(rates)
+    pivot_lookback = profile['pivot_lookback']
+    max_index = min(len(rates) - profile['breakout_lookahead'] - 1, len(rates) - pivot_lookback)
+    idx = np.arange(pivot_lookback, max(pivot_lookback, max_index))
+    buy_zones, sell_zones = _confirm_zones(columns, idx, atr_pips, profile, _age_cutoff(columns['time'], profile))
 
     return {
         'buy': buy_zones,
         'sell': sell_zones,
-        'generated_at': now,
+        'generated_at': clock.time(),
     }
 
 
+class ZoneTracker:
+    """
+    ติดตาม Demand/Supply zone แบบ incremental จากแท่งที่ปิดแล้ว (แทนการสแกนใหม่ทั้งหน้าต่างตามเวลา)
+    - pivot ที่แท่ง i ยืนยันได้เมื่อมีแท่งปิดหลังมันครบ max(breakout_lookahead, pivot_lookback) แท่ง
+      → แต่ละแท่งที่ปิดใหม่ประเมินเพียง candidate เดียว
+    - zone ที่ยืนยันแล้วคงที่ (id/ขอบเขต/score ไม่เปลี่ยนตาม ATR ภายหลัง) จนหมดอายุ max_zone_age_bars
+    - เปลี่ยน profile, history ถอยหลัง หรือขาดช่วงเกินหน้าต่าง → seed ใหม่จากหน้าต่างทั้งหมด
+    """
+
+    def __init__(self):
+        self.profile: Optional[Dict] = None
+        self.zones: Dict[str, Dict[str, Dict]] = {'buy': {}, 'sell': {}}  # id → zone เรียงตามเวลาสร้าง
+        self.last_bar_time: Optional[int] = None
+        self.generated_at = 0.0
+
+    def reset(self):
+        self.profile = None
+        self.zones = {'buy': {}, 'sell': {}}
+        self.last_bar_time = None
+        self.generated_at = 0.0
+
+    def needs_update(self, rates: Optional[np.ndarray], profile: Dict) -> bool:
+        """มีแท่งใหม่ปิด หรือ profile เปลี่ยน (ใช้เช็คก่อนคำนวณ ATR)"""
+        if rates is None or len(rates) == 0:
+            return False
+        return profile != self.profile or int(rates['time'][-1]) != self.last_bar_time
+
+    def update(self, rates: Union[np.ndarray, Sequence[Dict]], atr_pips: float, profile: Dict) -> bool:
+        """
+        รับแท่งที่ปิดแล้ว (เรียงจากเก่าไปใหม่ ไม่รวมแท่งที่กำลังวิ่ง) แล้วยืนยัน pivot ใหม่/ลบ zone หมดอายุ
+
+        Returns:
+            True ถ้า zones เปลี่ยน
+        """
+        if rates is None or len(rates) == 0:
+            return False
+        columns = _as_columns(rates)
+        times = columns['time']
+        n = len(times)
+        last_time = int(times[-1])
+        if profile == self.profile and last_time == self.last_bar_time:
+            return False
+
+        reach = max(profile['breakout_lookahead'], profile['pivot_lookback'])
+        seed = (profile != self.profile or self.last_bar_time is None or
+                self.last_bar_time < int(times[0]) or self.last_bar_time > last_time)
+        if seed:
+            had_zones = bool(self.zones['buy'] or self.zones['sell'])
+            self.zones = {'buy': {}, 'sell': {}}
+            self.profile = profile
+            if n < profile['lookback_bars'] // 2:
+                # ข้อมูลยังไม่พอ → ลอง seed ใหม่รอบหน้า
+                self.profile = None
+                self.last_bar_time = None
+                return had_zones
+            first = profile['pivot_lookback']
+        else:
+            new_bars = n - int(np.searchsorted(times, self.last_bar_time, side='right'))
+            first = max(profile['pivot_lookback'], n - reach - new_bars)
+        self.last_bar_time = last_time
+
+        cutoff = _age_cutoff(times, profile)
+        # ตัดเฉพาะช่วงที่ candidate ใหม่ต้องใช้ (แท่งก่อน pivot + volume window) → ต้นทุนไม่ขึ้นกับความยาวหน้าต่าง
+        offset = max(0, first - max(profile['pivot_lookback'], VOLUME_RATIO_WINDOW - 1))
+        local = {name: column[offset:] for name, column in columns.items()}
+        idx = np.arange(first, max(first, n - reach)) - offset
+        buy_zones, sell_zones = _confirm_zones(local, idx, atr_pips, profile, cutoff)
+        changed = seed or bool(buy_zones or sell_zones)
+        for zone_type, confirmed in (('buy', buy_zones), ('sell', sell_zones)):
+            zones = self.zones[zone_type]
+            for zone in confirmed:
+                zones[zone['id']] = zone
+            if cutoff is not None:
+                # zone เรียงตามเวลาสร้าง → ลบจากหัวจนเจอ zone ที่ยังไม่หมดอายุ
+                while zones:
+                    oldest_id = next(iter(zones))
+                    if zones[oldest_id]['created_at'] >= cutoff:
+                        break
+                    del zones[oldest_id]
+                    changed = True
+        if changed:
+            self.generated_at = clock.time()
+        return changed
+
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        """zones ปัจจุบันในรูปแบบเดียวกับ detect_zones"""
+        return {
+            'buy': list(self.zones['buy'].values()),
+            'sell': list(self.zones['sell'].values()),
+            'generated_at': self.generated_at,
+        }
+
+
+class ZoneIndex:
+    """
+    Index ของ zone สำหรับหา zone ที่ครอบราคาปัจจุบัน (sorted array ตาม lower + bisect)
+    zone กว้างไม่เกิน max_width → zone ที่ครอบราคา p ต้องมี lower อยู่ในช่วง [p - max_width, p]
+    จึงตรวจเฉพาะ zone ในช่วงนั้นแทนการวนทุก zone ทุก tick
+    """
+
+    def __init__(self, zones: Sequence[Dict] = ()):
+        order = sorted(range(len(zones)), key=lambda i: zones[i]['lower'])
+        self.zones = [zones[i] for i in order]
+        self.positions = order  # ลำดับเดิมของ zone (ตามเวลาสร้าง)
+        self.lowers = [zone['lower'] for zone in self.zones]
+        max_width = max((zone['upper'] - zone['lower'] for zone in self.zones), default=0.0)
+        # เผื่อ rounding ของ float (zone ที่เกินมาถูกกรองด้วยเงื่อนไขจริงอยู่แล้ว)
+        self.search_width = max_width * (1 + 1e-9) + 1e-9
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def containing(self, price: float) -> List[Dict]:
+        """zone ที่ lower <= price <= upper เรียงตามลำดับเดิม"""
+        start = bisect_left(self.lowers, price - self.search_width)
+        end = bisect_right(self.lowers, price)
+        hits = [i for i in range(start, end) if price <= self.zones[i]['upper']]
+        hits.sort(key=self.positions.__getitem__)
+        return [self.zones[i] for i in hits]
@@ -1,17 +1,101 @@
 # mt5_connection.py
 # ไฟล์จัดการการเชื่อมต่อและคำสั่งซื้อขายกับ MetaTrader 5
 
-import MetaTrader5 as mt5
-from typing import Optional, Dict, List
+from broker_backend import broker as mt5
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Iterable, List
 import logging
+import time
 from datetime import datetime
 import threading
+import numpy as np
 from config import config
+from rate_cache import rate_cache
+from position_table import PositionTable, load_positions
+from position_roles import derived_comment
+from clock import clock
 
 # ตั้งค่า logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYMBOL_SPEC_REFRESH = 300  # วินาที - โหลด symbol spec ใหม่ตามรอบ (spec แทบไม่เปลี่ยน)
+# retcode ที่อาจเกิดจาก spec เก่า → โหลด spec ใหม่ก่อน order ถัดไป
+SPEC_ERROR_RETCODES = (mt5.TRADE_RETCODE_INVALID, mt5.TRADE_RETCODE_INVALID_VOLUME)
+
+BATCH_CLOSE_RETRIES = 3  # จำนวนครั้งที่ลองใหม่เมื่อโดน requote / price changed
+
+
+@dataclass(frozen=True)
+class SymbolSpec:
+    """ข้อมูลจำเพาะของ symbol ที่ใช้ตอนส่ง order (cache ไว้แทนการเรียก symbol_info ทุกครั้ง)"""
+    name: str
+    digits: int
+    point: float
+    tick_size: float
+    tick_value: float  # มูลค่า 1 tick ต่อ 1 lot ในสกุลเงินบัญชี
+    contract_size: float
+    volume_min: float
+    volume_max: float
+    volume_step: float
+    filling_mode: int
+    loaded_at: float  # clock.time() ตอนโหลด
+
+    @classmethod
+    def from_info(cls, symbol_info, loaded_at: float) -> 'SymbolSpec':
+        """สร้างจากผลของ mt5.symbol_info()"""
+        return cls(
+            name=symbol_info.name,
+            digits=symbol_info.digits,
+            point=symbol_info.point,
+            tick_size=symbol_info.trade_tick_size,
+            tick_value=symbol_info.trade_tick_value,
+            contract_size=symbol_info.trade_contract_size,
+            volume_min=symbol_info.volume_min,
+            volume_max=symbol_info.volume_max,
+            volume_step=symbol_info.volume_step,
+            filling_mode=symbol_info.filling_mode,
+            loaded_at=loaded_at
+        )
+
+    @property
+    def value_per_price(self) -> float:
+        """
+        กำไร/ขาดทุนในสกุลเงินบัญชีเมื่อราคาเปลี่ยน 1.0 ต่อ 1 lot (= tick_value / tick_size)
+        ถูกต้องทั้งบัญชี USC / cent และบัญชีที่สกุลเงินไม่ตรงกับ quote (ต่างจาก contract_size)
+        """
+        if self.tick_value > 0 and self.tick_size > 0:
+            return self.tick_value / self.tick_size
+        return self.contract_size
+
+
+@dataclass
+class CloseOutcome:
+    """ผลการปิด position หนึ่งตัวใน batch close"""
+    ticket: int
+    success: bool
+    retcode: Optional[int] = None
+    attempts: int = 0
+    price: Optional[float] = None
+    profit: float = 0.0
+    comment: str = ""
+
+
+@dataclass
+class BatchCloseReport:
+    """ผลรวมของ batch close (ผลราย ticket + เวลาที่ใช้ทั้งหมด)"""
+    outcomes: List[CloseOutcome] = field(default_factory=list)
+    wall_time: float = 0.0  # วินาที
+
+    @property
+    def closed_count(self) -> int:
+        return sum(1 for outcome in self.outcomes if outcome.success)
+
+    @property
+    def failed(self) -> List[CloseOutcome]:
+        return [outcome for outcome in self.outcomes if not outcome.success]
+
 
 class MT5Connection:
     """คลาสจัดการการเชื่อมต่อและคำสั่งกับ MT5"""
@@ -22,7 +106,10 @@ class MT5Connection:
         self.magic_number = config.mt5.magic_number
         self.deviation = config.mt5.deviation
         self.cached_filling_mode = None  # จดจำ filling mode ที่ใช้งานได้
+        self.symbol_spec: Optional[SymbolSpec] = None  # cache ข้อมูล symbol (โหลดตอน connect)
+        self.spec_refresh_interval = SYMBOL_SPEC_REFRESH
         self.order_lock = threading.Lock()  # Lock สำหรับป้องกันการส่ง order พร้อมกันจากหลาย thread
+        self.trade_revision = 0  # เพิ่มทุกครั้งที่ส่ง order สำเร็จ (ใช้ invalidate CycleSnapshot)
     
     def find_symbol_with_suffix(self, base_symbol: str = "XAUUSD") -> Optional[str]:
         """
@@ -125,7 +212,12 @@ class MT5Connection:
                     logger.error(f"Failed to select {self.symbol}")
                     return False
             
+            # โหลด symbol spec เข้า cache (ใช้แทน symbol_info ตอนดึงราคา / ส่ง order)
+            self.cached_filling_mode = None
+            self.symbol_spec = SymbolSpec.from_info(symbol_info, clock.time())
+            
             self.connected = True
+            rate_cache.clear()  # เชื่อมต่อใหม่ → โหลดแท่งเทียนใหม่ทั้งหมด
             account_info = mt5.account_info()
             logger.info(f"Connected to MT5 - Account: {account_info.login}, Balance: ${account_info.balance}")
             return True
@@ -138,8 +230,55 @@ class MT5Connection:
         """ตัดการเชื่อมต่อกับ MT5"""
         mt5.shutdown()
         self.connected = False
+        self.symbol_spec = None
         logger.info("Disconnected from MT5")
     
+    def load_symbol_spec(self) -> Optional[SymbolSpec]:
+        """
+        โหลดข้อมูลจำเพาะของ symbol จาก MT5 แล้วเก็บไว้ใน cache
+        
+        Returns:
+            SymbolSpec หรือ None ถ้าดึงข้อมูลไม่ได้
+        """
+        try:
+            symbol_info = mt5.symbol_info(self.symbol)
+            if symbol_info is None:
+                logger.error(f"Cannot get symbol info for {self.symbol}")
+                return None
+            
+            spec = SymbolSpec.from_info(symbol_info, clock.time())
+            if self.symbol_spec is not None and spec.filling_mode != self.symbol_spec.filling_mode:
+                self.cached_filling_mode = None  # filling modes เปลี่ยน → เลือกใหม่
+            self.symbol_spec = spec
+            logger.debug(f"Symbol spec loaded: {spec}")
+            return spec
+        except Exception as e:
+            logger.error(f"Error loading symbol spec: {e}")
+            return None
+    
+    def get_symbol_spec(self) -> Optional[SymbolSpec]:
+        """
+        คืน SymbolSpec จาก cache (โหลดใหม่เมื่อยังไม่มี หรือเก่าเกิน spec_refresh_interval)
+        
+        Returns:
+            SymbolSpec หรือ None ถ้าดึงข้อมูลไม่ได้
+        """
+        spec = self.symbol_spec
+        if spec is None or clock.time() - spec.loaded_at > self.spec_refresh_interval:
+            spec = self.load_symbol_spec() or spec
+        return spec
+    
+    def invalidate_symbol_spec(self, retcode: Optional[int] = None):
+        """
+        บังคับโหลด symbol spec ใหม่ในการเรียกครั้งถัดไป
+        
+        Args:
+            retcode: retcode ของ order ที่ล้มเหลว (None = invalidate เสมอ)
+        """
+        if retcode is None or retcode in SPEC_ERROR_RETCODES:
+            self.symbol_spec = None
+            self.cached_filling_mode = None
+    
     def get_current_price(self) -> Optional[Dict[str, float]]:
         """
         ดึงราคาปัจจุบันของ XAUUSD
@@ -153,9 +292,8 @@ class MT5Connection:
                 logger.error("MT5 not connected")
                 return None
             
-            # ตรวจสอบ symbol
-            symbol_info = mt5.symbol_info(self.symbol)
-            if symbol_info is None:
+            # ตรวจสอบ symbol (จาก cache ไม่ต้องเรียก symbol_info ทุก tick)
+            if self.get_symbol_spec() is None:
                 logger.error(f"Symbol {self.symbol} not found or not available")
                 return None
             
@@ -182,16 +320,29 @@ class MT5Connection:
             logger.error(f"Error getting price: {e}")
             return None
     
+    def get_rates_array(self, count: int = 200, timeframe=mt5.TIMEFRAME_M15, start_pos: int = 0) -> Optional[np.ndarray]:
+        """
+        ดึงแท่งเทียนล่าสุดเป็น numpy structured array (read-only view จาก rate_cache ไม่แปลงเป็น dict)
+        start_pos = 1 → เฉพาะแท่งที่ปิดแล้ว
+        """
+        if not self.connected:
+            logger.error("MT5 not connected - cannot fetch rates")
+            return None
+        rates = rate_cache.get_rates(self.symbol, timeframe, count, start_pos)
+        if rates is None:
+            logger.error(f"Cannot fetch rates for {self.symbol}")
+        return rates
+    
     def get_recent_rates(self, count: int = 200, timeframe=mt5.TIMEFRAME_M15) -> List[Dict]:
         """
-        ดึงข้อมูลแท่งเทียนล่าสุดจาก MT5
+        ดึงข้อมูลแท่งเทียนล่าสุด (อ่านจาก rate_cache ไม่เรียก MT5 ซ้ำ)
         """
         try:
             if not self.connected:
                 logger.error("MT5 not connected - cannot fetch rates")
                 return []
             
-            rates = mt5.copy_rates_from_pos(self.symbol, timeframe, 0, count)
+            rates = rate_cache.get_rates(self.symbol, timeframe, count)
             if rates is None:
                 logger.error(f"Cannot fetch rates for {self.symbol}")
                 return []
@@ -219,7 +370,7 @@ class MT5Connection:
         รองรับหลาย brokers โดยการตรวจสอบ filling modes ที่รองรับ
         
         Args:
-            symbol_info: ข้อมูล symbol จาก MT5
+            symbol_info: SymbolSpec (หรือข้อมูล symbol จาก MT5)
             
         Returns:
             type_filling ที่เหมาะสม
@@ -284,8 +435,8 @@ class MT5Connection:
         # ใช้ Lock เพื่อป้องกันการส่ง order พร้อมกันจากหลาย thread (Grid และ HG)
         with self.order_lock:
             try:
-                symbol_info = mt5.symbol_info(self.symbol)
-                if symbol_info is None:
+                spec = self.get_symbol_spec()
+                if spec is None:
                     logger.error(f"Symbol {self.symbol} not found")
                     return None
                 
@@ -308,14 +459,14 @@ class MT5Connection:
                         price = tick.bid
                 
                 # ปรับ volume ให้ถูกต้องตาม step (ป้องกัน division by zero)
-                if symbol_info.volume_step > 0:
-                    volume = round(volume / symbol_info.volume_step) * symbol_info.volume_step
+                if spec.volume_step > 0:
+                    volume = round(volume / spec.volume_step) * spec.volume_step
                 else:
                     logger.warning(f"volume_step is 0 for {self.symbol}, using original volume")
                     # ถ้า volume_step เป็น 0 ให้ใช้ volume เดิม
                 
                 # กำหนด type_filling
-                type_filling = self._get_filling_mode(symbol_info)
+                type_filling = self._get_filling_mode(spec)
                 
                 # สร้าง request
                 request = {
@@ -342,8 +493,10 @@ class MT5Connection:
                 
                 if result.retcode != mt5.TRADE_RETCODE_DONE:
                     logger.error(f"Order failed: {result.retcode} - {result.comment}")
+                    self.invalidate_symbol_spec(result.retcode)
                     return None
                 
+                self.trade_revision += 1
                 logger.info(f"Order placed: {order_type.upper()} {volume} lots at {price} | Ticket: {result.order}")
                 return result.order
                 
@@ -388,6 +541,7 @@ class MT5Connection:
                 logger.error(f"Modify failed: {result.retcode} - {result.comment}")
                 return False
             
+            self.trade_revision += 1
             logger.info(f"Position {ticket} modified - SL: {sl}, TP: {tp}")
             return True
             
@@ -431,8 +585,7 @@ class MT5Connection:
                 price = tick.ask
             
             # กำหนด type_filling
-            symbol_info = mt5.symbol_info(self.symbol)
-            type_filling = self._get_filling_mode(symbol_info)
+            type_filling = self._get_filling_mode(self.get_symbol_spec())
             
             # สร้าง request
             request = {
@@ -444,7 +597,7 @@ class MT5Connection:
                 "price": price,
                 "deviation": self.deviation,
                 "magic": self.magic_number,
-                "comment": f"Close {position.comment}",
+                "comment": derived_comment("Close", position.comment),
                 "type_time": mt5.ORDER_TIME_GTC,
                 "type_filling": type_filling,
             }
@@ -453,8 +606,10 @@ class MT5Connection:
             
             if result.retcode != mt5.TRADE_RETCODE_DONE:
                 logger.error(f"Close failed: {result.retcode} - {result.comment}")
+                self.invalidate_symbol_spec(result.retcode)
                 return False
             
+            self.trade_revision += 1
             logger.info(f"Position {ticket} closed - Profit: ${position.profit}")
             return True
             
@@ -474,13 +629,13 @@ class MT5Connection:
                     return False
                 
                 position = positions[0]
-                symbol_info = mt5.symbol_info(self.symbol)
-                if symbol_info is None:
+                spec = self.get_symbol_spec()
+                if spec is None:
                     logger.error(f"Symbol info for {self.symbol} not available")
                     return False
                 
-                volume_step = symbol_info.volume_step if symbol_info.volume_step > 0 else 0.01
-                min_volume = symbol_info.volume_min if symbol_info.volume_min > 0 else volume_step
+                volume_step = spec.volume_step if spec.volume_step > 0 else 0.01
+                min_volume = spec.volume_min if spec.volume_min > 0 else volume_step
                 
                 volume = round(volume / volume_step) * volume_step
                 if volume < min_volume:
@@ -497,7 +652,7 @@ class MT5Connection:
                     return False
                 
                 price = tick.bid if trade_type == mt5.ORDER_TYPE_SELL else tick.ask
-                type_filling = self._get_filling_mode(symbol_info)
+                type_filling = self._get_filling_mode(spec)
                 
                 request = {
                     "action": mt5.TRADE_ACTION_DEAL,
@@ -508,7 +663,7 @@ class MT5Connection:
                     "price": price,
                     "deviation": self.deviation,
                     "magic": self.magic_number,
-                    "comment": f"Partial close {position.comment}",
+                    "comment": derived_comment("Partial close", position.comment),
                     "type_time": mt5.ORDER_TIME_GTC,
                     "type_filling": type_filling,
                 }
@@ -516,8 +671,10 @@ class MT5Connection:
                 result = mt5.order_send(request)
                 if result.retcode != mt5.TRADE_RETCODE_DONE:
                     logger.error(f"Partial close failed: {result.retcode} - {result.comment}")
+                    self.invalidate_symbol_spec(result.retcode)
                     return False
                 
+                self.trade_revision += 1
                 logger.info(f"Partial close executed: ticket {ticket}, volume {volume}")
                 return True
             
@@ -525,40 +682,33 @@ class MT5Connection:
                 logger.error(f"Error partial closing order: {e}")
                 return False
     
-    def get_all_positions(self) -> List[Dict]:
+    def get_positions_table(self) -> PositionTable:
         """
-        ดึงข้อมูล positions ทั้งหมดที่เปิดอยู่
+        ดึง positions ของ bot นี้เป็นตาราง columnar โดยตรง (ไม่สร้าง dict ต่อ position)
         
         Returns:
-            List ของ position dictionaries
+            PositionTable - ว่างถ้าไม่มี positions หรือเกิดข้อผิดพลาด
         """
         try:
             positions = mt5.positions_get(symbol=self.symbol)
             if positions is None:
-                return []
+                return PositionTable()
             
-            result = []
-            for pos in positions:
-                # กรองเฉพาะ positions ของ bot นี้
-                if pos.magic == self.magic_number:
-                    result.append({
-                        'ticket': pos.ticket,
-                        'type': 'buy' if pos.type == mt5.ORDER_TYPE_BUY else 'sell',
-                        'volume': pos.volume,
-                        'open_price': pos.price_open,
-                        'current_price': pos.price_current,
-                        'sl': pos.sl,
-                        'tp': pos.tp,
-                        'profit': pos.profit,
-                        'comment': pos.comment,
-                        'open_time': datetime.fromtimestamp(pos.time)
-                    })
-            
-            return result
+            # กรองเฉพาะ positions ของ bot นี้
+            return load_positions(positions, self.magic_number)
             
         except Exception as e:
             logger.error(f"Error getting positions: {e}")
-            return []
+            return PositionTable()
+    
+    def get_all_positions(self) -> List[Dict]:
+        """
+        ดึงข้อมูล positions ทั้งหมดที่เปิดอยู่
+        
+        Returns:
+            List ของ position dictionaries
+        """
+        return self.get_positions_table().to_dicts()
     
     def get_account_info(self) -> Optional[Dict]:
         """
@@ -590,22 +740,131 @@ class MT5Connection:
             logger.error(f"Error getting account info: {e}")
             return None
     
-    def close_all_positions(self) -> int:
+    def close_positions_batch(self, tickets: Optional[Iterable[int]] = None,
+                              comment: Optional[str] = None,
+                              max_workers: Optional[int] = None,
+                              max_retries: int = BATCH_CLOSE_RETRIES) -> BatchCloseReport:
         """
-        ปิด positions ทั้งหมด (Emergency Stop)
+        ปิดหลาย positions พร้อมกัน (Emergency Stop / ปิดตาม comment)
+        ดึง positions และ tick ครั้งเดียว (filling mode จาก SymbolSpec cache) แล้วส่ง close request
+        โดน requote / price changed → ดึง tick ใหม่แล้วลองซ้ำ (สูงสุด max_retries ครั้ง)
+        ถือ order_lock ตลอดทั้ง batch: Grid / HG / order queue ส่ง order แทรกระหว่างปิดไม่ได้
+        order_lock ไม่ได้ทำให้การเรียก order_send พร้อมกันภายใน batch ปลอดภัย → จำนวน worker ไม่เกิน
+        max_concurrent_orders ของ backend (MT5 จริง = 1 ส่งทีละรายการ, broker จำลองส่งพร้อมกันได้)
         
+        Args:
+            tickets: ปิดเฉพาะ ticket เหล่านี้ (None = ทุกตัวของ symbol)
+            comment: ปิดเฉพาะ position ที่ comment มีข้อความนี้
+            max_workers: จำนวน request ที่ส่งพร้อมกันสูงสุด (None = max_concurrent_orders ของ backend, ไม่เกินค่านั้นเสมอ)
+            max_retries: จำนวนครั้งที่ลองใหม่ต่อ ticket
+            
         Returns:
-            จำนวน positions ที่ปิดสำเร็จ
+            BatchCloseReport (ผลราย ticket + เวลาที่ใช้ทั้งหมด)
         """
-        positions = self.get_all_positions()
-        closed_count = 0
+        started = time.perf_counter()
+        with self.order_lock:
+            report = self._close_positions_locked(tickets, comment, max_workers, max_retries)
+            closed = report.closed_count
+            self.trade_revision += closed
+        report.wall_time = time.perf_counter() - started
+        for outcome in report.failed:
+            logger.error(f"Batch close failed: ticket {outcome.ticket} | retcode {outcome.retcode} | "
+                         f"attempts {outcome.attempts} | {outcome.comment}")
+        logger.info(f"Batch close: {closed}/{len(report.outcomes)} positions closed in {report.wall_time * 1000:.0f} ms")
+        return report
+    
+    def _close_positions_locked(self, tickets: Optional[Iterable[int]], comment: Optional[str],
+                                max_workers: Optional[int], max_retries: int) -> BatchCloseReport:
+        """ส่วนของ close_positions_batch ที่ทำภายใต้ order_lock"""
+        report = BatchCloseReport()
+        try:
+            # กรองเฉพาะ positions ของ bot นี้ (ไม่ปิด manual trades / EA อื่นบน symbol เดียวกัน)
+            positions = [pos for pos in mt5.positions_get(symbol=self.symbol) or ()
+                         if pos.magic == self.magic_number]
+            if tickets is not None:
+                wanted = set(tickets)
+                positions = [pos for pos in positions if pos.ticket in wanted]
+            if comment is not None:
+                positions = [pos for pos in positions if comment in pos.comment]
+            if not positions:
+                return report
+            
+            tick = mt5.symbol_info_tick(self.symbol)
+            spec = self.get_symbol_spec()
+            if tick is None or spec is None:
+                logger.error(f"Cannot get tick/symbol data for {self.symbol} - batch close aborted")
+                report.outcomes = [CloseOutcome(pos.ticket, False) for pos in positions]
+                return report
+            type_filling = self._get_filling_mode(spec)
+            
+            limit = max(1, mt5.max_concurrent_orders)
+            workers = max(1, min(limit if max_workers is None else max_workers, limit, len(positions)))
+            close = lambda pos: self._close_with_retry(pos, tick, type_filling, max_retries)
+            if workers == 1:
+                report.outcomes = [close(pos) for pos in positions]
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-close') as executor:
+                    report.outcomes = list(executor.map(close, positions))
+        except Exception as e:
+            logger.error(f"Error in batch close: {e}")
+        return report
+    
+    def _close_with_retry(self, position, tick, type_filling: int, max_retries: int) -> CloseOutcome:
+        """ส่ง close request ของ position หนึ่งตัว (ทำงานใน worker ของ batch close)"""
+        outcome = CloseOutcome(position.ticket, False, profit=position.profit)
+        if position.type == mt5.ORDER_TYPE_BUY:
+            trade_type = mt5.ORDER_TYPE_SELL
+        else:
+            trade_type = mt5.ORDER_TYPE_BUY
+        retry_codes = (mt5.TRADE_RETCODE_REQUOTE, mt5.TRADE_RETCODE_PRICE_CHANGED)
         
-        for pos in positions:
-            if self.close_order(pos['ticket']):
-                closed_count += 1
+        while outcome.attempts <= max_retries:
+            if outcome.attempts > 0:
+                # requote → ดึงราคาใหม่ก่อนส่งซ้ำ
+                tick = mt5.symbol_info_tick(self.symbol) or tick
+            price = tick.bid if trade_type == mt5.ORDER_TYPE_SELL else tick.ask
+            request = {
+                "action": mt5.TRADE_ACTION_DEAL,
+                "symbol": self.symbol,
+                "volume": position.volume,
+                "type": trade_type,
+                "position": position.ticket,
+                "price": price,
+                "deviation": self.deviation,
+                "magic": self.magic_number,
+                "comment": derived_comment("Close", position.comment),
+                "type_time": mt5.ORDER_TIME_GTC,
+                "type_filling": type_filling,
+            }
+            outcome.attempts += 1
+            try:
+                result = mt5.order_send(request)
+            except Exception as e:
+                outcome.comment = str(e)
+                return outcome
+            if result is None:
+                outcome.comment = "order_send returned None"
+                return outcome
+            outcome.retcode = result.retcode
+            outcome.comment = result.comment
+            if result.retcode == mt5.TRADE_RETCODE_DONE:
+                outcome.success = True
+                outcome.price = price
+                return outcome
+            if result.retcode not in retry_codes:
+                return outcome
+        return outcome
+    
+    def close_all_positions(self) -> int:
+        """
+        ปิด positions ทั้งหมด (Emergency Stop) ผ่าน batch close
         
-        logger.info(f"Emergency Stop: Closed {closed_count} positions")
-        return closed_count
+        Returns:
+            จำนวน positions ที่ปิดสำเร็จ
+        """
+        report = self.close_positions_batch()
+        logger.info(f"Emergency Stop: Closed {report.closed_count} positions")
+        return report.closed_count
 
 
 # สร้าง instance หลักสำหรับใช้งาน
@@ -0,0 +1,453 @@
+# optimizer.py
+# หาค่าพารามิเตอร์ Grid/HG ที่ดีที่สุดด้วย backtest แบบขนาน (ProcessPoolExecutor) + walk-forward validation
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields, replace
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import copy
+import csv
+import itertools
+import logging
+import os
+import time
+import numpy as np
+from config import config, GridSettings, HGSettings
+import hg_profiles
+from hg_profiles import HGProfile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# dtype ของ tick ที่แชร์ให้ worker ผ่าน shared memory
+TICK_DTYPE = np.dtype([('time', '<i8'), ('bid', '<f8'), ('ask', '<f8')])
+
+# ค่าที่ใช้ค้นหาเมื่อไม่ได้ระบุ --param
+DEFAULT_SPACE = {
+    'grid.auto_resilience_distance': [2000, 5000, 8000],
+    'grid.auto_drawdown_ratio': [0.4, 0.6, 0.8],
+    'grid.auto_max_levels': [20, 40],
+    'profile.zone_width_factor': [1.0, 1.4],
+    'profile.partial_close_ratio': [0.35, 0.5],
+}
+
+# ค่า config พื้นฐานของทุกชุด: พารามิเตอร์ resilience มีผลเฉพาะ Auto Mode
+BASE_OVERRIDES = {
+    'grid.auto_mode': True,
+    'grid.auto_strategy': 'resilience',
+}
+
+SECTIONS = {
+    'grid': {f.name: f for f in fields(GridSettings)},
+    'hg': {f.name: f for f in fields(HGSettings)},
+    'profile': {f.name: f for f in fields(HGProfile) if f.name != 'id'},
+}
+
+
+@dataclass(frozen=True)
+class WalkForwardWindow:
+    """ช่วงข้อมูลของ walk-forward หนึ่งรอบ (index ของ tick)"""
+    index: int
+    train_start: int
+    train_end: int
+    test_start: int
+    test_end: int
+
+
+class SharedPriceHistory:
+    """
+    เก็บ tick ย้อนหลังไว้ใน shared memory ก้อนเดียว
+    worker ทุกตัว attach แล้วอ่านเป็น numpy view (ไม่ copy ข้อมูลต่อ worker)
+    """
+
+    def __init__(self, times: np.ndarray, bids: np.ndarray, asks: np.ndarray):
+        self.length = len(times)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, self.length * TICK_DTYPE.itemsize))
+        self.ticks = np.ndarray(self.length, dtype=TICK_DTYPE, buffer=self.shm.buf)
+        self.ticks['time'] = times
+        self.ticks['bid'] = bids
+        self.ticks['ask'] = asks
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @staticmethod
+    def attach(name: str, length: int) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+        """
+        เปิด shared memory ที่สร้างไว้แล้ว (ใช้ใน worker)
+
+        Returns:
+            (SharedMemory, structured array แบบ TICK_DTYPE ที่ชี้ไปยัง buffer เดียวกัน)
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        return shm, np.ndarray(length, dtype=TICK_DTYPE, buffer=shm.buf)
+
+    def close(self):
+        """ปิดและลบ shared memory"""
+        self.ticks = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _cast_value(field_type: Any, text: str) -> Any:
+    type_name = getattr(field_type, '__name__', str(field_type))
+    if type_name == 'bool':
+        return str(text).strip().lower() in ('1', 'true', 'yes', 'on')
+    if type_name == 'int':
+        return int(float(text))
+    if type_name == 'float':
+        return float(text)
+    return str(text).strip()
+
+
+def resolve_param(key: str) -> Tuple[str, str]:
+    """
+    แปลงชื่อพารามิเตอร์เป็น (section, field)
+    รองรับ 'grid.x', 'hg.x', 'profile.x' หรือชื่อเปล่า (ค้นหาใน grid → hg → profile)
+    """
+    if '.' in key:
+        section, name = key.split('.', 1)
+        if section not in SECTIONS or name not in SECTIONS[section]:
+            raise ValueError(f"Unknown parameter: {key}")
+        return section, name
+    for section, known in SECTIONS.items():
+        if key in known:
+            return section, key
+    raise ValueError(f"Unknown parameter: {key}")
+
+
+def parse_param_spec(spec: str) -> Tuple[str, List[Any]]:
+    """
+    แปลง 'auto_max_levels=20,40' เป็น ('grid.auto_max_levels', [20, 40])
+    """
+    if '=' not in spec:
+        raise ValueError(f"Invalid parameter spec (expected name=v1,v2): {spec}")
+    key, values = spec.split('=', 1)
+    section, name = resolve_param(key.strip())
+    field_type = SECTIONS[section][name].type
+    parsed = [_cast_value(field_type, v) for v in values.split(',') if v.strip()]
+    if not parsed:
+        raise ValueError(f"No values for parameter: {key}")
+    return f"{section}.{name}", parsed
+
+
+def build_combinations(space: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """สร้างทุกชุดพารามิเตอร์ (cartesian product) จาก search space"""
+    keys = list(space.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def walk_forward_windows(times: np.ndarray, train_days: float, test_days: float,
+                         step_days: Optional[float] = None) -> List[WalkForwardWindow]:
+    """
+    แบ่งข้อมูลเป็นช่วง train/test แบบ rolling walk-forward
+
+    Args:
+        times: เวลา tick (unix seconds, เรียงจากเก่าไปใหม่)
+        train_days: ความยาวช่วง in-sample (วัน)
+        test_days: ความยาวช่วง out-of-sample (วัน)
+        step_days: ระยะเลื่อนแต่ละรอบ (None = test_days)
+
+    Returns:
+        List ของ WalkForwardWindow
+    """
+    times = np.asarray(times)
+    if len(times) == 0:
+        return []
+    day = 86400
+    step = (step_days or test_days) * day
+    windows = []
+    start_time = times[0]
+    while True:
+        train_end_time = start_time + train_days * day
+        test_end_time = train_end_time + test_days * day
+        if test_end_time > times[-1] + 1:
+            break
+        train_start, train_end, test_end = np.searchsorted(times, [start_time, train_end_time, test_end_time])
+        if train_end > train_start and test_end > train_end:
+            windows.append(WalkForwardWindow(len(windows), int(train_start), int(train_end),
+                                             int(train_end), int(test_end)))
+        start_time += step
+    return windows
+
+
+def score_result(metrics: Dict, metric: str = 'rdd') -> float:
+    """
+    คะแนนของผล backtest (มากกว่า = ดีกว่า)
+    - net: กำไรสุทธิ
+    - rdd: กำไรสุทธิ / max drawdown (return-to-drawdown)
+    ชุดที่โดน stop out ได้คะแนนต่ำสุดเสมอ
+    """
+    if metrics['stop_outs'] > 0:
+        return -1e9 + metrics['net_profit']
+    if metric == 'net':
+        return metrics['net_profit']
+    return metrics['net_profit'] / max(metrics['max_drawdown'], 1.0)
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(shm_name: str, length: int, account: Dict):
+    """initializer ของ worker: attach shared memory และเก็บค่า config พื้นฐาน"""
+    shm, ticks = SharedPriceHistory.attach(shm_name, length)
+    config.persist = False
+    _worker_state.update({
+        'shm': shm,
+        'ticks': ticks,
+        'account': account,
+        'grid': copy.deepcopy(config.grid),
+        'hg': copy.deepcopy(config.hg),
+        'profiles': list(hg_profiles.HG_PROFILES),
+    })
+
+
+def _apply_params(params: Dict[str, Any]):
+    """ตั้งค่า config.grid / config.hg / HG_PROFILES ของ worker ตามชุดพารามิเตอร์"""
+    config.grid = copy.deepcopy(_worker_state['grid'])
+    config.hg = copy.deepcopy(_worker_state['hg'])
+    profile_overrides = {}
+    for key, value in {**BASE_OVERRIDES, **params}.items():
+        section, name = resolve_param(key)
+        if section == 'grid':
+            setattr(config.grid, name, value)
+        elif section == 'hg':
+            setattr(config.hg, name, value)
+        else:
+            profile_overrides[name] = value
+    # override ทุกโปรไฟล์ (โปรไฟล์ที่ใช้จริงถูกเลือกตาม auto_resilience_distance)
+    hg_profiles.HG_PROFILES[:] = [replace(p, **profile_overrides) for p in _worker_state['profiles']]
+
+
+def _run_task(task: Tuple[int, int, str, int, int, int, Dict[str, Any]]) -> Dict:
+    """รัน backtest หนึ่งชุดพารามิเตอร์บนหนึ่งช่วงข้อมูล แล้วคืนเฉพาะตัวเลขสรุป"""
+    from backtester import Backtester
+
+    combo_id, window_id, segment, warmup_start, start, end, params = task
+    ticks = _worker_state['ticks']
+    account = _worker_state['account']
+    window = ticks[warmup_start:end]
+    _apply_params(params)
+
+    backtester = Backtester(balance=account['balance'], leverage=account['leverage'],
+                            cycle_secs=account['cycle_secs'], quiet=True)
+    backtester.load_ticks(window['time'], window['bid'], window['ask'], warmup_ticks=start - warmup_start)
+    result = backtester.run()
+    return {
+        'combo_id': combo_id,
+        'window': window_id,
+        'segment': segment,
+        'net_profit': result.net_profit,
+        'max_drawdown': result.max_drawdown,
+        'max_drawdown_pct': result.max_drawdown_pct,
+        'min_margin_level': result.min_margin_level,
+        'deals': len(result.trades),
+        'stop_outs': result.statistics.get('stop_outs', 0),
+        'elapsed_secs': result.elapsed_secs,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Optimizer
+# ---------------------------------------------------------------------------
+
+class Optimizer:
+    """
+    กระจาย backtest ของทุกชุดพารามิเตอร์ × ทุก walk-forward window ไปยังทุก core
+    - tick ย้อนหลังอยู่ใน shared memory ก้อนเดียว
+    - ทุกชุดถูกทดสอบทั้งช่วง train (in-sample) และ test (out-of-sample)
+    - ต่อ window เลือกชุดที่ดีที่สุดจาก train แล้วรายงานผลบน test (walk-forward)
+    """
+
+    def __init__(self, balance: float = 10000.0, leverage: int = 100, cycle_secs: float = 1.0,
+                 warmup_secs: float = 6 * 3600, metric: str = 'rdd', workers: Optional[int] = None):
+        """
+        Args:
+            balance / leverage: บัญชีจำลอง
+            cycle_secs: ระยะห่างรอบ monitoring (เวลาจำลอง)
+            warmup_secs: ข้อมูลก่อนแต่ละช่วงที่ใช้สร้างแท่งเทียน (ATR/zones) โดยยังไม่เทรด
+            metric: 'rdd' หรือ 'net' (ดู score_result)
+            workers: จำนวน process (None = ทุก core)
+        """
+        self.account = {'balance': balance, 'leverage': leverage, 'cycle_secs': cycle_secs}
+        self.warmup_secs = warmup_secs
+        self.metric = metric
+        self.workers = workers or os.cpu_count() or 1
+
+    def _build_tasks(self, times: np.ndarray, combos: List[Dict], windows: List[WalkForwardWindow]) -> List[Tuple]:
+        tasks = []
+        for window in windows:
+            for segment, start, end in (('train', window.train_start, window.train_end),
+                                        ('test', window.test_start, window.test_end)):
+                warmup_start = int(np.searchsorted(times, times[start] - self.warmup_secs))
+                for combo_id, params in enumerate(combos):
+                    tasks.append((combo_id, window.index, segment, warmup_start, start, end, params))
+        return tasks
+
+    def run(self, times: np.ndarray, bids: np.ndarray, asks: np.ndarray,
+            combos: List[Dict], windows: List[WalkForwardWindow]) -> Dict:
+        """
+        รัน optimization
+
+        Returns:
+            Dict ที่มี 'runs' (ผลทุก backtest), 'ranking' (สรุปต่อชุดเรียงตามคะแนน out-of-sample)
+            และ 'walk_forward' (ชุดที่ถูกเลือกในแต่ละ window พร้อมผล out-of-sample)
+        """
+        if not combos or not windows:
+            raise ValueError("Nothing to optimize (no combinations or walk-forward windows)")
+
+        started = time.perf_counter()
+        history = SharedPriceHistory(times, bids, asks)
+        tasks = self._build_tasks(history.ticks['time'], combos, windows)
+        logger.info(f"Optimizing {len(combos)} combinations x {len(windows)} windows "
+                    f"({len(tasks)} backtests) on {self.workers} workers")
+
+        runs = []
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(history.name, history.length, self.account)) as executor:
+                futures = [executor.submit(_run_task, task) for task in tasks]
+                report_every = max(1, len(futures) // 10)
+                for done, future in enumerate(as_completed(futures), 1):
+                    try:
+                        row = future.result()
+                    except Exception as e:
+                        logger.error(f"Backtest failed: {e}")
+                        continue
+                    row['score'] = score_result(row, self.metric)
+                    runs.append(row)
+                    if done % report_every == 0 or done == len(futures):
+                        logger.info(f"Progress: {done}/{len(futures)} ({time.perf_counter() - started:.0f}s)")
+        finally:
+            history.close()
+
+        return {
+            'runs': runs,
+            'ranking': self._rank(runs, combos),
+            'walk_forward': self._walk_forward(runs, combos, windows),
+            'elapsed_secs': time.perf_counter() - started,
+        }
+
+    def _rank(self, runs: List[Dict], combos: List[Dict]) -> List[Dict]:
+        """สรุปผลต่อชุดพารามิเตอร์ แล้วเรียงตามคะแนนเฉลี่ยของช่วง test"""
+        ranking = []
+        for combo_id, params in enumerate(combos):
+            train = [r for r in runs if r['combo_id'] == combo_id and r['segment'] == 'train']
+            test = [r for r in runs if r['combo_id'] == combo_id and r['segment'] == 'test']
+            if not test:
+                continue
+            ranking.append({
+                'combo_id': combo_id,
+                **params,
+                'is_score': float(np.mean([r['score'] for r in train])) if train else float('nan'),
+                'is_net': float(sum(r['net_profit'] for r in train)),
+                'oos_score': float(np.mean([r['score'] for r in test])),
+                'oos_net': float(sum(r['net_profit'] for r in test)),
+                'oos_max_dd': float(max(r['max_drawdown'] for r in test)),
+                'oos_min_margin_level': float(min(r['min_margin_level'] for r in test)),
+                'oos_deals': int(sum(r['deals'] for r in test)),
+                'stop_outs': int(sum(r['stop_outs'] for r in train + test)),
+            })
+        ranking.sort(key=lambda row: row['oos_score'], reverse=True)
+        return ranking
+
+    def _walk_forward(self, runs: List[Dict], combos: List[Dict], windows: List[WalkForwardWindow]) -> List[Dict]:
+        """เลือกชุดที่ดีที่สุดจากช่วง train ของแต่ละ window แล้วดูผลจริงบนช่วง test"""
+        selected = []
+        for window in windows:
+            train = [r for r in runs if r['window'] == window.index and r['segment'] == 'train']
+            if not train:
+                continue
+            best = max(train, key=lambda r: r['score'])
+            test = next((r for r in runs if r['window'] == window.index and r['segment'] == 'test'
+                         and r['combo_id'] == best['combo_id']), None)
+            selected.append({
+                'window': window.index,
+                'combo_id': best['combo_id'],
+                'params': combos[best['combo_id']],
+                'is_score': best['score'],
+                'oos_score': test['score'] if test else float('nan'),
+                'oos_net': test['net_profit'] if test else float('nan'),
+            })
+        return selected
+
+
+def format_ranking(ranking: List[Dict], param_keys: List[str], top: int = 20) -> str:
+    """แปลง ranking เป็นตารางข้อความ"""
+    short = [key.split('.', 1)[1] for key in param_keys]
+    widths = [max(len(name), 8) for name in short]
+    header = f"{'#':>3} " + " ".join(f"{name:>{w}}" for name, w in zip(short, widths)) + \
+             f" {'IS score':>9} {'OOS score':>9} {'OOS net$':>10} {'OOS DD$':>9} {'SO':>3}"
+    lines = [header, "-" * len(header)]
+    for rank, row in enumerate(ranking[:top], 1):
+        values = " ".join(f"{str(row[key]):>{w}}" for key, w in zip(param_keys, widths))
+        lines.append(f"{rank:>3} {values} {row['is_score']:>9.2f} {row['oos_score']:>9.2f} "
+                     f"{row['oos_net']:>10.2f} {row['oos_max_dd']:>9.2f} {row['stop_outs']:>3}")
+    return "\n".join(lines)
+
+
+def save_ranking_csv(ranking: List[Dict], path: str):
+    """บันทึก ranking เป็น CSV"""
+    if not ranking:
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(ranking[0].keys()))
+        writer.writeheader()
+        writer.writerows(ranking)
+
+
+def main():
+    from backtester import bars_to_ticks, load_bars_csv
+
+    parser = argparse.ArgumentParser(description="Parallel Grid/HG optimizer with walk-forward validation")
+    parser.add_argument('bars', help="CSV ของแท่งเทียน (time,open,high,low,close[,tick_volume,spread])")
+    parser.add_argument('--param', action='append', default=[],
+                        help="พารามิเตอร์ที่ค้นหา เช่น auto_max_levels=20,40 หรือ profile.score_threshold=0.55,0.65")
+    parser.add_argument('--train-days', type=float, default=20)
+    parser.add_argument('--test-days', type=float, default=5)
+    parser.add_argument('--step-days', type=float, default=None)
+    parser.add_argument('--warmup-hours', type=float, default=6)
+    parser.add_argument('--metric', choices=['rdd', 'net'], default='rdd')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--leverage', type=int, default=100)
+    parser.add_argument('--spread', type=float, default=0.2, help="spread คงที่ (หน่วยราคา)")
+    parser.add_argument('--cycle-secs', type=float, default=1.0)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', default=None, help="บันทึก ranking ทั้งหมดเป็น CSV")
+    args = parser.parse_args()
+
+    space = dict(parse_param_spec(spec) for spec in args.param) if args.param else dict(DEFAULT_SPACE)
+    combos = build_combinations(space)
+    times, bids, asks = bars_to_ticks(load_bars_csv(args.bars), args.spread)
+    windows = walk_forward_windows(times, args.train_days, args.test_days, args.step_days)
+    if not windows:
+        parser.error("Not enough data for one train/test window")
+
+    optimizer = Optimizer(balance=args.balance, leverage=args.leverage, cycle_secs=args.cycle_secs,
+                          warmup_secs=args.warmup_hours * 3600, metric=args.metric, workers=args.workers)
+    report = optimizer.run(times, bids, asks, combos, windows)
+
+    print(format_ranking(report['ranking'], list(space.keys()), args.top))
+    print("\nWalk-forward selection:")
+    total = 0.0
+    for row in report['walk_forward']:
+        total += 0.0 if np.isnan(row['oos_net']) else row['oos_net']
+        print(f"  window {row['window']}: combo {row['combo_id']} {row['params']} → OOS net ${row['oos_net']:,.2f}")
+    print(f"  total OOS net: ${total:,.2f}")
+    print(f"\n{len(report['runs'])} backtests in {report['elapsed_secs']:.1f}s")
+    if args.output:
+        save_ranking_csv(report['ranking'], args.output)
+
+
+if __name__ == '__main__':
+    main()
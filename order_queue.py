@@ -0,0 +1,240 @@
+# order_queue.py
+# คิวคำสั่งเปิด order (order intent) ส่งผ่าน executor thread แยก ไม่ให้ monitoring loop รอ round-trip ของ broker
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+import threading
+from mt5_connection import mt5_connection
+from config import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# สถานะของ intent
+INTENT_PENDING = 'pending'      # อยู่ในคิว รอ executor
+INTENT_SUBMITTED = 'submitted'  # executor กำลังส่ง order_send
+INTENT_FILLED = 'filled'        # ได้ ticket แล้ว
+INTENT_FAILED = 'failed'        # ส่งไม่สำเร็จ
+
+DEFAULT_BUCKET_PIPS = 5.0  # intent ฝั่ง/role เดียวกันที่ราคาห่างกันไม่เกินช่วงนี้ถือว่าซ้ำ
+
+
+@dataclass(eq=False)
+class OrderIntent:
+    """คำสั่งเปิด order หนึ่งรายการ พร้อมสถานะและ future ของ ticket"""
+    side: str  # 'buy' / 'sell'
+    volume: float
+    role: str  # 'grid' / 'hg'
+    bucket: int
+    price: float  # ราคาที่ใช้ตัดสินใจ (order จริงใช้ market price)
+    tp: Optional[float] = None
+    sl: Optional[float] = None
+    comment: str = ""
+    context: Dict = field(default_factory=dict)  # ข้อมูลของผู้ส่ง (เช่น level_key)
+    on_done: Optional[Callable[['OrderIntent'], None]] = None
+    state: str = INTENT_PENDING
+    ticket: Optional[int] = None
+    revision: int = 0  # trade_revision หลังส่งสำเร็จ (snapshot ที่ revision >= ค่านี้เห็น position แล้ว)
+    generation: int = 0  # รอบของคิว (intent จากก่อน reset() จะไม่ถูก dispatch)
+    future: Future = field(default_factory=Future, repr=False)
+
+    @property
+    def key(self) -> Tuple[str, int, str]:
+        return (self.side, self.bucket, self.role)
+
+    @property
+    def active(self) -> bool:
+        return self.state in (INTENT_PENDING, INTENT_SUBMITTED)
+
+
+class OrderQueue:
+    """
+    คิว order intent ที่ส่งจริงบน executor thread เดียว (เรียงตามลำดับที่ส่งเข้ามา)
+    - dedupe ตาม (side, price bucket, role): intent ที่ยัง active อยู่จะคืน future เดิม
+    - ผลลัพธ์ (on_done) ถูกเรียกใน thread ของ monitoring loop ผ่าน dispatch_completed()
+      ไม่ใช่ใน executor thread → managers แก้ state ของตัวเองได้โดยไม่ต้องมี lock
+    - synchronous = True ส่งทันทีใน thread ที่เรียก (ใช้ใน backtest ให้ผลลัพธ์ deterministic)
+    """
+
+    def __init__(self, bucket_pips: float = DEFAULT_BUCKET_PIPS, synchronous: bool = False):
+        self.bucket_pips = bucket_pips
+        self.synchronous = synchronous
+        self.active_intents: Dict[Tuple[str, int, str], OrderIntent] = {}
+        self.completed = deque()  # intent ที่เสร็จแล้ว รอ dispatch
+        self.unsettled: List[OrderIntent] = []  # ส่งสำเร็จแล้ว แต่ snapshot ยังไม่เห็น position
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def bucket(self, price: float) -> int:
+        return int(round(config.price_to_pips(price) / self.bucket_pips))
+
+    def submit(self, side: str, volume: float, role: str, price: float,
+               tp: Optional[float] = None, sl: Optional[float] = None, comment: str = "",
+               context: Optional[Dict] = None,
+               on_done: Optional[Callable[[OrderIntent], None]] = None) -> Future:
+        """
+        ส่ง order intent เข้าคิว
+
+        Args:
+            side: 'buy' หรือ 'sell'
+            volume: ขนาด lot
+            role: 'grid' หรือ 'hg'
+            price: ราคาที่ใช้ตัดสินใจ (ใช้จัด bucket สำหรับ dedupe)
+            tp, sl, comment: ส่งต่อให้ place_order
+            context: ข้อมูลของผู้ส่ง (คืนกลับมาใน intent)
+            on_done: เรียกเมื่อ intent เสร็จ (ทั้งสำเร็จและล้มเหลว) ใน thread ที่เรียก dispatch_completed()
+
+        Returns:
+            Future ที่ได้ ticket (หรือ None ถ้าล้มเหลว)
+        """
+        intent = OrderIntent(side=side, volume=volume, role=role, bucket=self.bucket(price), price=price,
+                             tp=tp, sl=sl, comment=comment, context=context or {}, on_done=on_done)
+        with self._lock:
+            intent.generation = self.generation
+            existing = self.active_intents.get(intent.key)
+            if existing is not None:
+                logger.debug(f"Duplicate {role} {side.upper()} intent at {price:.2f} - reusing pending intent")
+                return existing.future
+            self.active_intents[intent.key] = intent
+
+        if self.synchronous:
+            self._execute(intent)
+            self.dispatch_completed()
+        else:
+            self._get_executor().submit(self._execute, intent)
+        return intent.future
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='order-exec')
+            return self._executor
+
+    def _execute(self, intent: OrderIntent):
+        """ส่ง order จริง (ทำงานบน executor thread หรือ thread ที่เรียกในโหมด synchronous)"""
+        with self._lock:
+            if intent.generation != self.generation:
+                # ถูกยกเลิกด้วย reset() ระหว่างรอคิว → ไม่ส่ง order
+                intent.state = INTENT_FAILED
+                cancelled = True
+            else:
+                intent.state = INTENT_SUBMITTED
+                cancelled = False
+        if cancelled:
+            intent.future.set_result(None)
+            return
+        ticket = None
+        try:
+            ticket = mt5_connection.place_order(
+                order_type=intent.side,
+                volume=intent.volume,
+                sl=intent.sl,
+                tp=intent.tp,
+                comment=intent.comment
+            )
+        except Exception as e:
+            logger.error(f"Error executing {intent.role} {intent.side.upper()} intent: {e}")
+        with self._lock:
+            intent.ticket = ticket
+            intent.state = INTENT_FILLED if ticket else INTENT_FAILED
+            intent.revision = mt5_connection.trade_revision
+            if self.active_intents.get(intent.key) is intent:
+                del self.active_intents[intent.key]
+            if intent.generation == self.generation:
+                if ticket:
+                    self.unsettled.append(intent)
+                self.completed.append(intent)
+        intent.future.set_result(ticket)
+
+    def dispatch_completed(self) -> int:
+        """
+        เรียก on_done ของ intent ที่เสร็จแล้ว (เรียกจาก monitoring loop ทุกรอบ)
+
+        Returns:
+            จำนวน intent ที่ dispatch
+        """
+        count = 0
+        while True:
+            with self._lock:
+                if not self.completed:
+                    return count
+                intent = self.completed.popleft()
+            count += 1
+            if intent.on_done is None:
+                continue
+            try:
+                intent.on_done(intent)
+            except Exception as e:
+                logger.error(f"Error in order intent callback: {e}")
+
+    def has_active(self, role: str, side: Optional[str] = None) -> bool:
+        """มี intent ที่ยังไม่เสร็จ (รอคิว/กำลังส่ง) ของ role (และฝั่ง) นี้หรือไม่"""
+        with self._lock:
+            return any(intent.role == role and (side is None or intent.side == side)
+                       for intent in self.active_intents.values())
+
+    def has_unsettled(self, role: str, snapshot_revision: int) -> bool:
+        """
+        มี intent ของ role นี้ที่ยังไม่สะท้อนใน snapshot หรือไม่
+        (ยังไม่เสร็จ หรือส่งสำเร็จหลังจาก snapshot ถูกจับ) → ใช้แทนการรอเวลาแบบเดาเอา
+        """
+        with self._lock:
+            self.unsettled = [intent for intent in self.unsettled if intent.revision > snapshot_revision]
+            if any(intent.role == role for intent in self.unsettled):
+                return True
+            return any(intent.role == role for intent in self.active_intents.values())
+
+    def reset(self):
+        """
+        ล้าง intent ทั้งหมด: intent ที่รอคิวจะไม่ถูกส่ง
+        (intent ที่กำลังส่งอยู่จะยังทำงานจนจบ แต่ไม่ถูก dispatch)
+        """
+        with self._lock:
+            self.generation += 1
+            self.active_intents.clear()
+            self.completed.clear()
+            self.unsettled = []
+    
+    def drain(self, timeout: float = 10.0) -> bool:
+        """
+        รอจน executor ทำงานที่ค้างอยู่เสร็จ (intent ที่กำลังส่งอยู่ถึง broker แล้ว)
+        
+        Returns:
+            True ถ้าเสร็จภายใน timeout
+        """
+        with self._lock:
+            executor = self._executor
+        if executor is None:
+            return True
+        try:
+            # executor มี worker เดียว → งานนี้เสร็จเมื่อทุกงานก่อนหน้าเสร็จแล้ว
+            executor.submit(lambda: None).result(timeout=timeout)
+            return True
+        except Exception as e:
+            logger.error(f"Order queue drain timed out: {e}")
+            return False
+    
+    def cancel_all(self, timeout: float = 10.0) -> bool:
+        """
+        ยกเลิก intent ที่รอคิวและรอ intent ที่กำลังส่งให้จบ (เรียกทุกครั้งที่หยุดเทรด ก่อนปิด positions)
+        
+        Returns:
+            True ถ้าไม่มีงานค้างแล้ว
+        """
+        self.reset()
+        return self.drain(timeout)
+
+    def shutdown(self, wait: bool = True):
+        """ปิด executor (รอ intent ที่ค้างอยู่ให้ส่งจนจบถ้า wait = True)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+# สร้าง instance หลักสำหรับใช้งาน
+order_queue = OrderQueue()
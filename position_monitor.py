@@ -1,43 +1,77 @@
 # position_monitor.py
 # ไฟล์ติดตามและจัดการ positions ทั้งหมด
 
-from typing import Dict, List
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
 import logging
 from mt5_connection import mt5_connection
 from config import config
+from grid_ladder import GridLadder
+from position_table import PositionTable, ROLE_GRID, ROLE_HG
+from position_roles import CommentInfo, RoleCache, ROLE_NAMES
+from exposure_book import ExposureBook
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ประเภท event จากการเปรียบเทียบ positions ระหว่างรอบ
+EVENT_OPENED = 'opened'
+EVENT_CLOSED = 'closed'
+EVENT_VOLUME_CHANGED = 'volume_changed'
+EVENT_SLTP_CHANGED = 'sltp_changed'
+
+
+@dataclass(frozen=True)
+class PositionEvent:
+    """การเปลี่ยนแปลงของ position หนึ่งตัวระหว่างรอบ update"""
+    kind: str  # EVENT_OPENED / EVENT_CLOSED / EVENT_VOLUME_CHANGED / EVENT_SLTP_CHANGED
+    ticket: int
+    role: str  # 'grid', 'hg' หรือ 'other'
+    position: Dict  # ข้อมูลล่าสุด (กรณี closed = ข้อมูลสุดท้ายที่เห็น)
+    previous: Optional[Dict] = None
+
 
 class PositionMonitor:
     """คลาสสำหรับติดตามและจัดการ positions"""
     
     def __init__(self):
-        self.positions = []
+        self.positions: Tuple[Dict, ...] = ()
         self.total_pnl = 0.0
-        self.grid_positions = []
-        self.hg_positions = []
+        self.grid_positions: Tuple[Dict, ...] = ()
+        self.hg_positions: Tuple[Dict, ...] = ()
         self.alerts = []
         
+        # Index ตาม ticket / ฝั่ง / role (สร้างใหม่เฉพาะรอบที่มีการเปลี่ยนแปลง และไม่แก้ไขภายหลัง)
+        self.positions_by_ticket: Dict[int, Dict] = {}
+        self.grid_by_ticket: Dict[int, Dict] = {}
+        self.hg_by_ticket: Dict[int, Dict] = {}
+        self.grid_tickets: FrozenSet[int] = frozenset()
+        self.grid_by_side: Dict[str, Tuple[Dict, ...]] = {'buy': (), 'sell': ()}
+        self.hg_by_side: Dict[str, Tuple[Dict, ...]] = {'buy': (), 'sell': ()}
+        # ราคาเปิด Grid เรียงแยกฝั่ง (อัพเดทจาก opened / closed events)
+        self.grid_ladder = GridLadder()
+        # ตาราง columnar ของ positions (ใช้คำนวณผลรวม P&L / volume)
+        self.table = PositionTable()
+        # role + metadata จาก comment ต่อ ticket (parse ครั้งเดียวตอนเห็นครั้งแรก)
+        self.roles = RoleCache()
+        # volume / ราคาเฉลี่ย / P&L ต่อ role และฝั่ง (อัพเดทจาก events)
+        self.exposure = ExposureBook()
+        
+        # Events จากการ diff กับรอบก่อน และผู้รับ events
+        self.last_events: List[PositionEvent] = []
+        self._subscribers: List[Callable[[List[PositionEvent]], None]] = []
+        
     def update_all_positions(self):
         """
         อัพเดทข้อมูล positions ทั้งหมดจาก MT5
         แยกเป็น Grid positions และ HG positions
+        พร้อมสร้าง index ตาม ticket / ฝั่ง / role ในรอบเดียว
         """
         try:
-            self.positions = mt5_connection.get_all_positions()
-            
-            # แยก positions
-            self.grid_positions = []
-            self.hg_positions = []
-            
-            for pos in self.positions:
-                if config.mt5.comment_hg in pos['comment']:
-                    self.hg_positions.append(pos)
-                elif (config.mt5.comment_grid in pos['comment'] or
-                      config.mt5.comment_auto in pos['comment']):
-                    self.grid_positions.append(pos)
+            events = self.index_positions(mt5_connection.get_positions_table())
+            self.last_events = events
+            if events:
+                self._publish(events)
             
             # อัพเดท P&L
             self.total_pnl = self.calculate_total_pnl()
@@ -45,6 +79,176 @@ class PositionMonitor:
         except Exception as e:
             logger.error(f"Error updating positions: {e}")
     
+    def index_positions(self, table: PositionTable) -> List[PositionEvent]:
+        """
+        อัพเดท positions จากตารางของรอบนี้ และเปรียบเทียบกับรอบก่อนเพื่อหา opened / closed / volume / SL-TP ที่เปลี่ยน
+        - dict ที่ส่งออกไปแล้ว (CycleSnapshot / managers / GUI) ไม่ถูกแก้ไข: ราคาหรือ profit เปลี่ยน → copy เป็น dict ใหม่
+        - ticket ที่ไม่มีอะไรเปลี่ยนใช้ dict เดิม, index สร้างใหม่เฉพาะรอบที่มี dict ถูกแทนที่หรือมี events
+        
+        Args:
+            table: PositionTable จาก mt5_connection.get_positions_table() (ใส่รหัส role ลงตารางนี้)
+            
+        Returns:
+            List ของ PositionEvent (ว่างถ้าไม่มีอะไรเปลี่ยน)
+        """
+        classify = self.roles.classify
+        comments = table.comments
+        rows = table.rows
+        
+        previous = self.positions_by_ticket
+        positions = []
+        roles = []
+        events = []
+        opened = 0
+        replaced = False
+        
+        for index, (ticket, volume, sl, tp, current_price, profit) in enumerate(zip(
+                rows['ticket'].tolist(), rows['volume'].tolist(), rows['sl'].tolist(), rows['tp'].tolist(),
+                rows['current_price'].tolist(), rows['profit'].tolist())):
+            code = classify(ticket, comments[index]).role
+            roles.append(code)
+            
+            prev = previous.get(ticket)
+            if prev is not None and prev['volume'] == volume and prev['sl'] == sl and prev['tp'] == tp:
+                if prev['current_price'] != current_price or prev['profit'] != profit:
+                    prev = {**prev, 'current_price': current_price, 'profit': profit}
+                    replaced = True
+                positions.append(prev)
+                continue
+            
+            pos = table.position_dict(index)
+            positions.append(pos)
+            role = ROLE_NAMES[code]
+            if prev is None:
+                events.append(PositionEvent(EVENT_OPENED, ticket, role, pos))
+                opened += 1
+                continue
+            if prev['volume'] != volume:
+                events.append(PositionEvent(EVENT_VOLUME_CHANGED, ticket, role, pos, prev))
+            if prev['sl'] != sl or prev['tp'] != tp:
+                events.append(PositionEvent(EVENT_SLTP_CHANGED, ticket, role, pos, prev))
+        
+        rows['role'] = roles
+        self.table = table
+        
+        if events or replaced or len(previous) != len(positions):
+            self._index(positions, roles)
+            # ticket ที่เคยเห็นแต่หายไป = ถูกปิด
+            if len(previous) + opened != len(positions):
+                by_ticket = self.positions_by_ticket
+                for ticket, prev in previous.items():
+                    if ticket not in by_ticket:
+                        info = self.roles.get(ticket)
+                        role = info.role_name if info is not None else 'other'
+                        events.append(PositionEvent(EVENT_CLOSED, ticket, role, prev))
+                self.roles.retain(by_ticket)
+        
+        self._update_grid_ladder(events)
+        self._update_exposure(events)
+        return events
+    
+    def _index(self, positions: List[Dict], roles: List[int]):
+        """สร้าง index ตาม ticket / ฝั่ง / role ใหม่ (เก็บเป็น tuple ให้ CycleSnapshot ใช้ร่วมได้โดยไม่ต้อง copy)"""
+        by_ticket = {}
+        grid_by_ticket = {}
+        hg_by_ticket = {}
+        grid_positions = []
+        hg_positions = []
+        grid_by_side = {'buy': [], 'sell': []}
+        hg_by_side = {'buy': [], 'sell': []}
+        
+        for pos, code in zip(positions, roles):
+            ticket = pos['ticket']
+            by_ticket[ticket] = pos
+            if code == ROLE_HG:
+                hg_positions.append(pos)
+                hg_by_ticket[ticket] = pos
+                hg_by_side[pos['type']].append(pos)
+            elif code == ROLE_GRID:
+                grid_positions.append(pos)
+                grid_by_ticket[ticket] = pos
+                grid_by_side[pos['type']].append(pos)
+        
+        self.positions = tuple(positions)
+        self.positions_by_ticket = by_ticket
+        self.grid_positions = tuple(grid_positions)
+        self.hg_positions = tuple(hg_positions)
+        self.grid_by_ticket = grid_by_ticket
+        self.hg_by_ticket = hg_by_ticket
+        self.grid_tickets = frozenset(grid_by_ticket)
+        self.grid_by_side = {side: tuple(items) for side, items in grid_by_side.items()}
+        self.hg_by_side = {side: tuple(items) for side, items in hg_by_side.items()}
+    
+    def _update_grid_ladder(self, events: List[PositionEvent]):
+        """อัพเดท GridLadder เฉพาะเมื่อมี Grid position เปิด/ปิด (ถ้าจำนวนไม่ตรงกันให้สร้างใหม่)"""
+        opened = [e.position for e in events if e.kind == EVENT_OPENED and e.role == 'grid']
+        closed = [e.position for e in events if e.kind == EVENT_CLOSED and e.role == 'grid']
+        ladder = self.grid_ladder
+        if opened or closed:
+            ladder = ladder.updated(opened, closed)
+        if any(ladder.count(side) != len(self.grid_by_side[side]) for side in ('buy', 'sell')):
+            ladder = GridLadder.from_positions(self.grid_by_side)
+        self.grid_ladder = ladder
+    
+    def _update_exposure(self, events: List[PositionEvent]):
+        """อัพเดท ExposureBook จาก events (ถ้าจำนวนไม่ตรงกับ index ให้สร้างใหม่)"""
+        exposure = self.exposure
+        for event in events:
+            exposure.apply(event.kind, event.role, event.position, event.previous)
+        grid_count = exposure.count('grid')
+        hg_count = exposure.count('hg')
+        if (grid_count != len(self.grid_positions) or hg_count != len(self.hg_positions)
+                or exposure.count() != len(self.positions)
+                or any(exposure.side('grid', side).count != len(self.grid_by_side[side]) for side in ('buy', 'sell'))):
+            exposure.rebuild({
+                'grid': self.grid_positions,
+                'hg': self.hg_positions,
+                'other': [pos for pos in self.positions
+                          if pos['ticket'] not in self.grid_by_ticket and pos['ticket'] not in self.hg_by_ticket]
+            })
+    
+    def refresh_floating(self, bid: float, ask: float):
+        """
+        คำนวณ floating P&L ของ ExposureBook จาก tick (O(1) ไม่วน positions)
+        
+        Args:
+            bid, ask: ราคาปัจจุบัน
+        """
+        spec = mt5_connection.get_symbol_spec()
+        self.exposure.refresh_pnl(bid, ask, spec.value_per_price if spec else None)
+    
+    def reset(self):
+        """ล้างข้อมูล positions และ index ทั้งหมด (คงผู้รับ events ไว้)"""
+        self.index_positions(PositionTable())
+        self.exposure.reset()
+        self.roles.clear()
+        self.total_pnl = 0.0
+        self.alerts = []
+        self.last_events = []
+    
+    def subscribe(self, callback: Callable[[List[PositionEvent]], None]):
+        """
+        ลงทะเบียนรับ events การเปลี่ยนแปลงของ positions
+        
+        Args:
+            callback: ฟังก์ชันที่รับ List[PositionEvent] (เรียกจาก thread ที่ update positions)
+        """
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback: Callable[[List[PositionEvent]], None]):
+        """ยกเลิกการรับ events"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+    
+    def _publish(self, events: List[PositionEvent]):
+        """ส่ง events ให้ผู้รับทุกตัว (error ของผู้รับรายหนึ่งไม่กระทบรายอื่น)"""
+        for callback in list(self._subscribers):
+            try:
+                callback(events)
+            except Exception as e:
+                logger.error(f"Error in position event subscriber: {e}")
+    
     def calculate_total_pnl(self) -> float:
         """
         คำนวณกำไร/ขาดทุนรวมทั้งหมด
@@ -52,10 +256,7 @@ class PositionMonitor:
         Returns:
             ยอดกำไร/ขาดทุนรวม
         """
-        total = 0.0
-        for pos in self.positions:
-            total += pos['profit']
-        return total
+        return self.table.total('profit')
     
     def calculate_grid_pnl(self) -> float:
         """
@@ -64,10 +265,7 @@ class PositionMonitor:
         Returns:
             ยอดกำไร/ขาดทุนของ Grid
         """
-        total = 0.0
-        for pos in self.grid_positions:
-            total += pos['profit']
-        return total
+        return self.table.total('profit', role='grid')
     
     def calculate_hg_pnl(self) -> float:
         """
@@ -76,10 +274,7 @@ class PositionMonitor:
         Returns:
             ยอดกำไร/ขาดทุนของ HG
         """
-        total = 0.0
-        for pos in self.hg_positions:
-            total += pos['profit']
-        return total
+        return self.table.total('profit', role='hg')
     
     def get_total_grid_volume(self) -> float:
         """
@@ -88,46 +283,30 @@ class PositionMonitor:
         Returns:
             volume รวม (lots)
         """
-        total = 0.0
-        for pos in self.grid_positions:
-            if pos['type'] == 'buy':
-                total += pos['volume']
-            else:  # sell
-                total -= pos['volume']
-        return abs(total)
+        return abs(self.exposure.net_volume('grid'))
     
     def get_net_grid_exposure(self) -> Dict:
         """
-        คำนวณ exposure สุทธิของ Grid
+        คำนวณ exposure สุทธิของ Grid (อ่านจาก ExposureBook - O(1))
         
         Returns:
-            Dict ที่มี buy_volume, sell_volume, net_volume
+            Dict ที่มี buy_volume, sell_volume, net_volume, ราคาเฉลี่ยแต่ละฝั่ง และจุดคุ้มทุน
         """
-        buy_volume = 0.0
-        sell_volume = 0.0
-        
-        for pos in self.grid_positions:
-            if pos['type'] == 'buy':
-                buy_volume += pos['volume']
-            else:
-                sell_volume += pos['volume']
-        
-        return {
-            'buy_volume': buy_volume,
-            'sell_volume': sell_volume,
-            'net_volume': abs(buy_volume - sell_volume),
-            'net_direction': 'buy' if buy_volume > sell_volume else 'sell'
-        }
+        return self.exposure.net_exposure('grid')
     
-    def check_margin_usage(self) -> Dict:
+    def check_margin_usage(self, account: Optional[Dict] = None) -> Dict:
         """
         ตรวจสอบการใช้ margin
         
+        Args:
+            account: ข้อมูล account ที่ดึงไว้แล้ว (เช่นจาก CycleSnapshot) ถ้าไม่ระบุจะดึงจาก MT5
+        
         Returns:
             Dict ที่มีข้อมูล margin
         """
         try:
-            account = mt5_connection.get_account_info()
+            if account is None:
+                account = mt5_connection.get_account_info()
             if not account:
                 return {'status': 'error', 'margin_percent': 0}
             
@@ -194,9 +373,9 @@ class PositionMonitor:
         # ล้างการแจ้งเตือนที่หมดอายุ
         self.alerts = [alert for alert in self.alerts if alert in warnings]
     
-    def get_position_by_ticket(self, ticket: int) -> Dict:
+    def get_position_by_ticket(self, ticket: int) -> Optional[Dict]:
         """
-        ค้นหา position จาก ticket number
+        ค้นหา position จาก ticket number (O(1) ผ่าน index)
         
         Args:
             ticket: ticket number
@@ -204,38 +383,64 @@ class PositionMonitor:
         Returns:
             position dict หรือ None
         """
-        for pos in self.positions:
-            if pos['ticket'] == ticket:
-                return pos
-        return None
+        return self.positions_by_ticket.get(ticket)
+    
+    def get_comment_info(self, ticket: int) -> Optional[CommentInfo]:
+        """
+        ดึง role และ metadata (ฝั่ง / level / zone) ที่อ่านจาก comment ของ position
+        
+        Args:
+            ticket: ticket number
+            
+        Returns:
+            CommentInfo หรือ None ถ้าไม่เคยเห็น ticket นี้
+        """
+        return self.roles.get(ticket)
+    
+    def get_grid_positions_by_side(self, side: str) -> Tuple[Dict, ...]:
+        """
+        ดึง Grid positions ของฝั่งที่ระบุ
+        
+        Args:
+            side: 'buy' หรือ 'sell'
+            
+        Returns:
+            tuple ของ Grid positions ฝั่งนั้น
+        """
+        return self.grid_by_side.get(side, ())
     
-    def get_positions_summary(self) -> Dict:
+    def get_positions_summary(self, account: Optional[Dict] = None) -> Dict:
         """
         สรุปข้อมูล positions ทั้งหมด
+        (P&L รวม / Grid / HG มาจากคอลัมน์ profit ของ broker ชุดเดียวกัน จึงรวมกันได้ตรงกับยอดรวม)
+        
+        Args:
+            account: ข้อมูล account ที่ดึงไว้แล้ว (ถ้าไม่ระบุจะดึงจาก MT5)
         
         Returns:
             Dict ที่มีข้อมูลสรุป
         """
         grid_exposure = self.get_net_grid_exposure()
-        margin_info = self.check_margin_usage()
+        margin_info = self.check_margin_usage(account)
         
         return {
-            'total_positions': len(self.positions),
-            'grid_positions': len(self.grid_positions),
-            'hg_positions': len(self.hg_positions),
-            'total_pnl': self.total_pnl,
+            'total_positions': len(self.table),
+            'grid_positions': self.table.count('grid'),
+            'hg_positions': self.table.count('hg'),
+            'total_pnl': self.calculate_total_pnl(),
             'grid_pnl': self.calculate_grid_pnl(),
             'hg_pnl': self.calculate_hg_pnl(),
             'grid_buy_volume': grid_exposure['buy_volume'],
             'grid_sell_volume': grid_exposure['sell_volume'],
             'grid_net_volume': grid_exposure['net_volume'],
+            'grid_break_even': grid_exposure['break_even_price'],
             'margin_usage': margin_info['margin_percent'],
             'warnings': self.monitor_risk_limits()
         }
     
     def close_positions_by_comment(self, comment: str) -> int:
         """
-        ปิด positions ที่มี comment ตรงกัน
+        ปิด positions ที่มี comment ตรงกัน (batch close: ส่ง close requests พร้อมกัน)
         
         Args:
             comment: comment ที่ต้องการค้นหา
@@ -243,12 +448,7 @@ class PositionMonitor:
         Returns:
             จำนวน positions ที่ปิด
         """
-        closed = 0
-        for pos in self.positions:
-            if comment in pos['comment']:
-                if mt5_connection.close_order(pos['ticket']):
-                    closed += 1
-        return closed
+        return mt5_connection.close_positions_batch(comment=comment).closed_count
     
     def close_all_grid_positions(self) -> int:
         """
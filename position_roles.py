@@ -0,0 +1,136 @@
+# position_roles.py
+# แยก role ของ position จาก comment ครั้งเดียวต่อ ticket และเข้ารหัส level / zone ไว้ใน comment ของ order
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+from config import config
+from position_table import ROLE_GRID, ROLE_HG, ROLE_OTHER
+
+ROLE_NAMES = ('other', 'grid', 'hg')  # index = รหัส role
+
+COMMENT_SEPARATOR = '|'
+SIDE_TAGS = {'buy': 'B', 'sell': 'S'}
+TAG_SIDES = {tag: side for side, tag in SIDE_TAGS.items()}
+ZONE_TAG = 'Z'
+# zone id "demand_<timestamp>" / "supply_<timestamp>" เข้ารหัสเป็นตัวอักษรนำ + timestamp ฐาน 36 (สั้นพอให้ต่อ "Partial close ")
+ZONE_PREFIXES = {'demand': 'd', 'supply': 's'}
+PREFIX_ZONES = {tag: prefix for prefix, tag in ZONE_PREFIXES.items()}
+COMMENT_LIMIT = 31  # ความยาวสูงสุดของ comment ใน MT5
+BASE36_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+@dataclass(frozen=True)
+class CommentInfo:
+    """ข้อมูลที่อ่านได้จาก comment ของ position"""
+    role: int  # ROLE_OTHER / ROLE_GRID / ROLE_HG
+    side: Optional[str] = None  # ฝั่งของ level ('buy' / 'sell') ถ้ามี
+    level: Optional[int] = None  # ลำดับ level (Grid: ลำดับไม้, HG: level ของ ladder)
+    zone_id: Optional[str] = None  # id ของ zone (HG จาก zone)
+
+    @property
+    def role_name(self) -> str:
+        return ROLE_NAMES[self.role]
+
+
+def _to_base36(value: int) -> str:
+    digits = ''
+    while True:
+        value, remainder = divmod(value, 36)
+        digits = BASE36_DIGITS[remainder] + digits
+        if value == 0:
+            return digits
+
+
+def encode_zone_id(zone_id: str) -> str:
+    """ย่อ zone id เช่น "demand_1700000000" → "ds4fzy8" (id รูปแบบอื่นใช้ตามเดิม)"""
+    prefix, _, created_at = zone_id.partition('_')
+    if prefix in ZONE_PREFIXES and created_at.isdigit():
+        return ZONE_PREFIXES[prefix] + _to_base36(int(created_at))
+    return zone_id
+
+
+def decode_zone_id(tag: str) -> str:
+    """แปลงกลับจาก encode_zone_id (comment แบบเก่าที่เก็บ id เต็มคืนค่าเดิม)"""
+    prefix = PREFIX_ZONES.get(tag[:1])
+    if prefix is not None and tag[1:] and all(char in BASE36_DIGITS for char in tag[1:]):
+        return f"{prefix}_{int(tag[1:], 36)}"
+    return tag
+
+
+def derived_comment(prefix: str, comment: str) -> str:
+    """comment ของ order ที่สร้างจาก position เดิม (เช่น "Close ...") ตัดให้ไม่เกิน COMMENT_LIMIT"""
+    return f"{prefix} {comment}"[:COMMENT_LIMIT]
+
+
+def encode_comment(base: str, side: Optional[str] = None, level: Optional[int] = None,
+                   zone_id: Optional[str] = None) -> str:
+    """
+    สร้าง comment ของ order พร้อม metadata ต่อท้าย (เช่น "HG_AI|B3", "HG_AI|Zds4fzy8")
+
+    Args:
+        base: comment หลัก (config.mt5.comment_grid / comment_hg / comment_auto)
+        side: 'buy' หรือ 'sell'
+        level: ลำดับ level
+        zone_id: id ของ zone (ถ้ามี จะใช้แทน level)
+    """
+    if zone_id is not None:
+        comment = f"{base}{COMMENT_SEPARATOR}{ZONE_TAG}{encode_zone_id(zone_id)}"
+    elif side is not None and level is not None:
+        comment = f"{base}{COMMENT_SEPARATOR}{SIDE_TAGS[side]}{abs(level)}"
+    else:
+        comment = base
+    if len(comment) > COMMENT_LIMIT:
+        # MT5 ตัด comment ที่ยาวเกินทิ้งเงียบ ๆ → metadata ที่ใช้ restore เสีย จึงไม่ส่ง order เลย
+        raise ValueError(f"Comment too long for MT5 ({len(comment)} > {COMMENT_LIMIT}): {comment!r}")
+    return comment
+
+
+def parse_comment(comment: str) -> CommentInfo:
+    """
+    อ่าน role และ metadata จาก comment (comment แบบเดิมที่ไม่มี metadata ได้เฉพาะ role)
+
+    Args:
+        comment: comment ของ position
+    """
+    if config.mt5.comment_hg in comment:
+        role = ROLE_HG
+    elif config.mt5.comment_grid in comment or config.mt5.comment_auto in comment:
+        role = ROLE_GRID
+    else:
+        return CommentInfo(ROLE_OTHER)
+
+    _, separator, tag = comment.rpartition(COMMENT_SEPARATOR)
+    if not separator or not tag:
+        return CommentInfo(role)
+    if tag[0] == ZONE_TAG:
+        return CommentInfo(role, zone_id=decode_zone_id(tag[1:]) if tag[1:] else None)
+    side = TAG_SIDES.get(tag[0])
+    if side is not None and tag[1:].isdigit():
+        return CommentInfo(role, side=side, level=int(tag[1:]))
+    return CommentInfo(role)
+
+
+class RoleCache:
+    """
+    เก็บ CommentInfo ต่อ ticket (role ของ position ไม่เปลี่ยนหลังเปิด → parse comment ครั้งเดียว)
+    """
+
+    def __init__(self):
+        self.by_ticket: Dict[int, CommentInfo] = {}
+
+    def classify(self, ticket: int, comment: str) -> CommentInfo:
+        """คืน CommentInfo ของ ticket (parse เฉพาะครั้งแรกที่เห็น)"""
+        info = self.by_ticket.get(ticket)
+        if info is None:
+            info = self.by_ticket[ticket] = parse_comment(comment)
+        return info
+
+    def get(self, ticket: int) -> Optional[CommentInfo]:
+        return self.by_ticket.get(ticket)
+
+    def retain(self, tickets: Iterable[int]):
+        """เก็บไว้เฉพาะ tickets ที่ยังเปิดอยู่"""
+        self.by_ticket = {ticket: self.by_ticket[ticket] for ticket in tickets if ticket in self.by_ticket}
+
+    def clear(self):
+        self.by_ticket = {}
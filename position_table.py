@@ -0,0 +1,161 @@
+# position_table.py
+# ตาราง positions แบบ columnar (NumPy structured array) สำหรับคำนวณผลรวม P&L / volume ด้วย masked reductions
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+
+# รหัสฝั่ง (ตรงกับ ORDER_TYPE_BUY / ORDER_TYPE_SELL ของ MT5)
+SIDE_BUY = 0
+SIDE_SELL = 1
+SIDE_CODES = {'buy': SIDE_BUY, 'sell': SIDE_SELL}
+
+# รหัส role ของ position
+ROLE_OTHER = 0
+ROLE_GRID = 1
+ROLE_HG = 2
+ROLE_CODES = {'other': ROLE_OTHER, 'grid': ROLE_GRID, 'hg': ROLE_HG}
+
+POSITION_DTYPE = np.dtype([
+    ('ticket', '<i8'), ('side', 'i1'), ('volume', '<f8'), ('open_price', '<f8'),
+    ('current_price', '<f8'), ('sl', '<f8'), ('tp', '<f8'), ('profit', '<f8'),
+    ('role', 'i1'), ('open_time', '<i8')
+])
+
+
+class PositionTable:
+    """
+    positions ของรอบหนึ่งเก็บเป็นคอลัมน์ (หนึ่งแถวต่อ position)
+    - สร้างจากผลของ mt5.positions_get() ครั้งเดียว (ไม่มี object ต่อ position) ผ่าน load_positions()
+    - ผลรวม / จำนวน / ค่าต่ำสุดตาม role และฝั่ง ใช้ masked reductions แทนการวน dict
+    - position dict สร้างเฉพาะแถวที่ต้องการผ่าน position_dict()
+    """
+
+    __slots__ = ('rows', 'comments')
+
+    def __init__(self, rows: Optional[np.ndarray] = None, comments: Optional[List[str]] = None):
+        self.rows = rows if rows is not None else np.empty(0, dtype=POSITION_DTYPE)
+        self.comments = comments if comments is not None else []
+
+    @classmethod
+    def from_dicts(cls, positions: Sequence[Dict]) -> 'PositionTable':
+        """สร้างจาก position dicts (รูปแบบเดียวกับ get_all_positions)"""
+        rows = np.array([(pos['ticket'], SIDE_CODES[pos['type']], pos['volume'], pos['open_price'],
+                          pos['current_price'], pos['sl'], pos['tp'], pos['profit'], ROLE_OTHER,
+                          int(pos['open_time'].timestamp()) if pos.get('open_time') else 0)
+                         for pos in positions], dtype=POSITION_DTYPE)
+        return cls(rows, [pos['comment'] for pos in positions])
+
+    def with_roles(self, roles: Sequence[int]) -> 'PositionTable':
+        """คืนตารางใหม่ที่ใส่รหัส role (ลำดับเดียวกับแถว)"""
+        rows = self.rows.copy()
+        rows['role'] = roles
+        return PositionTable(rows, self.comments)
+
+    def position_dict(self, index: int) -> Dict:
+        """สร้าง position dict (รูปแบบเดียวกับ get_all_positions) ของแถวที่ index"""
+        row = self.rows[index]
+        return {
+            'ticket': int(row['ticket']),
+            'type': 'buy' if row['side'] == SIDE_BUY else 'sell',
+            'volume': float(row['volume']),
+            'open_price': float(row['open_price']),
+            'current_price': float(row['current_price']),
+            'sl': float(row['sl']),
+            'tp': float(row['tp']),
+            'profit': float(row['profit']),
+            'comment': self.comments[index],
+            'open_time': datetime.fromtimestamp(int(row['open_time']))
+        }
+
+    def to_dicts(self) -> List[Dict]:
+        """position dicts ของทุกแถว (ใช้นอก loop หลัก เช่น get_all_positions)"""
+        return [self.position_dict(i) for i in range(len(self.rows))]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def mask(self, role: Optional[str] = None, side: Optional[str] = None) -> Optional[np.ndarray]:
+        """boolean mask ของแถวที่ตรง role / ฝั่ง (None = ทุกแถว)"""
+        mask = None
+        if role is not None:
+            mask = self.rows['role'] == ROLE_CODES[role]
+        if side is not None:
+            side_mask = self.rows['side'] == SIDE_CODES[side]
+            mask = side_mask if mask is None else mask & side_mask
+        return mask
+
+    def total(self, column: str, role: Optional[str] = None, side: Optional[str] = None) -> float:
+        """
+        ผลรวมของคอลัมน์ (เช่น 'profit', 'volume') เฉพาะแถวที่ตรง role / ฝั่ง
+
+        Args:
+            column: ชื่อคอลัมน์
+            role: 'grid', 'hg', 'other' หรือ None = ทุก role
+            side: 'buy', 'sell' หรือ None = ทั้งสองฝั่ง
+        """
+        values = self.rows[column]
+        mask = self.mask(role, side)
+        if mask is not None:
+            values = values[mask]
+        return float(values.sum())
+
+    def count(self, role: Optional[str] = None, side: Optional[str] = None) -> int:
+        """จำนวนแถวที่ตรง role / ฝั่ง"""
+        mask = self.mask(role, side)
+        return len(self.rows) if mask is None else int(np.count_nonzero(mask))
+
+    def lowest(self, column: str, role: Optional[str] = None, side: Optional[str] = None) -> Optional[int]:
+        """
+        index ของแถวที่ค่าในคอลัมน์ต่ำสุด เฉพาะแถวที่ตรง role / ฝั่ง
+
+        Returns:
+            index ของแถว หรือ None ถ้าไม่มีแถวที่ตรงเงื่อนไข
+        """
+        mask = self.mask(role, side)
+        indices = np.arange(len(self.rows)) if mask is None else np.flatnonzero(mask)
+        if len(indices) == 0:
+            return None
+        return int(indices[np.argmin(self.rows[column][indices])])
+
+    def net_volume(self, role: Optional[str] = None) -> float:
+        """volume สุทธิ (buy เป็นบวก, sell เป็นลบ)"""
+        rows = self.rows
+        signed = np.where(rows['side'] == SIDE_BUY, rows['volume'], -rows['volume'])
+        mask = self.mask(role)
+        if mask is not None:
+            signed = signed[mask]
+        return float(signed.sum())
+
+
+def load_positions(positions: Iterable, magic: Optional[int] = None) -> PositionTable:
+    """
+    แปลงผลของ mt5.positions_get() เป็น PositionTable โดยตรง (สลับแถว → คอลัมน์ครั้งเดียว ไม่สร้าง dict)
+
+    Args:
+        positions: TradePosition จาก MT5
+        magic: เก็บเฉพาะ position ที่ magic ตรงกัน (None = ทั้งหมด)
+
+    Returns:
+        PositionTable เรียงลำดับเดียวกับ positions
+    """
+    if magic is not None:
+        positions = [pos for pos in positions if pos.magic == magic]
+    else:
+        positions = list(positions)
+    if not positions:
+        return PositionTable()
+
+    columns = dict(zip(positions[0]._fields, zip(*positions)))
+    rows = np.empty(len(positions), dtype=POSITION_DTYPE)
+    rows['ticket'] = columns['ticket']
+    rows['side'] = columns['type']
+    rows['volume'] = columns['volume']
+    rows['open_price'] = columns['price_open']
+    rows['current_price'] = columns['price_current']
+    rows['sl'] = columns['sl']
+    rows['tp'] = columns['tp']
+    rows['profit'] = columns['profit']
+    rows['role'] = ROLE_OTHER
+    rows['open_time'] = columns['time']
+    return PositionTable(rows, list(columns['comment']))
@@ -0,0 +1,168 @@
+# rate_cache.py
+# Cache แท่งเทียนกลาง (ring buffer ต่อ symbol/timeframe) ให้ ATR, Candle Detector, HG Zones อ่านร่วมกัน
+
+from typing import Dict, Optional, Tuple
+import logging
+import threading
+import numpy as np
+from broker_backend import broker as mt5
+from clock import clock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RateBuffer:
+    """
+    Ring buffer ของแท่งเทียนหนึ่ง (symbol, timeframe)
+    เขียนแต่ละแท่ง 2 ตำแหน่ง (i และ i + capacity) ทำให้ N แท่งล่าสุดเป็นช่วงต่อเนื่องเสมอ
+    → คืนเป็น numpy view ได้โดยไม่ต้อง copy
+    """
+
+    def __init__(self, dtype: np.dtype, capacity: int):
+        self.capacity = capacity
+        self.data = np.zeros(capacity * 2, dtype=dtype)
+        self.head = 0  # ตำแหน่งที่จะเขียนแท่งถัดไป (0..capacity-1)
+        self.size = 0
+        self.last_refresh = 0.0
+
+    @property
+    def last_time(self) -> Optional[int]:
+        if self.size == 0:
+            return None
+        return int(self.data[self.head - 1 + self.capacity]['time'])
+
+    def append(self, rates: np.ndarray):
+        """เพิ่มแท่งใหม่ต่อท้าย (ถ้าเกิน capacity แท่งเก่าสุดจะถูกทับ)"""
+        if len(rates) > self.capacity:
+            rates = rates[-self.capacity:]
+        pos = 0
+        while pos < len(rates):
+            # เขียนได้ต่อเนื่องจนถึงท้าย ring แล้ววนกลับไปต้น
+            chunk = rates[pos:pos + self.capacity - self.head]
+            end = self.head + len(chunk)
+            self.data[self.head:end] = chunk
+            self.data[self.head + self.capacity:end + self.capacity] = chunk
+            self.head = end % self.capacity
+            self.size = min(self.capacity, self.size + len(chunk))
+            pos += len(chunk)
+
+    def replace_last(self, rate):
+        """แทนที่แท่งล่าสุด (แท่งที่กำลังวิ่งเปลี่ยนทุก tick)"""
+        index = (self.head - 1) % self.capacity
+        self.data[index] = rate
+        self.data[index + self.capacity] = rate
+
+    def view(self, count: int, start_pos: int = 0) -> np.ndarray:
+        """
+        N แท่งเรียงจากเก่าไปใหม่ (แบบเดียวกับ copy_rates_from_pos) เป็น read-only view
+
+        Args:
+            count: จำนวนแท่ง
+            start_pos: 0 = รวมแท่งล่าสุด, 1 = เริ่มจากแท่งก่อนหน้า
+        """
+        end = self.head + self.capacity - start_pos
+        available = self.size - start_pos
+        if available <= 0:
+            return self.data[:0]
+        result = self.data[end - min(count, available):end]
+        result.flags.writeable = False
+        return result
+
+
+class RateCache:
+    """
+    แหล่งแท่งเทียนกลางแทนการเรียก copy_rates_from_pos แยกกันในแต่ละ module
+    - ครั้งแรกดึงเต็ม capacity, ครั้งต่อไปดึงเฉพาะแท่งใหม่ตั้งแต่แท่งล่าสุดที่รู้จัก
+    - refresh ไม่เกิน 1 ครั้งต่อ min_refresh_secs ต่อ (symbol, timeframe)
+      ทำให้ consumer หลายตัวในรอบเดียวกันใช้ข้อมูลชุดเดียวกัน
+    - ข้อมูลที่คืนเป็น view ของ buffer: ใช้ได้จนกว่าจะ refresh ครั้งถัดไป ถ้าต้องเก็บไว้นานให้ copy เอง
+    """
+
+    def __init__(self, capacity: int = 1000, min_refresh_secs: float = 1.0):
+        self.default_capacity = capacity
+        self.min_refresh_secs = min_refresh_secs
+        self.buffers: Dict[Tuple[str, int], RateBuffer] = {}
+        self.fetch_count = 0  # จำนวนครั้งที่เรียก broker (ไว้ดูประสิทธิภาพ)
+        self._lock = threading.Lock()
+
+    def get_rates(self, symbol: str, timeframe: int, count: int, start_pos: int = 0) -> Optional[np.ndarray]:
+        """
+        ดึงแท่งเทียนแบบเดียวกับ copy_rates_from_pos(symbol, timeframe, start_pos, count)
+
+        Returns:
+            read-only numpy view (เรียงจากเก่าไปใหม่) หรือ None ถ้าดึงข้อมูลไม่ได้
+        """
+        with self._lock:
+            buffer = self._refresh(symbol, timeframe, count + start_pos)
+            if buffer is None:
+                return None
+            rates = buffer.view(count, start_pos)
+            return rates if len(rates) else None
+
+    def clear(self):
+        """ล้าง cache ทั้งหมด (เช่น เมื่อเชื่อมต่อใหม่ หรือเปลี่ยน symbol)"""
+        with self._lock:
+            self.buffers.clear()
+
+    def _refresh(self, symbol: str, timeframe: int, needed: int) -> Optional[RateBuffer]:
+        key = (symbol, timeframe)
+        buffer = self.buffers.get(key)
+        now = clock.time()
+
+        if buffer is None or needed > buffer.capacity:
+            capacity = max(self.default_capacity, needed * 2, buffer.capacity * 2 if buffer else 0)
+            return self._full_load(key, capacity)
+
+        if now - buffer.last_refresh < self.min_refresh_secs:
+            return buffer
+
+        # ดึงเฉพาะแท่งใหม่: เริ่ม 2 แท่ง (แท่งที่กำลังวิ่ง + แท่งใหม่) แล้วขยายถ้ายังไม่เจอแท่งล่าสุดที่รู้จัก
+        last_time = buffer.last_time
+        fetch = 2
+        while True:
+            rates = self._fetch(symbol, timeframe, fetch)
+            if rates is None or len(rates) == 0:
+                return buffer
+            times = rates['time']
+            if times[-1] < last_time:
+                # history ถูกเปลี่ยน (เช่น เปลี่ยน server) → โหลดใหม่
+                return self._full_load(key, buffer.capacity)
+            matches = np.flatnonzero(times == last_time)
+            if len(matches):
+                index = int(matches[0])
+                buffer.replace_last(rates[index])
+                buffer.append(rates[index + 1:])
+                buffer.last_refresh = now
+                return buffer
+            if fetch >= buffer.capacity or len(rates) < fetch:
+                return self._full_load(key, buffer.capacity)
+            fetch = min(fetch * 4, buffer.capacity)
+
+    def _full_load(self, key: Tuple[str, int], capacity: int) -> Optional[RateBuffer]:
+        symbol, timeframe = key
+        rates = self._fetch(symbol, timeframe, capacity)
+        if rates is None or len(rates) == 0:
+            self.buffers.pop(key, None)
+            return None
+        buffer = RateBuffer(rates.dtype, capacity)
+        buffer.append(rates)
+        buffer.last_refresh = clock.time()
+        self.buffers[key] = buffer
+        logger.debug(f"Rate cache loaded {len(rates)} bars for {symbol} TF {timeframe}")
+        return buffer
+
+    def _fetch(self, symbol: str, timeframe: int, count: int) -> Optional[np.ndarray]:
+        self.fetch_count += 1
+        try:
+            rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
+        except Exception as e:
+            logger.error(f"Error fetching rates for {symbol}: {e}")
+            return None
+        if rates is None:
+            return None
+        return np.asarray(rates)
+
+
+# สร้าง instance หลักสำหรับใช้งาน
+rate_cache = RateCache()
@@ -3,12 +3,18 @@
 
 import logging
 from typing import Dict
+import numpy as np
 from config import config
 from mt5_connection import mt5_connection
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SAFE_MARGIN_LEVEL = 1.5  # Margin Level ขั้นต่ำ 150%
+MAX_DISTANCE_PIPS = 10000  # จำลองไม่เกินระยะนี้
+MAX_SIM_LEVELS = 10000  # กันกรณี grid distance <= 0
+BATCH_CELLS = 2_000_000  # ขนาด array สูงสุดต่อ chunk (ชุดข้อมูล × level)
+
 
 class RiskCalculator:
     """คลาสคำนวณความเสี่ยงและจุดทนทาน (รองรับ Buy/Sell แยกกัน)"""
@@ -62,159 +68,211 @@ class RiskCalculator:
             # ดังนั้นไม่นับ drawdown สำหรับ sell ใน worst case scenario (ราคาลง)
             return 0.0
     
-    def simulate_grid_only(self, balance: float, price: float, leverage: int = 100) -> Dict:
-        """Simulate ระบบ Grid อย่างเดียว (รองรับ Buy/Sell แยกกัน)"""
-        
+    def _max_levels(self, step: float) -> int:
+        """จำนวน level สูงสุดที่ต้องจำลอง (level แรกที่ระยะเกิน 10000 pips จะหยุดเสมอ)"""
+        if step > 0:
+            return int(MAX_DISTANCE_PIPS // step) + 1
+        return MAX_SIM_LEVELS
+    
+    @staticmethod
+    def _first_stop(stop: np.ndarray) -> np.ndarray:
+        """index ของ level แรกที่ถึงขีดจำกัด (ถ้าไม่ถึงเลยใช้ level สุดท้าย)"""
+        return np.where(stop.any(axis=1), stop.argmax(axis=1), stop.shape[1] - 1)
+    
+    @staticmethod
+    def _broadcast_inputs(balances, prices, leverages, buy_lots, sell_lots):
+        """broadcast input ทั้งหมดให้เป็น shape เดียวกัน แล้วแปลงเป็น 1 มิติ"""
+        arrays = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64)
+                                       for a in (balances, prices, leverages, buy_lots, sell_lots)))
+        shape = arrays[0].shape
+        return shape, [a.reshape(-1) for a in arrays]
+    
+    def _grid_only_batch(self, balance: np.ndarray, price: np.ndarray, leverage: np.ndarray,
+                         buy_lot: np.ndarray, sell_lot: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Grid อย่างเดียว แบบ vectorized (แกน 0 = ชุดข้อมูล, แกน 1 = level)
+        ทุก level วางไม้ที่ระยะ n × step → drawdown ของ Buy = step × pip value × n(n-1)/2
+        """
         direction = config.grid.direction
-        buy_lot = config.grid.buy_lot_size
-        sell_lot = config.grid.sell_lot_size
         buy_distance = config.grid.buy_grid_distance
         sell_distance = config.grid.sell_grid_distance
+        step = min(buy_distance, sell_distance) if direction == "both" else (buy_distance if direction == "buy" else sell_distance)
+        
+        has_buy = direction in ("both", "buy")
+        has_sell = direction in ("both", "sell")
+        margin_per_level = (self.calculate_margin_per_lot(price, buy_lot, leverage) * has_buy +
+                            self.calculate_margin_per_lot(price, sell_lot, leverage) * has_sell)[:, None]
+        pip_value_buy = (self.calculate_pip_value_for_lot(buy_lot) * has_buy)[:, None]
+        positions_per_level = int(has_buy) + int(has_sell)
+        balance = balance[:, None]
+        
+        # curve ของทุก level: n = จำนวน level ที่วางแล้ว
+        n = np.arange(1, self._max_levels(step) + 1, dtype=np.float64)[None, :]
+        drawdown = step * pip_value_buy * n * (n - 1) / 2
+        margin = margin_per_level * n
+        equity = balance - drawdown
+        with np.errstate(divide='ignore', invalid='ignore'):
+            margin_level = np.where(margin > 0, equity / margin, 999)
+        stop = (margin_level < SAFE_MARGIN_LEVEL) | (equity < margin) | (n * step > MAX_DISTANCE_PIPS)
+        
+        rows = np.arange(len(balance))
+        idx = self._first_stop(stop)
+        # ผลลัพธ์คือ level ก่อนหน้าที่ถึงขีดจำกัด
+        prev = idx.astype(np.float64)
+        prev_drawdown = step * pip_value_buy[:, 0] * prev * np.maximum(prev - 1, 0) / 2
+        prev_margin = margin_per_level[:, 0] * prev
+        prev_equity = balance[:, 0] - prev_drawdown
+        with np.errstate(divide='ignore', invalid='ignore'):
+            final_margin_level = np.where(prev_margin > 0, prev_equity / prev_margin, 999)
+        return {
+            'max_distance_pips': idx * step,
+            'max_levels': idx * positions_per_level,
+            'max_margin': prev_margin,
+            'max_drawdown': prev_drawdown,
+            'final_margin_level': final_margin_level,
+            'final_equity': prev_equity,
+            'status': np.where(margin_level[rows, idx] < SAFE_MARGIN_LEVEL, 'AT_LIMIT', 'SAFE'),
+        }
+    
+    def _hg_trigger_levels(self, n: np.ndarray, step: float, hg_distance: float, max_hg_levels: int) -> np.ndarray:
+        """mask ของ level ที่ออก HG (ระยะหาร hg_distance ลงตัว และยังไม่เกิน max_hg_levels)"""
+        if hg_distance == 0:
+            raise ValueError("HG distance must not be zero")
+        triggered = np.mod(n * step, hg_distance) == 0
+        return triggered & (np.cumsum(triggered) <= max_hg_levels)
+    
+    def _grid_with_hg_batch(self, balance: np.ndarray, price: np.ndarray, leverage: np.ndarray,
+                            buy_lot: np.ndarray, sell_lot: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Grid + HG แบบ vectorized (แกน 0 = ชุดข้อมูล, แกน 1 = level)
+        HG lot = grid exposure ฝั่งเดียวกัน × multiplier ณ level ที่ออก HG
+        drawdown ของ HG Buy ที่ level n = step × Σ (n − n_j) × pip value_j = step × (n·ΣL − Σ n_j·L_j)
+        """
+        direction = config.grid.direction
+        step = min(config.grid.buy_grid_distance, config.grid.sell_grid_distance)
+        grid_is_buy = direction in ("both", "buy")
+        grid_lot = (buy_lot if grid_is_buy else sell_lot)[:, None]
+        balance = balance[:, None]
         
-        margin_per_buy = self.calculate_margin_per_lot(price, buy_lot, leverage)
-        margin_per_sell = self.calculate_margin_per_lot(price, sell_lot, leverage)
-        pip_value_buy = self.calculate_pip_value_for_lot(buy_lot)
-        pip_value_sell = self.calculate_pip_value_for_lot(sell_lot)
+        levels = np.arange(1, self._max_levels(step) + 1, dtype=np.float64)
+        hg_buy = self._hg_trigger_levels(levels, step, config.hg.buy_hg_distance, config.hg.max_hg_levels)
+        hg_sell = self._hg_trigger_levels(levels, step, config.hg.sell_hg_distance, config.hg.max_hg_levels)
+        n = levels[None, :]
         
-        positions = []
-        current_distance = 0
-        total_margin = 0
-        safe_margin_level = 1.5
+        # HG ใช้ exposure ของ Grid ฝั่งเดียวกัน (Grid มีฝั่งเดียว → อีกฝั่งได้ lot 0)
+        grid_exposure = n * grid_lot
+        hg_buy_lots = np.where(hg_buy, grid_exposure * config.hg.buy_hg_multiplier, 0.0) if grid_is_buy else np.zeros_like(grid_exposure)
+        hg_sell_lots = np.zeros_like(grid_exposure) if grid_is_buy else np.where(hg_sell, grid_exposure * config.hg.sell_hg_multiplier, 0.0)
+        hg_buy_cum = np.cumsum(hg_buy_lots, axis=1)
+        hg_count = np.cumsum(hg_buy) + np.cumsum(hg_sell)
         
-        # ใช้ระยะที่เล็กกว่าเป็น step
-        step_distance = min(buy_distance, sell_distance) if direction == "both" else (buy_distance if direction == "buy" else sell_distance)
+        total_lots = grid_exposure + hg_buy_cum + np.cumsum(hg_sell_lots, axis=1)
+        margin = self.calculate_margin_per_lot(price[:, None], total_lots, leverage[:, None])
+        grid_drawdown = step * self.calculate_pip_value_for_lot(grid_lot) * n * (n - 1) / 2 if grid_is_buy else np.zeros_like(n)
+        hg_drawdown = step * self.calculate_pip_value_for_lot(n * hg_buy_cum - np.cumsum(n * hg_buy_lots, axis=1))
+        drawdown = grid_drawdown + hg_drawdown
+        equity = balance - drawdown
+        with np.errstate(divide='ignore', invalid='ignore'):
+            margin_level = np.where(margin > 0, equity / margin, 999)
+        stop = (margin_level < SAFE_MARGIN_LEVEL) | (equity < margin) | (n * step > MAX_DISTANCE_PIPS)
         
-        while True:
-            current_distance += step_distance
-            
-            # เพิ่มไม้ตามทิศทาง
-            if direction == "both":
-                # วางทั้ง Buy และ Sell ทุกๆ step
-                positions.append({'distance': current_distance, 'lot': buy_lot, 'type': 'buy', 'pip_value': pip_value_buy})
-                positions.append({'distance': current_distance, 'lot': sell_lot, 'type': 'sell', 'pip_value': pip_value_sell})
-                total_margin += margin_per_buy + margin_per_sell
-            elif direction == "buy":
-                positions.append({'distance': current_distance, 'lot': buy_lot, 'type': 'buy', 'pip_value': pip_value_buy})
-                total_margin += margin_per_buy
-            else:  # sell
-                positions.append({'distance': current_distance, 'lot': sell_lot, 'type': 'sell', 'pip_value': pip_value_sell})
-                total_margin += margin_per_sell
-            
-            # คำนวณ Drawdown (worst case: ราคาลงไปเรื่อยๆ)
-            # สำหรับ Buy positions: drawdown = ระยะห่างจากราคาเปิด × pip_value
-            # สำหรับ Sell positions: ใน worst case (ราคาลง) จะมีกำไร ไม่นับ drawdown
-            total_drawdown = sum(
-                self.calculate_drawdown_for_position(
-                    p['distance'], current_distance, p['pip_value'], p['type']
-                ) for p in positions
-            )
-            
-            equity = balance - total_drawdown
-            margin_level = equity / total_margin if total_margin > 0 else 999
-            
-            # หยุดเมื่อ margin level ต่ำเกินไป หรือ equity ไม่พอใช้ margin หรือเกิน 10000 pips
-            if margin_level < safe_margin_level or equity < total_margin or current_distance > 10000:
-                # คำนวณผลลัพธ์ก่อนที่จะเพิ่ม position ล่าสุด
-                prev_distance = current_distance - step_distance
-                prev_drawdown = sum(
-                    self.calculate_drawdown_for_position(
-                        p['distance'], prev_distance, p['pip_value'], p['type']
-                    ) for p in (positions[:-2] if direction == "both" else positions[:-1])
-                )
-                prev_margin = total_margin - (margin_per_buy + margin_per_sell if direction == "both" else (margin_per_buy if direction == "buy" else margin_per_sell))
-                
-                return {
-                    'max_distance_pips': prev_distance,
-                    'max_levels': len(positions) - (2 if direction == "both" else 1),
-                    'max_margin': prev_margin,
-                    'max_drawdown': prev_drawdown,
-                    'final_margin_level': (balance - prev_drawdown) / prev_margin if prev_margin > 0 else 999,
-                    'final_equity': balance - prev_drawdown,
-                    'status': 'AT_LIMIT' if margin_level < safe_margin_level else 'SAFE'
-                }
+        rows = np.arange(len(balance))
+        idx = self._first_stop(stop)
+        grid_drawdown = np.broadcast_to(grid_drawdown, drawdown.shape)
+        return {
+            'max_distance_pips': idx * step,
+            'max_grid_levels': idx,
+            'max_hg_levels': hg_count[idx],
+            'max_margin': margin[rows, idx],
+            'max_drawdown': drawdown[rows, idx],
+            'grid_drawdown': grid_drawdown[rows, idx],
+            'hg_drawdown': hg_drawdown[rows, idx],
+            'final_margin_level': margin_level[rows, idx],
+            'final_equity': equity[rows, idx],
+            'status': np.where(margin_level[rows, idx] < SAFE_MARGIN_LEVEL, 'AT_LIMIT', 'SAFE'),
+        }
+    
+    def simulate_batch(self, balances, prices, leverages, lot_sizes, sell_lot_sizes=None,
+                       with_hg: bool = False) -> Dict[str, np.ndarray]:
+        """
+        What-if แบบ batch: จำลองหลายชุด (balance, price, leverage, lot) พร้อมกันด้วย NumPy
+        ค่า distance / direction / HG ใช้จาก config ปัจจุบัน
+        
+        Args:
+            balances: ยอดเงิน (scalar หรือ array)
+            prices: ราคา (scalar หรือ array)
+            leverages: leverage (scalar หรือ array)
+            lot_sizes: lot ของ Buy (และ Sell ถ้าไม่ระบุ sell_lot_sizes)
+            sell_lot_sizes: lot ของ Sell (None = เท่ากับ lot_sizes)
+            with_hg: True = Grid + HG, False = Grid อย่างเดียว
+        
+        Returns:
+            Dict ของ arrays (shape เดียวกับ input หลัง broadcast) key เดียวกับ simulate_grid_only/simulate_grid_with_hg
+        """
+        if sell_lot_sizes is None:
+            sell_lot_sizes = lot_sizes
+        shape, (balance, price, leverage, buy_lot, sell_lot) = self._broadcast_inputs(
+            balances, prices, leverages, lot_sizes, sell_lot_sizes)
+        simulate = self._grid_with_hg_batch if with_hg else self._grid_only_batch
+        
+        # แบ่ง chunk เพื่อคุมขนาด array (ชุดข้อมูล × level)
+        step = min(config.grid.buy_grid_distance, config.grid.sell_grid_distance)
+        chunk = max(1, BATCH_CELLS // self._max_levels(step))
+        parts = [simulate(balance[i:i + chunk], price[i:i + chunk], leverage[i:i + chunk],
+                          buy_lot[i:i + chunk], sell_lot[i:i + chunk])
+                 for i in range(0, len(balance), chunk)]
+        if not parts:
+            return {}
+        return {key: np.concatenate([p[key] for p in parts]).reshape(shape) for key in parts[0]}
+    
+    @staticmethod
+    def _to_scalar_result(batch: Dict[str, np.ndarray]) -> Dict:
+        """แปลงผลของ batch ขนาด 1 เป็น Dict แบบเดิม (int / float / str)"""
+        result = {}
+        for key, values in batch.items():
+            value = values.reshape(-1)[0].item()
+            if isinstance(value, float) and key.startswith('max_') and key.endswith(('_pips', '_levels')) and value.is_integer():
+                value = int(value)
+            result[key] = value
+        return result
+    
+    def simulate_grid_only(self, balance: float, price: float, leverage: int = 100) -> Dict:
+        """Simulate ระบบ Grid อย่างเดียว (รองรับ Buy/Sell แยกกัน)"""
+        return self._to_scalar_result(self.simulate_batch(
+            balance, price, leverage, config.grid.buy_lot_size, config.grid.sell_lot_size))
     
     def simulate_grid_with_hg(self, balance: float, price: float, leverage: int = 100) -> Dict:
         """Simulate ระบบ Grid + HG (รองรับ Buy/Sell แยกกัน)"""
+        return self._to_scalar_result(self.simulate_batch(
+            balance, price, leverage, config.grid.buy_lot_size, config.grid.sell_lot_size, with_hg=True))
+    
+    def calculate_survivability_surface(self, balance: float, price: float, leverage: int = 100,
+                                        balance_factors=(0.5, 1.0, 2.0, 5.0),
+                                        lot_sizes=(0.01, 0.02, 0.05, 0.1, 0.2)) -> Dict:
+        """
+        ตาราง Max Distance (pips) ของทุกคู่ balance × lot (แถว = balance, คอลัมน์ = lot)
         
-        direction = config.grid.direction
-        buy_lot = config.grid.buy_lot_size
-        sell_lot = config.grid.sell_lot_size
-        buy_distance = config.grid.buy_grid_distance
-        sell_distance = config.grid.sell_grid_distance
-        buy_hg_distance = config.hg.buy_hg_distance
-        sell_hg_distance = config.hg.sell_hg_distance
-        buy_hg_mult = config.hg.buy_hg_multiplier
-        sell_hg_mult = config.hg.sell_hg_multiplier
-        max_hg_levels = config.hg.max_hg_levels
-        
-        grid_positions = []
-        hg_positions = []
-        current_distance = 0
-        hg_buy_count = 0
-        hg_sell_count = 0
-        safe_margin_level = 1.5
-        
-        while True:
-            current_distance += min(buy_distance, sell_distance)
-            
-            # เพิ่มไม้ Grid
-            if direction == "both":
-                grid_positions.append({'distance': current_distance, 'lot': buy_lot, 'type': 'buy'})
-            elif direction == "buy":
-                grid_positions.append({'distance': current_distance, 'lot': buy_lot, 'type': 'buy'})
-            else:
-                grid_positions.append({'distance': current_distance, 'lot': sell_lot, 'type': 'sell'})
-            
-            # เช็ค HG trigger
-            if current_distance % buy_hg_distance == 0 and hg_buy_count < max_hg_levels:
-                net_exposure = sum(p['lot'] for p in grid_positions if p['type'] == 'buy')
-                hg_lot = net_exposure * buy_hg_mult
-                hg_positions.append({'distance': current_distance, 'lot': hg_lot, 'type': 'buy'})
-                hg_buy_count += 1
-            
-            if current_distance % sell_hg_distance == 0 and hg_sell_count < max_hg_levels:
-                net_exposure = sum(p['lot'] for p in grid_positions if p['type'] == 'sell')
-                hg_lot = net_exposure * sell_hg_mult
-                hg_positions.append({'distance': current_distance, 'lot': hg_lot, 'type': 'sell'})
-                hg_sell_count += 1
-            
-            # คำนวณ Margin และ Drawdown
-            total_margin = sum(self.calculate_margin_per_lot(price, p['lot'], leverage) 
-                             for p in grid_positions + hg_positions)
-            
-            # คำนวณ Drawdown ด้วยฟังก์ชันที่ถูกต้อง (worst case: ราคาลงไปเรื่อยๆ)
-            grid_dd = sum(
-                self.calculate_drawdown_for_position(
-                    p['distance'], current_distance, 
-                    self.calculate_pip_value_for_lot(p['lot']), 
-                    p['type']
-                ) for p in grid_positions
-            )
-            hg_dd = sum(
-                self.calculate_drawdown_for_position(
-                    p['distance'], current_distance, 
-                    self.calculate_pip_value_for_lot(p['lot']), 
-                    p['type']
-                ) for p in hg_positions
-            )
-            total_drawdown = grid_dd + hg_dd
-            
-            equity = balance - total_drawdown
-            margin_level = equity / total_margin if total_margin > 0 else 999
-            
-            if margin_level < safe_margin_level or equity < total_margin or current_distance > 10000:
-                return {
-                    'max_distance_pips': current_distance - min(buy_distance, sell_distance),
-                    'max_grid_levels': len(grid_positions) - 1,
-                    'max_hg_levels': len(hg_positions),
-                    'max_margin': total_margin,
-                    'max_drawdown': total_drawdown,
-                    'grid_drawdown': grid_dd,
-                    'hg_drawdown': hg_dd,
-                    'final_margin_level': margin_level,
-                    'final_equity': equity,
-                    'status': 'AT_LIMIT' if margin_level < safe_margin_level else 'SAFE'
-                }
+        Args:
+            balance: ยอดเงินปัจจุบัน (คูณด้วย balance_factors)
+            price: ราคาปัจจุบัน
+            leverage: Leverage ของบัญชี
+            balance_factors: ตัวคูณ balance ของแต่ละแถว
+            lot_sizes: lot ของแต่ละคอลัมน์ (ใช้ทั้ง Buy และ Sell)
+        
+        Returns:
+            Dict ที่มี balances, lot_sizes, grid_only และ with_hg (None ถ้าปิด HG)
+        """
+        balances = balance * np.asarray(balance_factors, dtype=np.float64)
+        lots = np.asarray(lot_sizes, dtype=np.float64)
+        grid = np.meshgrid(balances, lots, indexing='ij')
+        grid_only = self.simulate_batch(grid[0], price, leverage, grid[1])
+        with_hg = self.simulate_batch(grid[0], price, leverage, grid[1], with_hg=True) if config.hg.enabled else None
+        return {
+            'balances': balances,
+            'lot_sizes': lots,
+            'grid_only': grid_only['max_distance_pips'],
+            'with_hg': with_hg['max_distance_pips'] if with_hg else None,
+        }
     
     def calculate_risk(self, balance: float = None, price: float = None, leverage: int = 100) -> Dict:
         """คำนวณความเสี่ยงทั้งหมด"""
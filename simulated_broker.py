@@ -0,0 +1,437 @@
+# simulated_broker.py
+# Broker จำลองแบบ deterministic: replay tick แล้ว match orders (TP/SL, margin, stop out) ในโปรเซสเดียว
+
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional
+import logging
+import threading
+import numpy as np
+from broker_backend import BrokerBackend, TIMEFRAME_SECONDS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# โครงสร้างข้อมูลเลียนแบบ object ที่ MetaTrader5 คืนค่า
+SymbolInfo = namedtuple('SymbolInfo', [
+    'name', 'visible', 'digits', 'point', 'trade_tick_size', 'trade_tick_value', 'trade_contract_size',
+    'volume_min', 'volume_max', 'volume_step', 'filling_mode', 'bid', 'ask'
+])
+Tick = namedtuple('Tick', ['time', 'bid', 'ask', 'last', 'volume'])
+TradePosition = namedtuple('TradePosition', [
+    'ticket', 'time', 'type', 'magic', 'volume', 'price_open', 'sl', 'tp',
+    'price_current', 'swap', 'profit', 'symbol', 'comment'
+])
+OrderSendResult = namedtuple('OrderSendResult', [
+    'retcode', 'deal', 'order', 'volume', 'price', 'bid', 'ask', 'comment', 'request'
+])
+AccountInfo = namedtuple('AccountInfo', [
+    'login', 'name', 'server', 'company', 'currency', 'leverage', 'balance', 'profit',
+    'equity', 'margin', 'margin_free', 'margin_level'
+])
+
+# dtype เดียวกับผลลัพธ์ของ mt5.copy_rates_from_pos
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8')
+])
+BARS_INITIAL_CAPACITY = 1024  # จำนวนแท่งที่จองไว้ต่อ timeframe (ขยายเป็น 2 เท่าเมื่อเต็ม)
+
+
+class SimulatedBroker(BrokerBackend):
+    """
+    Broker จำลองสำหรับ backtest / benchmark บน Linux
+    - ราคามาจาก tick ที่ replay ทีละ tick (step) หรือส่งเข้ามาเอง (push_tick)
+    - Market order fill ที่ ask/bid ปัจจุบัน, TP fill ที่ราคา TP, SL fill ที่ราคา SL หรือแย่กว่า (gap)
+    - คำนวณ margin แบบเดียวกับ RiskCalculator: lot * contract_size * price / leverage (แปลงเป็นสกุลเงินบัญชีตาม tick_value)
+    - Stop out: ปิด position ที่ขาดทุนมากที่สุดจนกว่า margin level >= stop_out_level
+    """
+
+    name = "simulated"
+    max_concurrent_orders = 8  # order_send serialize ด้วย _order_lock อยู่แล้ว
+
+    def __init__(self, symbol: str = "XAUUSD", balance: float = 10000.0, leverage: int = 100,
+                 contract_size: float = 100.0, digits: int = 2, volume_step: float = 0.01,
+                 volume_min: float = 0.01, volume_max: float = 100.0,
+                 stop_out_level: float = 50.0, filling_mode: int = 2, tick_value: Optional[float] = None):
+        self.symbol = symbol
+        self.leverage = leverage
+        self.contract_size = contract_size
+        self.digits = digits
+        self.point = 10 ** -digits
+        # มูลค่า 1 tick ต่อ 1 lot ในสกุลเงินบัญชี (None = บัญชีสกุลเดียวกับ quote เช่น USD)
+        # เช่นบัญชี USC: tick_value = point × contract_size × 100
+        self.tick_value = tick_value if tick_value is not None else self.point * contract_size
+        self.account_rate = self.tick_value / (self.point * contract_size)  # quote → สกุลเงินบัญชี
+        self.volume_step = volume_step
+        self.volume_min = volume_min
+        self.volume_max = volume_max
+        self.stop_out_level = stop_out_level  # %
+        self.filling_mode = filling_mode
+        self._order_lock = threading.Lock()  # order_send จาก executor / batch close หลาย thread ทีละรายการ
+
+        self.initial_balance = balance
+        self.balance = balance
+        self.positions: Dict[int, Dict] = {}
+        self.deals: List[Dict] = []
+        self.next_ticket = 1
+        self.current_tick: Optional[Tick] = None
+        self.stopped_out = False
+        self._last_error = (1, 'Success')
+
+        # tick ที่โหลดไว้สำหรับ replay
+        self._tick_times = np.empty(0, dtype=np.int64)
+        self._tick_bids = np.empty(0, dtype=np.float64)
+        self._tick_asks = np.empty(0, dtype=np.float64)
+        self._cursor = 0
+
+        # แท่งเทียนต่อ timeframe: closed bars (array จองที่ไว้ล่วงหน้า ใช้ได้ _bar_counts แถวแรก) + แท่งที่กำลังวิ่ง
+        self._bars: Dict[int, np.ndarray] = {tf: np.empty(BARS_INITIAL_CAPACITY, dtype=RATES_DTYPE)
+                                             for tf in TIMEFRAME_SECONDS}
+        self._bar_counts: Dict[int, int] = {tf: 0 for tf in TIMEFRAME_SECONDS}
+        self._forming: Dict[int, Optional[list]] = {tf: None for tf in TIMEFRAME_SECONDS}
+
+    # ------------------------------------------------------------------
+    # Data feed
+    # ------------------------------------------------------------------
+    def load_ticks(self, times: Iterable, bids: Iterable, asks: Iterable):
+        """
+        โหลด tick สำหรับ replay
+
+        Args:
+            times: เวลา (unix seconds)
+            bids: ราคา bid
+            asks: ราคา ask
+        """
+        self._tick_times = np.asarray(times, dtype=np.int64)
+        self._tick_bids = np.asarray(bids, dtype=np.float64)
+        self._tick_asks = np.asarray(asks, dtype=np.float64)
+        self._cursor = 0
+
+    def load_history(self, timeframe: int, rates: np.ndarray):
+        """
+        โหลดแท่งเทียนย้อนหลัง (ให้ ATR / zone detector มีข้อมูลตั้งแต่ tick แรก)
+
+        Args:
+            timeframe: timeframe ของ rates
+            rates: structured array แบบ RATES_DTYPE (เรียงจากเก่าไปใหม่)
+        """
+        rates = np.asarray(rates).astype(RATES_DTYPE)
+        bars = np.empty(max(BARS_INITIAL_CAPACITY, 2 * len(rates)), dtype=RATES_DTYPE)
+        bars[:len(rates)] = rates
+        self._bars[timeframe] = bars
+        self._bar_counts[timeframe] = len(rates)
+        self._forming[timeframe] = None
+
+    @property
+    def remaining_ticks(self) -> int:
+        return len(self._tick_times) - self._cursor
+
+    def step(self) -> bool:
+        """
+        เลื่อนไป tick ถัดไปที่โหลดไว้
+
+        Returns:
+            False ถ้า tick หมดแล้ว
+        """
+        if self._cursor >= len(self._tick_times):
+            return False
+        i = self._cursor
+        self._cursor += 1
+        self.push_tick(int(self._tick_times[i]), float(self._tick_bids[i]), float(self._tick_asks[i]))
+        return True
+
+    def push_tick(self, time: int, bid: float, ask: float, volume: int = 1):
+        """
+        ส่ง tick ใหม่เข้าระบบ: อัพเดทแท่งเทียน, ตรวจ TP/SL และ stop out
+
+        Args:
+            time: เวลา (unix seconds)
+            bid: ราคา bid
+            ask: ราคา ask
+            volume: tick volume
+        """
+        self.current_tick = Tick(time, bid, ask, bid, volume)
+        self._update_bars(time, bid, ask, volume)
+        self._check_stops()
+        self._check_stop_out()
+
+    def _update_bars(self, time: int, bid: float, ask: float, volume: int):
+        spread = int(round((ask - bid) / self.point))
+        for tf, seconds in TIMEFRAME_SECONDS.items():
+            bar_time = time - (time % seconds)
+            bar = self._forming[tf]
+            if bar is not None and bar[0] == bar_time:
+                bar[2] = max(bar[2], bid)
+                bar[3] = min(bar[3], bid)
+                bar[4] = bid
+                bar[5] += volume
+                continue
+            if bar is not None:
+                self._append_bar(tf, bar)
+            self._forming[tf] = [bar_time, bid, bid, bid, bid, volume, spread, 0]
+
+    def _append_bar(self, timeframe: int, bar: list):
+        """เพิ่มแท่งที่ปิดแล้วต่อท้าย array (ขยายขนาดเป็น 2 เท่าเมื่อเต็ม → amortized O(1) ต่อแท่ง)"""
+        bars = self._bars[timeframe]
+        n = self._bar_counts[timeframe]
+        if n == len(bars):
+            grown = np.empty(2 * len(bars), dtype=RATES_DTYPE)
+            grown[:n] = bars
+            self._bars[timeframe] = bars = grown
+        bars[n] = tuple(bar)
+        self._bar_counts[timeframe] = n + 1
+
+    # ------------------------------------------------------------------
+    # Matching
+    # ------------------------------------------------------------------
+    def _close_price(self, pos: Dict) -> float:
+        return self.current_tick.bid if pos['type'] == self.ORDER_TYPE_BUY else self.current_tick.ask
+
+    def _profit(self, pos: Dict, price: float, volume: Optional[float] = None) -> float:
+        volume = pos['volume'] if volume is None else volume
+        diff = price - pos['price_open'] if pos['type'] == self.ORDER_TYPE_BUY else pos['price_open'] - price
+        return diff * volume * self.contract_size * self.account_rate
+
+    def _margin(self, volume: float, price: float) -> float:
+        return volume * self.contract_size * price / self.leverage * self.account_rate
+
+    def _check_stops(self):
+        for ticket in sorted(self.positions):
+            pos = self.positions[ticket]
+            price = self._close_price(pos)
+            if pos['type'] == self.ORDER_TYPE_BUY:
+                # SL ก่อน TP (กรณี gap ผ่านทั้งสองระดับให้ถือว่าโดน SL)
+                if pos['sl'] and price <= pos['sl']:
+                    self._close_position(ticket, pos['volume'], min(price, pos['sl']), 'sl')
+                elif pos['tp'] and price >= pos['tp']:
+                    self._close_position(ticket, pos['volume'], pos['tp'], 'tp')
+            else:
+                if pos['sl'] and price >= pos['sl']:
+                    self._close_position(ticket, pos['volume'], max(price, pos['sl']), 'sl')
+                elif pos['tp'] and price <= pos['tp']:
+                    self._close_position(ticket, pos['volume'], pos['tp'], 'tp')
+
+    def _check_stop_out(self):
+        while self.positions:
+            account = self.account_info()
+            if account.margin <= 0 or account.margin_level >= self.stop_out_level:
+                return
+            worst = min(self.positions, key=lambda t: (self._profit(self.positions[t], self._close_price(self.positions[t])), t))
+            pos = self.positions[worst]
+            logger.warning(f"Stop out: margin level {account.margin_level:.1f}% - closing ticket {worst}")
+            self.stopped_out = True
+            self._close_position(worst, pos['volume'], self._close_price(pos), 'so')
+
+    def _close_position(self, ticket: int, volume: float, price: float, reason: str) -> Dict:
+        pos = self.positions[ticket]
+        volume = min(volume, pos['volume'])
+        profit = self._profit(pos, price, volume)
+        self.balance += profit
+        remaining = round(pos['volume'] - volume, 8)
+        if remaining <= 0:
+            del self.positions[ticket]
+        else:
+            pos['volume'] = remaining
+        deal = self._record_deal(pos, 'out', volume, price, profit, reason)
+        return deal
+
+    def _record_deal(self, pos: Dict, entry: str, volume: float, price: float,
+                     profit: float, reason: str) -> Dict:
+        deal = {
+            'deal': len(self.deals) + 1,
+            'position': pos['ticket'],
+            'time': self.current_tick.time if self.current_tick else 0,
+            'type': 'buy' if pos['type'] == self.ORDER_TYPE_BUY else 'sell',
+            'entry': entry,
+            'volume': volume,
+            'price': price,
+            'profit': profit,
+            'reason': reason,
+            'comment': pos['comment'],
+            'balance': self.balance,
+        }
+        self.deals.append(deal)
+        return deal
+
+    def _result(self, retcode: int, comment: str, request: dict, deal: int = 0, order: int = 0,
+                volume: float = 0.0, price: float = 0.0) -> OrderSendResult:
+        tick = self.current_tick
+        return OrderSendResult(retcode, deal, order, volume, price,
+                               tick.bid if tick else 0.0, tick.ask if tick else 0.0, comment, request)
+
+    # ------------------------------------------------------------------
+    # BrokerBackend API
+    # ------------------------------------------------------------------
+    def initialize(self, *args, **kwargs) -> bool:
+        return True
+
+    def login(self, login: int, password: str, server: str) -> bool:
+        return True
+
+    def shutdown(self):
+        pass
+
+    def last_error(self):
+        return self._last_error
+
+    def symbol_info(self, symbol: str):
+        if symbol != self.symbol:
+            return None
+        tick = self.current_tick
+        return SymbolInfo(self.symbol, True, self.digits, self.point, self.point, self.tick_value, self.contract_size,
+                          self.volume_min, self.volume_max, self.volume_step, self.filling_mode,
+                          tick.bid if tick else 0.0, tick.ask if tick else 0.0)
+
+    def symbol_info_tick(self, symbol: str):
+        if symbol != self.symbol:
+            return None
+        return self.current_tick
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        return symbol == self.symbol
+
+    def symbols_get(self, *args, **kwargs):
+        return (self.symbol_info(self.symbol),)
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        if symbol != self.symbol or timeframe not in self._bars:
+            return None
+        closed = self._bars[timeframe][:self._bar_counts[timeframe]]
+        forming = self._forming[timeframe]
+        # start_pos = 0 คือแท่งที่กำลังวิ่ง (เหมือน MT5)
+        total = len(closed) + (1 if forming is not None else 0)
+        end = total - start_pos
+        if end <= 0:
+            return None
+        start = max(0, end - count)
+        if end <= len(closed):
+            return closed[start:end].copy()
+        return np.concatenate([closed[start:], np.array([tuple(forming)], dtype=RATES_DTYPE)])
+
+    def positions_get(self, symbol: Optional[str] = None, ticket: Optional[int] = None):
+        if ticket is not None:
+            tickets = [ticket] if ticket in self.positions else []
+        else:
+            if symbol is not None and symbol != self.symbol:
+                return ()
+            tickets = sorted(self.positions)
+        result = []
+        for t in tickets:
+            pos = self.positions[t]
+            price = self._close_price(pos)
+            result.append(TradePosition(
+                pos['ticket'], pos['time'], pos['type'], pos['magic'], pos['volume'],
+                pos['price_open'], pos['sl'], pos['tp'], price, 0.0,
+                self._profit(pos, price), self.symbol, pos['comment']
+            ))
+        return tuple(result)
+
+    def order_send(self, request: dict):
+        with self._order_lock:
+            return self._order_send(request)
+
+    def _order_send(self, request: dict):
+        if self.current_tick is None:
+            return self._result(self.TRADE_RETCODE_INVALID, 'No prices', request)
+
+        action = request.get('action')
+        if action == self.TRADE_ACTION_SLTP:
+            return self._modify_position(request)
+        if action != self.TRADE_ACTION_DEAL:
+            return self._result(self.TRADE_RETCODE_INVALID, 'Unsupported action', request)
+
+        trade_type = request.get('type')
+        market_price = self.current_tick.ask if trade_type == self.ORDER_TYPE_BUY else self.current_tick.bid
+        requested_price = request.get('price')
+        deviation = request.get('deviation', 0) * self.point
+        if requested_price and abs(requested_price - market_price) > deviation:
+            return self._result(self.TRADE_RETCODE_REQUOTE, 'Requote', request)
+
+        volume = request.get('volume', 0.0)
+        if volume < self.volume_min - 1e-9 or volume > self.volume_max + 1e-9:
+            return self._result(self.TRADE_RETCODE_INVALID_VOLUME, 'Invalid volume', request)
+
+        # ปิด position (ทั้งหมดหรือบางส่วน)
+        if request.get('position'):
+            ticket = request['position']
+            pos = self.positions.get(ticket)
+            if pos is None:
+                return self._result(self.TRADE_RETCODE_POSITION_CLOSED, 'Position not found', request)
+            deal = self._close_position(ticket, volume, market_price, 'client')
+            return self._result(self.TRADE_RETCODE_DONE, 'Request executed', request,
+                                deal=deal['deal'], order=ticket, volume=deal['volume'], price=market_price)
+
+        # เปิด position ใหม่
+        account = self.account_info()
+        required_margin = self._margin(volume, market_price)
+        if required_margin > account.margin_free:
+            return self._result(self.TRADE_RETCODE_NO_MONEY, 'No money', request)
+
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        pos = {
+            'ticket': ticket,
+            'time': self.current_tick.time,
+            'type': trade_type,
+            'magic': request.get('magic', 0),
+            'volume': volume,
+            'price_open': market_price,
+            'sl': request.get('sl', 0.0) or 0.0,
+            'tp': request.get('tp', 0.0) or 0.0,
+            'comment': request.get('comment', ''),
+        }
+        self.positions[ticket] = pos
+        deal = self._record_deal(pos, 'in', volume, market_price, 0.0, 'client')
+        return self._result(self.TRADE_RETCODE_DONE, 'Request executed', request,
+                            deal=deal['deal'], order=ticket, volume=volume, price=market_price)
+
+    def _modify_position(self, request: dict):
+        pos = self.positions.get(request.get('position'))
+        if pos is None:
+            return self._result(self.TRADE_RETCODE_POSITION_CLOSED, 'Position not found', request)
+        sl = request.get('sl', 0.0) or 0.0
+        tp = request.get('tp', 0.0) or 0.0
+        price = self._close_price(pos)
+        if pos['type'] == self.ORDER_TYPE_BUY:
+            invalid = (sl and sl >= price) or (tp and tp <= price)
+        else:
+            invalid = (sl and sl <= price) or (tp and tp >= price)
+        if invalid:
+            return self._result(self.TRADE_RETCODE_INVALID_STOPS, 'Invalid stops', request)
+        pos['sl'] = sl
+        pos['tp'] = tp
+        return self._result(self.TRADE_RETCODE_DONE, 'Request executed', request, order=pos['ticket'])
+
+    def account_info(self):
+        floating = 0.0
+        margin = 0.0
+        for pos in self.positions.values():
+            if self.current_tick is not None:
+                floating += self._profit(pos, self._close_price(pos))
+            margin += self._margin(pos['volume'], pos['price_open'])
+        equity = self.balance + floating
+        margin_level = equity / margin * 100 if margin > 0 else 0.0
+        return AccountInfo(1, 'Simulated', 'Simulator', 'GridTradingHG', 'USD', self.leverage,
+                           self.balance, floating, equity, margin, equity - margin, margin_level)
+
+    def get_statistics(self) -> Dict:
+        """
+        สรุปผลของบัญชีจำลอง
+
+        Returns:
+            Dict ที่มี balance, equity, จำนวน deals และจำนวนครั้งที่ปิดด้วย TP/SL/stop out
+        """
+        account = self.account_info()
+        closes = [d for d in self.deals if d['entry'] == 'out']
+        return {
+            'initial_balance': self.initial_balance,
+            'balance': self.balance,
+            'equity': account.equity,
+            'net_profit': self.balance - self.initial_balance,
+            'open_positions': len(self.positions),
+            'deals': len(self.deals),
+            'tp_fills': sum(1 for d in closes if d['reason'] == 'tp'),
+            'sl_fills': sum(1 for d in closes if d['reason'] == 'sl'),
+            'stop_outs': sum(1 for d in closes if d['reason'] == 'so'),
+            'stopped_out': self.stopped_out,
+        }
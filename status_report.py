@@ -0,0 +1,107 @@
+# status_report.py
+# รายงานสถานะบัญชีไปยัง License API และเก็บเวลารายงานครั้งถัดไปที่ server กำหนด
+
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import logging
+import requests
+from mt5_connection import mt5_connection
+from clock import clock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+API_BASE_URL = "http://123.253.62.50:8080/api"
+REPORT_FALLBACK_INTERVAL = 300.0  # วินาที (ใช้เมื่อ server ไม่ส่ง nextReportTime มา)
+
+
+class StatusReporter:
+    """
+    รายงานสถานะไปยัง API (ใช้ทั้งตอนเริ่มเทรดและเป็น task ของ Engine)
+    - server เป็นผู้กำหนดเวลารายงานครั้งถัดไป (nextReportTime)
+    - license ไม่ active → raise Exception (ผู้เรียกต้องหยุดระบบ)
+    """
+
+    def __init__(self, api_base_url: str = API_BASE_URL):
+        self.api_base_url = api_base_url
+        self.next_report_time: Optional[datetime] = None
+        self.expiry_date: Optional[str] = None
+        self.last_report: Optional[float] = None
+
+    def should_report(self) -> bool:
+        """Check if it's time to report status"""
+        if self.next_report_time:
+            current_utc = datetime.now(timezone.utc)
+            next_report_utc = self.next_report_time.astimezone(timezone.utc)
+
+            return current_utc >= next_report_utc
+        return True  # Report if no scheduled time
+
+    def next_due(self) -> float:
+        """เวลาที่ควรรายงานครั้งถัดไป (timestamp) สำหรับ Engine"""
+        if self.next_report_time:
+            return self.next_report_time.timestamp()
+        if self.last_report is None:
+            return clock.time()
+        return self.last_report + REPORT_FALLBACK_INTERVAL
+
+    def report(self) -> Dict:
+        """Report the current status to the API"""
+
+        try:
+            account_info = mt5_connection.get_account_info()
+        except Exception as e:
+            raise Exception(f"Failed to get account data: {str(e)}")
+
+        status_response = requests.post(
+            f"{self.api_base_url}/customer-clients/status",
+            json={
+                "tradingAccountId": str(account_info['login']),
+                "name": account_info['name'],
+                "brokerName": account_info['company'],
+                "currentBalance":  str(account_info['balance']),
+                "currentProfit": str(account_info['profit']),
+                "currency": account_info['currency'],
+                "botName": "Grid Trading AI",
+                "botVersion": "0.0.1"
+            },
+            timeout=10
+        )
+        self.last_report = clock.time()
+
+        if status_response.status_code != 200:
+            raise Exception(f"Failed to check status: {status_response.status_code}")
+
+        response_data = status_response.json()
+        self.expiry_date = response_data.get("expiryDate") or None
+
+        # Check if trading is inactive
+        if response_data.get("processedStatus") == "inactive":
+            raise Exception("ไม่สามารถเริ่มระบบเทรดได้: หมดอายุไอฟาย ^^")
+
+        # Store next report time for scheduling
+        next_report_time = response_data.get("nextReportTime")
+        if next_report_time:
+            self.next_report_time = self._parse_time(next_report_time)
+            logger.info(f"Next report scheduled for: {self.next_report_time}")
+
+        return response_data
+
+    @staticmethod
+    def _parse_time(value: str) -> datetime:
+        """แปลงเวลา ISO จาก server (ตัด microseconds ให้เหลือ 6 หลักก่อน parse)"""
+        if '.' in value and '+' in value:
+            parts = value.split('.')
+            microseconds = parts[1].split('+')[0]
+            timezone_part = '+' + parts[1].split('+')[1]
+
+            # Truncate microseconds to 6 digits
+            if len(microseconds) > 6:
+                microseconds = microseconds[:6]
+
+            value = f"{parts[0]}.{microseconds}{timezone_part}"
+        return datetime.fromisoformat(value)
+
+
+# สร้าง instance หลักสำหรับใช้งาน
+status_reporter = StatusReporter()
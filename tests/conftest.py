@@ -0,0 +1,42 @@
+# conftest.py
+# ตั้งค่าให้ test import module ของระบบจาก root ของ repo ได้ และไม่เขียนทับ settings.ini จริง
+
+import os
+import sys
+import tempfile
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# config โหลด/สร้างไฟล์ตอน import → ชี้ไปที่ไฟล์ชั่วคราวก่อน
+os.environ.setdefault("GRIDTRADING_CONFIG", os.path.join(tempfile.mkdtemp(prefix="gridtrading-test-"), "settings.ini"))
+
+
+@pytest.fixture
+def sim_broker():
+    """
+    SimulatedBroker ที่เชื่อมกับ mt5_connection แล้ว (bid 2000.0 / ask 2000.2 คงที่ 100 ticks)
+    คืน backend / clock เดิมหลังจบ test
+    """
+    from config import config
+    from broker_backend import broker
+    from clock import clock
+    from mt5_connection import mt5_connection
+    from simulated_broker import SimulatedBroker
+
+    config.persist = False
+    times = 1_700_000_000 + np.arange(100)
+    bids = np.full(100, 2000.0)
+    sim = SimulatedBroker(symbol=config.mt5.symbol, balance=100000.0, leverage=500)
+    sim.load_ticks(times, bids, bids + 0.2)
+    sim.step()
+    previous = broker.use_backend(sim)
+    clock.set_virtual(int(times[0]))
+    mt5_connection.connect_to_mt5()
+    yield sim
+    mt5_connection.disconnect()
+    broker.use_backend(previous)
+    clock.use_real_time()
@@ -0,0 +1,33 @@
+# test_backtester.py
+# bars_to_ticks: ลำดับ tick ภายในแท่ง และการแปลงคอลัมน์ spread (หน่วย point) เป็นราคา
+
+import numpy as np
+import pytest
+from backtester import bars_to_ticks
+from simulated_broker import RATES_DTYPE
+
+
+def make_bars(spread: int = 0) -> np.ndarray:
+    rates = np.zeros(2, dtype=RATES_DTYPE)
+    rates['time'] = [0, 60]
+    rates['open'] = [1.0, 1.5]
+    rates['high'] = [2.0, 1.6]
+    rates['low'] = [0.5, 1.1]
+    rates['close'] = [1.5, 1.2]
+    rates['spread'] = spread
+    return rates
+
+
+def test_bullish_bar_visits_low_first_and_bearish_bar_high_first():
+    times, bids, asks = bars_to_ticks(make_bars(), spread=0.2)
+
+    assert bids.tolist() == [1.0, 0.5, 2.0, 1.5, 1.5, 1.6, 1.1, 1.2]
+    assert times.tolist() == [0, 15, 30, 59, 60, 75, 90, 119]
+    assert asks - bids == pytest.approx(np.full(8, 0.2))
+
+
+@pytest.mark.parametrize("point", [0.01, 0.001, 0.00001])
+def test_spread_column_converted_with_symbol_point(point):
+    _, bids, asks = bars_to_ticks(make_bars(spread=25), spread=0.2, point=point)
+
+    assert asks - bids == pytest.approx(np.full(8, 25 * point))
@@ -0,0 +1,69 @@
+# test_batch_close.py
+# close_positions_batch: กรองตาม magic และจำนวน order_send พร้อมกันไม่เกินที่ backend รองรับ
+
+import threading
+from config import config
+from mt5_connection import mt5_connection
+from simulated_broker import SimulatedBroker
+
+
+def record_send_threads(sim: SimulatedBroker) -> set:
+    threads = set()
+    order_send = sim.order_send
+
+    def recording(request):
+        threads.add(threading.get_ident())
+        return order_send(request)
+
+    sim.order_send = recording
+    return threads
+
+
+def open_positions(count: int):
+    for _ in range(count):
+        mt5_connection.place_order('buy', 0.01, comment=config.mt5.comment_grid)
+
+
+def test_single_order_backend_closes_sequentially(sim_broker):
+    sim_broker.max_concurrent_orders = 1  # เหมือน MT5Backend
+    open_positions(12)
+    threads = record_send_threads(sim_broker)
+
+    report = mt5_connection.close_positions_batch(max_workers=8)
+
+    assert report.closed_count == 12
+    assert threads == {threading.get_ident()}
+    assert not sim_broker.positions_get(symbol=config.mt5.symbol)
+
+
+def test_concurrent_backend_uses_worker_pool(sim_broker):
+    open_positions(12)
+    threads = record_send_threads(sim_broker)
+
+    report = mt5_connection.close_positions_batch()
+
+    assert report.closed_count == 12
+    assert threading.get_ident() not in threads
+    assert 1 <= len(threads) <= SimulatedBroker.max_concurrent_orders
+
+
+def test_only_own_magic_is_closed(sim_broker):
+    open_positions(5)
+    for _ in range(3):
+        sim_broker.order_send({'action': sim_broker.TRADE_ACTION_DEAL, 'symbol': config.mt5.symbol,
+                               'volume': 0.01, 'type': sim_broker.ORDER_TYPE_BUY, 'price': 2000.2,
+                               'magic': mt5_connection.magic_number + 1, 'comment': 'manual',
+                               'type_filling': 1})
+    revision = mt5_connection.trade_revision
+
+    report = mt5_connection.close_positions_batch()
+
+    left = sim_broker.positions_get(symbol=config.mt5.symbol)
+    assert report.closed_count == 5
+    assert {pos.magic for pos in left} == {mt5_connection.magic_number + 1} and len(left) == 3
+    assert mt5_connection.trade_revision == revision + 5
+
+
+def test_mt5_backend_sends_one_order_at_a_time():
+    from broker_backend import MT5Backend
+    assert MT5Backend.max_concurrent_orders == 1
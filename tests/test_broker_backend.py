@@ -0,0 +1,26 @@
+# test_broker_backend.py
+# BrokerBackend เป็น abstract: backend ที่ implement ไม่ครบต้องสร้างไม่ได้
+
+import pytest
+from broker_backend import BrokerBackend, MT5Backend
+from simulated_broker import SimulatedBroker
+
+
+def test_incomplete_backend_fails_on_creation():
+    class PartialBackend(BrokerBackend):
+        def initialize(self, *args, **kwargs) -> bool:
+            return True
+
+    with pytest.raises(TypeError, match="abstract"):
+        PartialBackend()
+
+
+def test_base_interface_cannot_be_created():
+    with pytest.raises(TypeError):
+        BrokerBackend()
+
+
+@pytest.mark.parametrize("backend_class", [MT5Backend, SimulatedBroker])
+def test_shipped_backends_implement_interface(backend_class):
+    assert not backend_class.__abstractmethods__
+    assert isinstance(backend_class(), BrokerBackend)
@@ -0,0 +1,128 @@
+# test_hg_zone_detector.py
+# detect_zones แบบ vectorized (_window_reduce) ต้องได้ zone เหมือน loop เดิมทุกตัว
+
+import random
+import numpy as np
+import pytest
+from config import config
+from hg_profiles import HG_PROFILES
+from hg_zone_detector import detect_zones
+from simulated_broker import RATES_DTYPE
+
+config.persist = False
+
+PROFILES = [profile.to_dict() for profile in HG_PROFILES]
+
+
+def detect_zones_reference(atr_pips: float, profile: dict, rates: list) -> dict:
+    """loop เดิม: ตรวจ pivot / breakout ทีละแท่ง แล้วกรองอายุ zone ทีหลัง"""
+    if len(rates) < profile['lookback_bars'] // 2:
+        return {'buy': [], 'sell': []}
+
+    zone_width_price = config.pips_to_price(max(atr_pips * profile['zone_width_factor'], 10))
+    breakout_factor = config.pips_to_price(max(atr_pips, 10))
+    lookback = profile['pivot_lookback']
+    lookahead = profile['breakout_lookahead']
+    lows = [r['low'] for r in rates]
+    highs = [r['high'] for r in rates]
+
+    def volume_ratio(index):
+        volumes = [r['tick_volume'] for r in rates[max(0, index - 10):index]]
+        avg = sum(volumes) / len(volumes) if volumes else 1.0
+        return 1.0 if avg == 0 else rates[index]['tick_volume'] / avg
+
+    def score(strength, ratio):
+        return (min(1.0, strength / breakout_factor) + min(1.0, ratio / 2.0)) / 2.0
+
+    buy_zones, sell_zones = [], []
+    for idx in range(lookback, min(len(rates) - lookahead - 1, len(rates) - lookback)):
+        base_low = min(lows[idx - lookback:idx + 1])
+        base_high = max(highs[idx - lookback:idx + 1])
+        zone_height = max(base_high - base_low, zone_width_price)
+        created_at = rates[idx]['time']
+
+        is_pivot_low = (all(low > lows[idx] for low in lows[idx - lookback:idx]) and
+                        all(low >= lows[idx] for low in lows[idx + 1:idx + 1 + lookback]))
+        if is_pivot_low:
+            strength = max(highs[idx + 1:idx + 1 + lookahead]) - base_high
+            if strength > 0:
+                zone_score = score(strength, volume_ratio(idx + 1))
+                if zone_score >= profile['score_threshold']:
+                    buy_zones.append({'id': f"demand_{created_at}", 'lower': base_low,
+                                      'upper': base_low + zone_height, 'score': zone_score,
+                                      'created_at': created_at, 'width_pips': config.price_to_pips(zone_height),
+                                      'type': 'buy'})
+
+        is_pivot_high = (all(high < highs[idx] for high in highs[idx - lookback:idx]) and
+                         all(high <= highs[idx] for high in highs[idx + 1:idx + 1 + lookback]))
+        if is_pivot_high:
+            strength = base_low - min(lows[idx + 1:idx + 1 + lookahead])
+            if strength > 0:
+                zone_score = score(strength, volume_ratio(idx + 1))
+                if zone_score >= profile['score_threshold']:
+                    sell_zones.append({'id': f"supply_{created_at}", 'upper': base_high,
+                                       'lower': base_high - zone_height, 'score': zone_score,
+                                       'created_at': created_at, 'width_pips': config.price_to_pips(zone_height),
+                                       'type': 'sell'})
+
+    if profile['max_zone_age_bars'] > 0 and len(rates) > 1:
+        cutoff = rates[-1]['time'] - profile['max_zone_age_bars'] * (rates[1]['time'] - rates[0]['time'])
+        buy_zones = [zone for zone in buy_zones if zone['created_at'] >= cutoff]
+        sell_zones = [zone for zone in sell_zones if zone['created_at'] >= cutoff]
+    return {'buy': buy_zones, 'sell': sell_zones}
+
+
+def make_rates(n: int, seed: int) -> np.ndarray:
+    """OHLC สุ่มแบบกำหนด seed (ราคาปัด 0.1 ให้มี high/low เท่ากัน, บาง seed มี volume เป็น 0)"""
+    rng = np.random.default_rng(seed)
+    rates = np.zeros(n, dtype=RATES_DTYPE)
+    close = 2000 + np.cumsum(rng.normal(0, 2, n))
+    rates['time'] = 1_700_000_000 + np.arange(n) * 900
+    rates['open'] = close + rng.normal(0, 0.5, n)
+    rates['close'] = close
+    rates['high'] = np.round(np.maximum(rates['open'], close) + rng.exponential(1, n), 1)
+    rates['low'] = np.round(np.minimum(rates['open'], close) - rng.exponential(1, n), 1)
+    rates['tick_volume'] = rng.integers(0, 500, n)
+    if seed % 5 == 0:
+        rates['tick_volume'][:20] = 0
+    return rates
+
+
+def as_dicts(rates: np.ndarray) -> list:
+    return [{name: (int(row[name]) if name in ('time', 'tick_volume') else float(row[name]))
+             for name in rates.dtype.names} for row in rates]
+
+
+def zones_only(result: dict) -> dict:
+    return {'buy': result['buy'], 'sell': result['sell']}
+
+
+@pytest.mark.parametrize("profile", PROFILES, ids=[str(p['lookback_bars']) for p in PROFILES])
+@pytest.mark.parametrize("seed", range(40))
+def test_matches_reference_loop(profile, seed):
+    pick = random.Random(seed)
+    n = pick.choice([5, 30, profile['lookback_bars'], 300, 500])
+    atr_pips = pick.uniform(1, 80)
+    rates = make_rates(n, seed)
+    rows = as_dicts(rates)
+
+    expected = detect_zones_reference(atr_pips, profile, rows)
+    assert zones_only(detect_zones(atr_pips, profile, rates)) == expected
+    assert zones_only(detect_zones(atr_pips, profile, rows)) == expected
+
+
+@pytest.mark.parametrize("atr_pips", [5.0, 20.0, 60.0])
+def test_matches_reference_loop_on_long_history(atr_pips):
+    profile = PROFILES[-1]
+    rates = make_rates(10000, 1)
+    expected = detect_zones_reference(atr_pips, profile, as_dicts(rates))
+    assert zones_only(detect_zones(atr_pips, profile, rates)) == expected
+
+
+def test_reference_finds_zones():
+    """ข้อมูลทดสอบต้องมี zone จริง (ไม่อย่างนั้นการเทียบผลว่างเปล่าไม่มีความหมาย)"""
+    profile = PROFILES[-1]
+    for zone_type in ('buy', 'sell'):
+        found = sum(len(detect_zones_reference(20.0, profile, as_dicts(make_rates(500, seed)))[zone_type])
+                    for seed in range(10))
+        assert found > 0, zone_type
@@ -0,0 +1,119 @@
+# test_order_queue.py
+# OrderQueue ในโหมด synchronous (แบบที่ backtester ใช้): dedupe, ยกเลิกตาม generation และ has_unsettled
+
+from config import config
+from mt5_connection import mt5_connection
+from order_queue import INTENT_FAILED, INTENT_FILLED, OrderIntent, OrderQueue
+from simulated_broker import SimulatedBroker
+
+
+def during_send(sim: SimulatedBroker, action):
+    """เรียก action ครั้งเดียวระหว่างที่ intent แรกกำลังส่ง (state = submitted) ก่อนถึง broker"""
+    order_send = sim.order_send
+    calls = []
+
+    def wrapped(request):
+        if not calls:
+            calls.append(action())
+        return order_send(request)
+
+    sim.order_send = wrapped
+    return calls
+
+
+def submit(queue: OrderQueue, side: str = 'buy', role: str = 'grid', price: float = 2000.0, **kwargs):
+    return queue.submit(side, 0.01, role, price, comment=config.mt5.comment_grid, **kwargs)
+
+
+def test_duplicate_key_reuses_in_flight_future(sim_broker):
+    queue = OrderQueue(synchronous=True)
+    near = 2000.0 + config.get_pip_value()  # bucket เดียวกัน
+    assert queue.bucket(near) == queue.bucket(2000.0)
+    inner = during_send(sim_broker, lambda: submit(queue, price=near))
+
+    outer = submit(queue)
+
+    assert inner[0] is outer
+    assert outer.result() is not None
+    assert len(sim_broker.positions) == 1
+
+
+def test_different_side_bucket_or_role_is_not_deduped(sim_broker):
+    queue = OrderQueue(synchronous=True)
+    futures = [
+        submit(queue),
+        submit(queue, side='sell'),
+        submit(queue, price=2000.0 + 10 * queue.bucket_pips * config.get_pip_value()),
+        submit(queue, role='hg'),
+    ]
+    # synchronous → แต่ละ intent เสร็จก่อน submit ถัดไป ไม่มี active ค้าง
+    assert len({f.result() for f in futures}) == 4
+    assert len(sim_broker.positions) == 4
+    assert not queue.active_intents
+
+
+def test_dispatch_completed_calls_on_done_once():
+    queue = OrderQueue(synchronous=True)
+    done = []
+    intent = OrderIntent(side='buy', volume=0.01, role='grid', bucket=0, price=2000.0, on_done=done.append)
+    queue.completed.append(intent)
+
+    assert queue.dispatch_completed() == 1
+    assert done == [intent]
+    assert queue.dispatch_completed() == 0
+
+
+def test_reset_cancels_queued_intent_from_previous_generation(sim_broker):
+    queue = OrderQueue(synchronous=True)
+    intent = OrderIntent(side='buy', volume=0.01, role='grid', bucket=queue.bucket(2000.0), price=2000.0,
+                         generation=queue.generation)
+    queue.reset()
+
+    queue._execute(intent)  # executor หยิบ intent ที่รอคิวอยู่ก่อน reset()
+
+    assert intent.state == INTENT_FAILED
+    assert intent.future.result() is None
+    assert not sim_broker.positions
+    assert not queue.completed
+
+
+def test_cancel_all_during_send_drops_dispatch(sim_broker):
+    queue = OrderQueue(synchronous=True)
+    done = []
+    cancelled = during_send(sim_broker, queue.cancel_all)
+
+    future = submit(queue, on_done=done.append)
+
+    assert cancelled == [True]  # synchronous ไม่มี executor ให้รอ
+    assert queue.generation == 1
+    assert future.result() is not None  # order ถึง broker แล้ว ส่งจนจบ
+    assert len(sim_broker.positions) == 1
+    assert done == []  # แต่ไม่ถูก dispatch / ไม่นับเป็น unsettled
+    assert not queue.unsettled
+    assert not queue.has_unsettled('grid', 0)
+
+    submit(queue, on_done=done.append)  # generation ใหม่ทำงานตามปกติ
+    assert [intent.state for intent in done] == [INTENT_FILLED]
+
+
+def test_has_unsettled_tracks_trade_revision(sim_broker):
+    queue = OrderQueue(synchronous=True)
+    before = mt5_connection.trade_revision
+
+    submit(queue)
+    after = mt5_connection.trade_revision
+
+    assert after > before
+    assert queue.has_unsettled('grid', before)  # snapshot ก่อนส่งยังไม่เห็น position
+    assert not queue.has_unsettled('hg', before)
+    assert not queue.has_unsettled('grid', after)
+    assert not queue.unsettled  # ถูกตัดทิ้งเมื่อ snapshot ตามทัน
+    assert not queue.has_unsettled('grid', before)
+
+
+def test_has_unsettled_while_intent_in_flight(sim_broker):
+    queue = OrderQueue(synchronous=True)
+    seen = during_send(sim_broker, lambda: (queue.has_unsettled('grid', 10 ** 9),
+                                            queue.has_unsettled('hg', 10 ** 9)))
+    submit(queue)
+    assert seen == [(True, False)]
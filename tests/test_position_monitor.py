@@ -0,0 +1,82 @@
+# test_position_monitor.py
+# index ของ PositionMonitor: events ระหว่างรอบ และ dict ที่ส่งออกไปแล้วต้องไม่เปลี่ยน (snapshot คงที่)
+
+from datetime import datetime
+import pytest
+from config import config
+from position_monitor import (PositionMonitor, EVENT_OPENED, EVENT_CLOSED,
+                              EVENT_VOLUME_CHANGED, EVENT_SLTP_CHANGED)
+from position_table import PositionTable
+
+config.persist = False
+
+
+def make_position(ticket: int, side: str = 'buy', volume: float = 0.01, price: float = 2000.0,
+                  current: float = 2000.0, profit: float = 0.0, sl: float = 0.0, tp: float = 0.0,
+                  comment: str = None) -> dict:
+    return {'ticket': ticket, 'type': side, 'volume': volume, 'open_price': price,
+            'current_price': current, 'sl': sl, 'tp': tp, 'profit': profit,
+            'comment': comment if comment is not None else config.mt5.comment_grid,
+            'open_time': datetime.fromtimestamp(1700000000)}
+
+
+def index(monitor: PositionMonitor, positions) -> list:
+    return monitor.index_positions(PositionTable.from_dicts(positions))
+
+
+@pytest.fixture
+def monitor():
+    monitor = PositionMonitor()
+    index(monitor, [make_position(1), make_position(2, side='sell', comment=config.mt5.comment_hg)])
+    return monitor
+
+
+def test_price_change_does_not_mutate_published_dicts(monitor):
+    published = monitor.positions
+    by_ticket = monitor.positions_by_ticket
+    grid_buy = monitor.grid_by_side['buy']
+
+    events = index(monitor, [make_position(1, current=1995.0, profit=-5.0),
+                             make_position(2, side='sell', comment=config.mt5.comment_hg)])
+
+    assert events == []
+    assert published[0]['current_price'] == 2000.0 and published[0]['profit'] == 0.0
+    assert by_ticket[1]['profit'] == 0.0 and grid_buy[0]['profit'] == 0.0
+    assert monitor.positions_by_ticket[1]['profit'] == -5.0
+    assert monitor.grid_by_side['buy'][0]['current_price'] == 1995.0
+    # position ที่ไม่เปลี่ยนใช้ dict เดิม
+    assert monitor.positions_by_ticket[2] is by_ticket[2]
+
+
+def test_unchanged_cycle_keeps_indexes(monitor):
+    positions = monitor.positions
+    assert index(monitor, [make_position(1), make_position(2, side='sell', comment=config.mt5.comment_hg)]) == []
+    assert monitor.positions is positions
+
+
+def test_events(monitor):
+    previous = monitor.positions_by_ticket[1]
+    events = index(monitor, [make_position(1, volume=0.02, sl=1990.0),
+                             make_position(3, comment=config.mt5.comment_grid)])
+    kinds = sorted((event.kind, event.ticket, event.role) for event in events)
+    assert kinds == sorted([(EVENT_VOLUME_CHANGED, 1, 'grid'), (EVENT_SLTP_CHANGED, 1, 'grid'),
+                            (EVENT_OPENED, 3, 'grid'), (EVENT_CLOSED, 2, 'hg')])
+    volume_event = next(event for event in events if event.kind == EVENT_VOLUME_CHANGED)
+    assert volume_event.previous is previous and previous['volume'] == 0.01
+    assert monitor.get_comment_info(2) is None
+    assert len(monitor.hg_positions) == 0 and len(monitor.grid_positions) == 2
+
+
+def test_summary_pnl_uses_one_source(monitor):
+    index(monitor, [make_position(1, profit=-12.5), make_position(4, profit=3.25),
+                    make_position(2, side='sell', profit=7.0, comment=config.mt5.comment_hg),
+                    make_position(5, profit=1.5, comment='manual')])
+    # floating P&L ของ ExposureBook (ไม่มี swap / commission) ต่างจาก profit ของ broker
+    monitor.exposure.refresh_pnl(2001.0, 2001.2, 100.0)
+    account = {'equity': 1000.0, 'margin': 10.0, 'free_margin': 990.0, 'margin_level': 10000.0}
+
+    summary = monitor.get_positions_summary(account)
+
+    assert summary['grid_pnl'] == -9.25
+    assert summary['hg_pnl'] == 7.0
+    assert summary['total_pnl'] == pytest.approx(summary['grid_pnl'] + summary['hg_pnl'] + 1.5)
@@ -0,0 +1,66 @@
+# test_position_roles.py
+# encode_comment / parse_comment: metadata ต้องอ่านกลับได้ครบ และ comment ต้องไม่เกินขีดจำกัดของ MT5
+
+import pytest
+from config import config
+from position_roles import (COMMENT_LIMIT, decode_zone_id, derived_comment, encode_comment,
+                            encode_zone_id, parse_comment)
+from position_table import ROLE_GRID, ROLE_HG, ROLE_OTHER
+
+config.persist = False
+
+
+@pytest.mark.parametrize("base,role", [(config.mt5.comment_grid, ROLE_GRID),
+                                       (config.mt5.comment_auto, ROLE_GRID),
+                                       (config.mt5.comment_hg, ROLE_HG)])
+@pytest.mark.parametrize("side", ['buy', 'sell'])
+@pytest.mark.parametrize("level", [0, 1, 12, 999])
+def test_level_round_trip(base, role, side, level):
+    info = parse_comment(encode_comment(base, side, level))
+    assert (info.role, info.side, info.level, info.zone_id) == (role, side, level, None)
+
+
+@pytest.mark.parametrize("zone_id", ["demand_1700000000", "supply_1700000900", "demand_0",
+                                     "supply_4102444800"])
+def test_zone_round_trip(zone_id):
+    comment = encode_comment(config.mt5.comment_hg, 'sell', 3, zone_id=zone_id)
+    assert comment == f"{config.mt5.comment_hg}|Z{encode_zone_id(zone_id)}"
+    info = parse_comment(comment)
+    assert (info.role, info.zone_id, info.level) == (ROLE_HG, zone_id, None)
+
+
+def test_base36_zone_id():
+    assert encode_zone_id("demand_1700000000") == "d" + "s44we8"
+    assert decode_zone_id("ds44we8") == "demand_1700000000"
+    assert int("s44we8", 36) == 1700000000
+
+
+def test_legacy_zone_ids_pass_through():
+    # comment แบบเก่าที่เก็บ id เต็ม / id รูปแบบอื่น อ่านได้ค่าเดิม
+    assert encode_zone_id("zone7") == "zone7"
+    assert decode_zone_id("demand_1700000000") == "demand_1700000000"
+    assert parse_comment(f"{config.mt5.comment_hg}|Zzone7").zone_id == "zone7"
+
+
+def test_plain_and_foreign_comments():
+    assert encode_comment(config.mt5.comment_grid) == config.mt5.comment_grid
+    assert parse_comment(config.mt5.comment_grid) == parse_comment(f"{config.mt5.comment_grid}|X1")
+    assert parse_comment(config.mt5.comment_grid).level is None
+    assert parse_comment("manual trade").role == ROLE_OTHER
+
+
+def test_comment_limit_raises_value_error():
+    base = "G" * (COMMENT_LIMIT - 4)  # + "|B12"
+    assert len(encode_comment(base, 'buy', 12)) == COMMENT_LIMIT
+    with pytest.raises(ValueError):
+        encode_comment(base, 'buy', 123)
+    with pytest.raises(ValueError):
+        encode_comment("H" * 23, zone_id="demand_1700000000")  # + "|Zds44we8" = 32
+
+
+def test_derived_comments_fit_limit():
+    comment = encode_comment(config.mt5.comment_hg, zone_id="supply_1700000900")
+    partial = derived_comment("Partial close", comment)
+    assert len(partial) <= COMMENT_LIMIT
+    assert partial == f"Partial close {comment}"
+    assert len(derived_comment("Partial close", "X" * COMMENT_LIMIT)) == COMMENT_LIMIT
@@ -0,0 +1,116 @@
+# test_simulated_broker.py
+# กฎการ match ของ SimulatedBroker: ราคา fill ของ TP/SL (รวม gap), margin ไม่พอ และ stop out
+
+import pytest
+from simulated_broker import SimulatedBroker
+
+START = 1_700_000_000
+
+
+def make_broker(balance: float = 10000.0, leverage: int = 100) -> SimulatedBroker:
+    sim = SimulatedBroker(balance=balance, leverage=leverage)
+    sim.push_tick(START, 2000.0, 2000.2)
+    return sim
+
+
+def send(sim: SimulatedBroker, side: str, volume: float = 1.0, sl: float = 0.0, tp: float = 0.0):
+    trade_type = sim.ORDER_TYPE_BUY if side == 'buy' else sim.ORDER_TYPE_SELL
+    return sim.order_send({'action': sim.TRADE_ACTION_DEAL, 'symbol': sim.symbol, 'type': trade_type,
+                           'volume': volume, 'sl': sl, 'tp': tp})
+
+
+def tick(sim: SimulatedBroker, bid: float, spread: float = 0.2):
+    sim.push_tick(sim.current_tick.time + 1, bid, bid + spread)
+
+
+def closing_deal(sim: SimulatedBroker, ticket: int) -> dict:
+    deals = [d for d in sim.deals if d['position'] == ticket and d['entry'] == 'out']
+    assert len(deals) == 1
+    return deals[0]
+
+
+@pytest.mark.parametrize("bid", [2005.0, 2012.5])  # แตะพอดี / gap ผ่าน TP
+def test_buy_tp_fills_at_tp_price(bid):
+    sim = make_broker()
+    ticket = send(sim, 'buy', tp=2005.0).order
+
+    tick(sim, 2004.9)
+    assert ticket in sim.positions
+
+    tick(sim, bid)
+    deal = closing_deal(sim, ticket)
+    assert deal['reason'] == 'tp'
+    assert deal['price'] == 2005.0
+    assert deal['profit'] == pytest.approx((2005.0 - 2000.2) * 100)
+
+
+@pytest.mark.parametrize("bid", [1994.8, 1987.5])  # ask แตะพอดี / gap ผ่าน TP
+def test_sell_tp_fills_at_tp_price(bid):
+    sim = make_broker()
+    ticket = send(sim, 'sell', tp=1995.0).order
+
+    tick(sim, bid)  # sell ปิดที่ ask = bid + 0.2
+    deal = closing_deal(sim, ticket)
+    assert deal['reason'] == 'tp'
+    assert deal['price'] == 1995.0
+    assert deal['profit'] == pytest.approx((2000.0 - 1995.0) * 100)
+
+
+@pytest.mark.parametrize("bid, fill", [(1995.0, 1995.0), (1990.0, 1990.0)])
+def test_buy_sl_fills_at_sl_or_worse_on_gap(bid, fill):
+    sim = make_broker()
+    ticket = send(sim, 'buy', sl=1995.0).order
+
+    tick(sim, bid)
+    deal = closing_deal(sim, ticket)
+    assert deal['reason'] == 'sl'
+    assert deal['price'] == fill  # min(bid, sl)
+    assert sim.balance == pytest.approx(10000.0 + (fill - 2000.2) * 100)
+
+
+@pytest.mark.parametrize("ask, fill", [(2005.0, 2005.0), (2010.0, 2010.0)])
+def test_sell_sl_fills_at_sl_or_worse_on_gap(ask, fill):
+    sim = make_broker()
+    ticket = send(sim, 'sell', sl=2005.0).order
+
+    tick(sim, ask - 0.2)
+    deal = closing_deal(sim, ticket)
+    assert deal['reason'] == 'sl'
+    assert deal['price'] == fill  # max(ask, sl)
+    assert sim.balance == pytest.approx(10000.0 + (2000.0 - fill) * 100)
+
+
+def test_order_rejected_with_no_money_when_margin_insufficient():
+    sim = make_broker(balance=1000.0)  # 1 lot ต้องใช้ margin 2000.2
+
+    result = send(sim, 'buy', volume=1.0)
+    assert result.retcode == sim.TRADE_RETCODE_NO_MONEY
+    assert not sim.positions
+    assert not sim.deals
+
+    assert send(sim, 'buy', volume=0.4).retcode == sim.TRADE_RETCODE_DONE  # margin 800.08
+    result = send(sim, 'buy', volume=0.2)  # ต้องใช้ 400.04 แต่ margin_free เหลือ ~200
+    assert result.retcode == sim.TRADE_RETCODE_NO_MONEY
+    assert len(sim.positions) == 1
+
+
+def test_stop_out_closes_worst_losers_until_margin_level_recovers():
+    sim = make_broker()
+    first = send(sim, 'buy').order   # เปิดที่ 2000.2
+    tick(sim, 2005.0)
+    second = send(sim, 'buy').order  # เปิดที่ 2005.2
+    tick(sim, 2010.0)
+    third = send(sim, 'buy').order   # เปิดที่ 2010.2
+
+    tick(sim, 1990.0)  # margin level ~90% ยังไม่ถึง stop out
+    assert not sim.stopped_out
+    assert len(sim.positions) == 3
+
+    # equity = 10000 - 8460 = 1540: level 25.6% → ปิด third (38.4%) → ปิด second (77%) → หยุด
+    tick(sim, 1977.0)
+    assert sim.stopped_out
+    closed = [d['position'] for d in sim.deals if d['reason'] == 'so']
+    assert closed == [third, second]
+    assert list(sim.positions) == [first]
+    assert all(d['price'] == 1977.0 for d in sim.deals if d['reason'] == 'so')
+    assert sim.account_info().margin_level >= sim.stop_out_level
@@ -0,0 +1,115 @@
+# test_survivability.py
+# เทียบผล calculate_survivability (ผลรวมสะสม O(1) ต่อ level) กับ loop เดิมที่รวม positions ใหม่ทุกรอบ
+
+import pytest
+from config import config
+from auto_config_manager import auto_config_manager
+
+config.persist = False
+
+
+def survivability_reference(balance: float, price: float, leverage: int, settings: dict) -> dict:
+    """loop เดิม: เก็บ list ของ Grid/HG positions และรวม drawdown ใหม่ทุก level"""
+    grid_distance = settings.get("buy_grid_distance", 50)
+    grid_lot = config.grid.buy_lot_size
+    hg_distance = settings.get("buy_hg_distance", 200)
+    hg_initial_lot = config.hg.buy_hg_initial_lot
+    hg_multiplier = config.hg.buy_hg_multiplier
+
+    margin_per_lot = (1.0 * 100 * price) / leverage
+    pip_value_per_lot = 10.0
+    safe_margin_level = 1.5
+
+    total_margin = 0.0
+    total_drawdown = 0.0
+    grid_positions = []
+    hg_positions = []
+    current_distance = 0
+    hg_count = 0
+    equity = balance
+    margin_level = 999
+
+    for _ in range(10000):
+        current_distance += grid_distance
+        grid_positions.append(grid_lot)
+        total_margin += margin_per_lot * grid_lot
+
+        if current_distance % hg_distance == 0 and hg_count < config.hg.buy_max_hg_levels:
+            hg_lot = max(sum(grid_positions) * hg_multiplier, hg_initial_lot)
+            hg_positions.append(hg_lot)
+            total_margin += margin_per_lot * hg_lot
+            hg_count += 1
+
+        total_drawdown = 0.0
+        for lot in grid_positions:
+            total_drawdown += current_distance * lot * pip_value_per_lot
+        for lot in hg_positions:
+            total_drawdown -= current_distance * lot * pip_value_per_lot
+
+        equity = balance - total_drawdown
+        margin_level = equity / total_margin if total_margin > 0 else 999
+        if margin_level < safe_margin_level or equity <= 0 or current_distance > 10000:
+            break
+
+    if margin_level < safe_margin_level:
+        status = "AT_LIMIT"
+    elif equity <= 0:
+        status = "MARGIN_CALL"
+    else:
+        status = "SAFE"
+
+    return {
+        "max_distance_pips": current_distance - grid_distance,
+        "max_grid_levels": len(grid_positions) - 1,
+        "max_hg_levels": hg_count,
+        "max_margin": total_margin,
+        "max_drawdown": total_drawdown,
+        "final_margin_level": margin_level,
+        "final_equity": equity,
+        "status": status,
+    }
+
+
+@pytest.fixture
+def hg_settings():
+    """คืนค่า lot/HG ใน config หลังจบ test"""
+    saved = (config.grid.buy_lot_size, config.hg.buy_hg_initial_lot,
+             config.hg.buy_hg_multiplier, config.hg.buy_max_hg_levels)
+    yield
+    (config.grid.buy_lot_size, config.hg.buy_hg_initial_lot,
+     config.hg.buy_hg_multiplier, config.hg.buy_max_hg_levels) = saved
+
+
+@pytest.mark.parametrize("balance", [100.0, 1000.0, 10000.0, 250000.0])
+@pytest.mark.parametrize("leverage", [100, 500, 2000])
+@pytest.mark.parametrize("grid_distance,hg_distance", [(50, 200), (30, 150), (100, 500), (70, 210)])
+@pytest.mark.parametrize("lot,multiplier,max_hg", [(0.01, 1.2, 10), (0.05, 0.8, 3), (0.1, 2.0, 0)])
+def test_matches_reference_loop(hg_settings, balance, leverage, grid_distance, hg_distance,
+                                lot, multiplier, max_hg):
+    config.grid.buy_lot_size = lot
+    config.hg.buy_hg_initial_lot = lot
+    config.hg.buy_hg_multiplier = multiplier
+    config.hg.buy_max_hg_levels = max_hg
+    settings = {"buy_grid_distance": grid_distance, "buy_hg_distance": hg_distance}
+
+    expected = survivability_reference(balance, 2650.0, leverage, settings)
+    result = auto_config_manager.calculate_survivability(balance, 2650.0, leverage, settings)
+
+    for key in ("max_distance_pips", "max_grid_levels", "max_hg_levels", "status"):
+        assert result[key] == expected[key], key
+    for key in ("max_margin", "max_drawdown", "final_margin_level", "final_equity"):
+        assert result[key] == pytest.approx(expected[key], rel=1e-9, abs=1e-6), key
+
+
+def test_safe_when_distance_cap_reached(hg_settings):
+    """บัญชีใหญ่มากจะหยุดที่ 10000 pips โดยไม่ถึง margin limit"""
+    config.grid.buy_lot_size = 0.01
+    config.hg.buy_max_hg_levels = 10
+    settings = {"buy_grid_distance": 50, "buy_hg_distance": 200}
+
+    result = auto_config_manager.calculate_survivability(1e9, 2650.0, 500, settings)
+
+    expected = survivability_reference(1e9, 2650.0, 500, settings)
+    assert result["status"] == expected["status"] == "SAFE"
+    assert result["max_distance_pips"] == expected["max_distance_pips"] == 10000
+    assert result["max_drawdown"] == pytest.approx(expected["max_drawdown"])
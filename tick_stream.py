@@ -0,0 +1,133 @@
+# tick_stream.py
+# Tick stream แบบ push: poll symbol_info_tick ตามรอบที่ปรับเอง แล้วปลุก monitoring loop เฉพาะเมื่อราคาขยับพอ
+
+from typing import Dict, Optional
+import logging
+import threading
+from broker_backend import broker as mt5
+from mt5_connection import mt5_connection
+from config import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POLL_BACKOFF = 1.5  # ตัวคูณรอบ poll เมื่อราคานิ่ง (min_interval → max_interval)
+
+
+class TickStream:
+    """
+    Poll ราคาบน thread แยก แล้วส่งต่อ (push) ให้ monitoring loop ผ่าน wait()
+    - ราคาเปลี่ยน → poll ถี่ (min_interval); ราคานิ่ง → ค่อยๆ ห่างออกไปจนถึง max_interval
+    - coalesce: เก็บเฉพาะ tick ล่าสุด ปลุกผู้รอเมื่อ bid/ask ห่างจาก tick ที่ปลุกครั้งก่อน >= threshold
+    - wait() คืนค่าเองเมื่อครบ heartbeat แม้ราคาไม่ขยับ (งานที่ขึ้นกับเวลา เช่น report status)
+    """
+
+    def __init__(self):
+        self.threshold = 0.0
+        self.min_interval = 0.05
+        self.max_interval = 0.5
+        self.heartbeat = 2.0
+        self.latest = None  # tick ล่าสุดที่ poll ได้
+        self.pending = None  # tick ที่ข้าม threshold แต่ผู้รอยังไม่ได้รับ
+        self.stats: Dict[str, int] = {'polls': 0, 'wakeups': 0, 'coalesced': 0}
+        self._reference = None  # (bid, ask) ของ tick ที่ปลุกครั้งล่าสุด
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._stop_event.set()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    def start(self):
+        """เริ่ม poll (อ่านค่า threshold / รอบ poll จาก config ทุกครั้งที่เริ่ม)"""
+        if self.running:
+            return
+        self.threshold = config.pips_to_price(config.mt5.tick_threshold_pips)
+        self.min_interval = config.mt5.tick_poll_min
+        self.max_interval = max(config.mt5.tick_poll_max, self.min_interval)
+        self.heartbeat = config.mt5.tick_heartbeat
+        with self._condition:
+            self.latest = None
+            self.pending = None
+            self._reference = None
+            self.stats = {'polls': 0, 'wakeups': 0, 'coalesced': 0}
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='tick-stream', daemon=True)
+        self._thread.start()
+        logger.info(f"Tick stream started (threshold {config.mt5.tick_threshold_pips} pips, "
+                    f"poll {self.min_interval}-{self.max_interval}s)")
+
+    def stop(self):
+        """หยุด poll และปลุกผู้ที่รออยู่ใน wait()"""
+        if not self.running:
+            return
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+        logger.info(f"Tick stream stopped - polls: {self.stats['polls']}, wakeups: {self.stats['wakeups']}, "
+                    f"coalesced: {self.stats['coalesced']}")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        รอจนราคาขยับเกิน threshold, ครบ timeout (default = heartbeat) หรือ stream ถูกหยุด
+
+        Args:
+            timeout: เวลารอสูงสุด (วินาที)
+
+        Returns:
+            True ถ้าถูกปลุกด้วยราคาที่ขยับ, False ถ้าหมดเวลาหรือ stream หยุด
+        """
+        if timeout is None:
+            timeout = self.heartbeat
+        with self._condition:
+            if self.pending is None and self.running:
+                self._condition.wait(timeout)
+            woke = self.pending is not None
+            self.pending = None
+            return woke
+
+    def _poll(self):
+        """ดึง tick หนึ่งครั้ง คืน True ถ้า bid/ask เปลี่ยนจาก tick ก่อนหน้า"""
+        if not mt5_connection.connected:
+            return False
+        tick = mt5.symbol_info_tick(mt5_connection.symbol)
+        if tick is None or tick.bid == 0.0 or tick.ask == 0.0:
+            return False
+        with self._condition:
+            self.stats['polls'] += 1
+            previous = self.latest
+            self.latest = tick
+            changed = previous is None or tick.bid != previous.bid or tick.ask != previous.ask
+            reference = self._reference
+            if reference is None or abs(tick.bid - reference[0]) >= self.threshold \
+                    or abs(tick.ask - reference[1]) >= self.threshold:
+                if self.pending is not None:
+                    self.stats['coalesced'] += 1
+                else:
+                    self.stats['wakeups'] += 1
+                self.pending = tick
+                self._reference = (tick.bid, tick.ask)
+                self._condition.notify_all()
+        return changed
+
+    def _run(self):
+        interval = self.min_interval
+        while not self._stop_event.is_set():
+            try:
+                if self._poll():
+                    interval = self.min_interval
+                else:
+                    interval = min(interval * POLL_BACKOFF, self.max_interval)
+            except Exception as e:
+                logger.error(f"Error polling tick: {e}")
+                interval = self.max_interval
+            self._stop_event.wait(interval)
+
+
+# สร้าง instance หลักสำหรับใช้งาน
+tick_stream = TickStream()